@@ -0,0 +1,242 @@
+import time
+
+import numpy as np
+
+from acquisition.devices import MANUS_SR, MYO_IMU_SR
+from acquisition.resampling import SampleGrid, resample_streams
+from constants import MYO_SR
+
+
+def nearest_indices(reference_ts, target_ts):
+    """
+    For every timestamp in reference_ts find the index of the closest timestamp in target_ts.
+    Runs in O(N log M) using a binary search over the (sorted) target timestamps.
+    On ties the earlier sample wins, which matches the behaviour of min() over the raw stream.
+    :param reference_ts: 1D array of N timestamps (e.g. EMG)
+    :param target_ts: 1D array of M timestamps (e.g. IMU or MANUS), M > 0
+    :return: (indices into target_ts of shape (N,), absolute time differences of shape (N,))
+    """
+    reference_ts = np.asarray(reference_ts, dtype=np.float64)
+    target_ts = np.asarray(target_ts, dtype=np.float64)
+
+    # Samples arrive in order, but be defensive about the odd out-of-order packet
+    order = None
+    if target_ts.size > 1 and np.any(np.diff(target_ts) < 0):
+        order = np.argsort(target_ts, kind="stable")
+        target_ts = target_ts[order]
+
+    # Index of the first target timestamp >= reference timestamp
+    right = np.searchsorted(target_ts, reference_ts, side="left")
+    right = np.clip(right, 0, target_ts.size - 1)
+    left = np.clip(right - 1, 0, target_ts.size - 1)
+
+    diff_left = np.abs(reference_ts - target_ts[left])
+    diff_right = np.abs(target_ts[right] - reference_ts)
+
+    # Prefer the left neighbour when both are equally close
+    use_right = diff_right < diff_left
+    indices = np.where(use_right, right, left)
+    time_diffs = np.where(use_right, diff_right, diff_left)
+
+    if order is not None:
+        indices = order[indices]
+
+    return indices, time_diffs
+
+
+def align_streams(master_data, other_data):
+    """
+    Pair every sample of the master stream with the sample closest in time of each other stream.
+    Each stream is laid out like the acquisition queues: one row per sample with the timestamp in the last column.
+    :param master_data: array of shape (N, C + 1), the stream that defines the rows (EMG)
+    :param other_data: list of arrays of shape (M_i, C_i + 1), none of them empty
+    :return: (recording of shape (N, C + sum(C_i)), list of absolute time differences of shape (N,) per other stream)
+    """
+    master_ts = master_data[:, -1]
+    columns = [master_data[:, :-1]]
+    time_diffs = []
+    for rows in other_data:
+        indices, diffs = nearest_indices(master_ts, rows[:, -1])
+        columns.append(rows[indices, :-1])
+        time_diffs.append(diffs)
+
+    return np.concatenate(columns, axis=1), time_diffs
+
+
+def align_recording(emg_data, imu_data, manus_data):
+    """
+    Pair every EMG sample with the IMU and MANUS samples closest in time.
+    Each stream is laid out like the acquisition queues: one row per sample with the timestamp in the last column.
+    :param emg_data: array-like of shape (N, 8 + 1)
+    :param imu_data: array-like of shape (M, 10 + 1)
+    :param manus_data: array-like of shape (K, 24 + 1)
+    :return: (recording of shape (N, 42), time_diffs_myo_imu of shape (N,), time_diffs_myo_manus of shape (N,))
+    """
+    emg_data = np.asarray(emg_data, dtype=np.float64)
+    imu_data = np.asarray(imu_data, dtype=np.float64)
+    manus_data = np.asarray(manus_data, dtype=np.float64)
+
+    # Nothing to align if any of the streams is missing
+    if emg_data.size == 0 or imu_data.size == 0 or manus_data.size == 0:
+        return np.empty((0, 42)), np.empty(0), np.empty(0)
+
+    recording, (time_diffs_myo_imu, time_diffs_myo_manus) = align_streams(emg_data, [imu_data, manus_data])
+    return recording, time_diffs_myo_imu, time_diffs_myo_manus
+
+
+class StreamAligner(object):
+    """
+    Incremental alignment for streams that arrive in chunks while recording.
+    A master (EMG) sample is only emitted once all other streams have a sample at or after its timestamp,
+    from then on its nearest neighbours can't change anymore. Only the tail of each stream that
+    can still be matched is kept, so memory stays bounded however long the take is.
+    Optionally the master is put onto its exact MYO_SR grid (see SampleGrid) and the other streams are
+    interpolated at the grid times instead of snapped - the kept tails always bracket the next master sample,
+    so the interpolation itself is the same as over the whole take. The grid is fitted causally though,
+    so it can differ slightly from one fitted to the whole take.
+    """
+
+    def __init__(self, n_streams=3, quaternions=None):
+        """
+        :param n_streams: number of streams including the master, e.g. EMG, IMU and MANUS
+        :param quaternions: per other stream the column slices holding quaternions. If given, the streams
+            are resampled (linear, SLERP for quaternions) rather than aligned by nearest neighbour
+        """
+        self._streams = [None] * n_streams
+        self._quaternions = quaternions
+        # Grid of the master stream, fitted to its host timestamps as they arrive
+        self.grid = None if quaternions is None else SampleGrid()
+
+    def feed(self, *streams):
+        """
+        Add new samples (queue layout, timestamp last) and align everything that can be finalised.
+        :param streams: one array of rows per stream, master first - empty or None if nothing arrived
+        :return: (recording rows, time differences to the 1st other stream, to the 2nd, ...)
+            for the newly finalised master samples
+        """
+        streams = list(streams)
+        if self.grid is not None and streams[0] is not None and len(streams[0]) > 0:
+            # The grid holds back the newest samples until it knows whether a gap came before them
+            streams[0] = self.grid.place(streams[0])
+
+        for i, rows in enumerate(streams):
+            self._streams[i] = _append_rows(self._streams[i], rows)
+        return self._emit(final=False)
+
+    def flush(self):
+        """
+        Align all remaining master samples against whatever data the other streams have.
+        """
+        if self.grid is not None:
+            self._streams[0] = _append_rows(self._streams[0], self.grid.flush())
+        return self._emit(final=True)
+
+    def _emit(self, final):
+        master, others = self._streams[0], self._streams[1:]
+        nothing = (np.empty((0, 0)),) + tuple(np.empty(0) for _ in others)
+
+        if any(rows is None or len(rows) == 0 for rows in self._streams):
+            if final and master is not None:
+                self._streams[0] = master[:0]
+            return nothing
+
+        if final:
+            n = len(master)
+        else:
+            # Everything up to the latest timestamp all other streams have reached is final
+            limit = min(rows[-1, -1] for rows in others)
+            n = int(np.searchsorted(master[:, -1], limit, side="right"))
+        if n == 0:
+            return nothing
+
+        ready = master[:n]
+        if self._quaternions is None:
+            recording, time_diffs = align_streams(ready, others)
+        else:
+            recording, time_diffs = resample_streams(ready, others, self._quaternions)
+
+        # Keep the master samples that still wait for data, and for the other streams the last sample at or
+        # before the newest emitted master timestamp onwards - earlier ones can't be the closest anymore
+        last_ts = ready[-1, -1]
+        self._streams = [master[n:]] + [_trim_before(rows, last_ts) for rows in others]
+
+        return (recording,) + tuple(time_diffs)
+
+
+def _append_rows(rows, new_rows):
+    if new_rows is None or len(new_rows) == 0:
+        return rows
+    new_rows = np.asarray(new_rows, dtype=np.float64)
+    if rows is None:
+        return new_rows
+    return np.concatenate((rows, new_rows))
+
+
+def _trim_before(rows, timestamp):
+    keep_from = int(np.searchsorted(rows[:, -1], timestamp, side="right")) - 1
+    return rows[max(keep_from, 0) :]
+
+
+def _align_recording_legacy(emg_data, imu_data, manus_data):
+    """
+    The original list-based alignment loop, kept as a reference for the benchmark.
+    """
+    recording = []
+    time_diffs_myo_imu = []
+    time_diffs_myo_manus = []
+    for emg in emg_data:
+        timestamp = emg[-1]
+
+        closest_imu = min(imu_data, key=lambda x: abs(x[-1] - timestamp))
+        time_diffs_myo_imu.append(abs(closest_imu[-1] - timestamp))
+
+        closest_manus = min(manus_data, key=lambda x: abs(x[-1] - timestamp))
+        time_diffs_myo_manus.append(abs(closest_manus[-1] - timestamp))
+
+        recording.append(emg[:-1] + closest_imu[:-1] + closest_manus[:-1])
+
+    return recording, time_diffs_myo_imu, time_diffs_myo_manus
+
+
+def _synthesise_stream(n_channels, sr, seconds, start_ms, rng):
+    """
+    Create a stream in queue layout (list of lists, timestamp last) with a little arrival jitter.
+    """
+    n = int(sr * seconds)
+    timestamps = start_ms + np.arange(n) * (1000 / sr) + rng.uniform(0, 2, n)
+    values = rng.normal(size=(n, n_channels))
+    return np.column_stack((values, timestamps)).tolist()
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    # The legacy loop is quadratic, so for long takes time a prefix and extrapolate (cost is linear in N for fixed M)
+    LEGACY_MAX_ROWS = 1000
+
+    for seconds in [10, 20, 60]:
+        start_ms = time.time() * 1000
+        emg = _synthesise_stream(8, MYO_SR, seconds, start_ms, rng)
+        imu = _synthesise_stream(10, MYO_IMU_SR, seconds, start_ms, rng)
+        manus = _synthesise_stream(24, MANUS_SR, seconds, start_ms, rng)
+
+        timer = time.perf_counter()
+        recording, diffs_imu, diffs_manus = align_recording(emg, imu, manus)
+        t_fast = time.perf_counter() - timer
+
+        legacy_rows = min(len(emg), LEGACY_MAX_ROWS)
+        timer = time.perf_counter()
+        legacy, legacy_diffs_imu, legacy_diffs_manus = _align_recording_legacy(emg[:legacy_rows], imu, manus)
+        t_legacy = (time.perf_counter() - timer) * len(emg) / legacy_rows
+
+        # Both implementations must agree
+        assert np.allclose(recording[:legacy_rows], np.array(legacy))
+        assert np.allclose(diffs_imu[:legacy_rows], legacy_diffs_imu)
+        assert np.allclose(diffs_manus[:legacy_rows], legacy_diffs_manus)
+
+        extrapolated = " (extrapolated)" if legacy_rows < len(emg) else ""
+        print(
+            f"{seconds:>3} s take ({len(emg)} EMG, {len(imu)} IMU, {len(manus)} MANUS): "
+            f"legacy {t_legacy * 1000:.1f} ms{extrapolated}, "
+            f"searchsorted {t_fast * 1000:.2f} ms, "
+            f"speedup {t_legacy / t_fast:.0f}x"
+        )
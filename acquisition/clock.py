@@ -0,0 +1,156 @@
+import time
+
+import numpy as np
+
+# Number of (device, host) timestamp pairs the offset/drift estimate is fitted on (~20 s of MANUS batches)
+OFFSET_WINDOW = 2000
+# Below this many pairs only the offset is estimated, the drift is assumed to be zero
+MIN_DRIFT_POINTS = 20
+
+
+class SessionClock(object):
+    """
+    Common time base for all streams of a session: milliseconds since the clock was created.
+    Backed by time.perf_counter_ns(), which is monotonic, high resolution and shared by all processes
+    on the machine (QueryPerformanceCounter on Windows, CLOCK_MONOTONIC on Linux, mach_absolute_time on macOS).
+    time.monotonic_ns() would also be shared, but only ticks every ~15 ms on Windows.
+    The clock is passed to the workers together with the streams, so every process stamps in the same base.
+    """
+
+    def __init__(self):
+        self.origin_ns = time.perf_counter_ns()
+        # Wall clock at the origin, to convert session times back to dates
+        self.origin_epoch_ms = time.time() * 1000
+
+    def now_ms(self):
+        return (time.perf_counter_ns() - self.origin_ns) / 1e6
+
+    def to_epoch_ms(self, session_ms):
+        return self.origin_epoch_ms + session_ms
+
+
+class ClockOffsetEstimator(object):
+    """
+    Continuously estimates the mapping from a device clock (e.g. the MANUS sender timestamps) to the session clock
+    with a linear regression host = slope * device + offset over a sliding window of observations.
+    The slope captures the drift between the two clocks, the offset includes the mean transport delay.
+    """
+
+    def __init__(self, window=OFFSET_WINDOW):
+        self.window = window
+        self._device = np.zeros(window, dtype=np.float64)
+        self._host = np.zeros(window, dtype=np.float64)
+        self._count = 0
+
+        # Device timestamps are epoch based and large, fit relative to the first one to keep precision
+        self._device_ref = None
+
+        self.slope = 1.0
+        self.offset = 0.0
+        # Standard deviation of the fit residuals, i.e. the timing jitter left after correction
+        self.residual_ms = 0.0
+
+    def update(self, device_ts, host_ms):
+        """
+        Add an observation: a device timestamp and the session time it arrived at, then refit.
+        Only use the freshest sample of a batch, older ones have been sitting in a buffer.
+        """
+        if self._device_ref is None:
+            self._device_ref = float(device_ts)
+
+        slot = self._count % self.window
+        self._device[slot] = float(device_ts) - self._device_ref
+        self._host[slot] = host_ms
+        self._count += 1
+
+        self._fit()
+
+    def _fit(self):
+        n = min(self._count, self.window)
+        device = self._device[:n]
+        host = self._host[:n]
+
+        device_mean = device.mean()
+        host_mean = host.mean()
+        device_var = np.sum((device - device_mean) ** 2)
+
+        if n >= MIN_DRIFT_POINTS and device_var > 0:
+            self.slope = np.sum((device - device_mean) * (host - host_mean)) / device_var
+        else:
+            self.slope = 1.0
+        self.offset = host_mean - self.slope * device_mean
+        self.residual_ms = float(np.std(host - (self.slope * device + self.offset)))
+
+    @property
+    def is_ready(self):
+        return self._count > 0
+
+    @property
+    def drift_ppm(self):
+        """
+        Drift of the device clock relative to the session clock, assuming device timestamps in milliseconds.
+        """
+        return (self.slope - 1.0) * 1e6
+
+    def to_host(self, device_ts):
+        """
+        Map device timestamps (scalar or array) to session milliseconds.
+        """
+        return self.slope * (np.asarray(device_ts, dtype=np.float64) - self._device_ref) + self.offset
+
+
+class LatencyStats(object):
+    """
+    Collects per-sample latencies in milliseconds and summarises them, e.g. arrival to inference.
+    """
+
+    def __init__(self, window=None):
+        """
+        :param window: keep only the latest this many latencies for the percentiles, for stats that run as long as
+            the app does. The count, mean and maximum always cover all of them. None keeps all
+        """
+        self.window = window
+        self._chunks = []
+        self._kept = 0
+        self._count = 0
+        self._sum = 0.0
+        self._max = -np.inf
+
+    def extend(self, latencies_ms):
+        latencies_ms = np.asarray(latencies_ms, dtype=np.float64).ravel()
+        if len(latencies_ms) == 0:
+            return
+        self._chunks.append(latencies_ms)
+        self._kept += len(latencies_ms)
+        self._count += len(latencies_ms)
+        self._sum += float(latencies_ms.sum())
+        self._max = max(self._max, float(latencies_ms.max()))
+        # Trim once twice the window piled up, so trimming stays rare
+        if self.window is not None and self._kept > 2 * self.window:
+            self._chunks = [np.concatenate(self._chunks)[-self.window :]]
+            self._kept = self.window
+
+    def summary(self):
+        """
+        :return: dict with the number of samples and the mean, median, 99th percentile and maximum latency
+        """
+        if not self._chunks:
+            return {"samples": 0}
+        latencies = np.concatenate(self._chunks)
+        self._chunks = [latencies]
+        return {
+            "samples": self._count,
+            "mean_ms": self._sum / self._count,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "max_ms": self._max,
+        }
+
+    def __str__(self):
+        summary = self.summary()
+        if summary["samples"] == 0:
+            return "no samples"
+        return (
+            f"{summary['samples']} samples, mean {summary['mean_ms']:.2f} ms, p50 {summary['p50_ms']:.2f} ms, "
+            f"p99 {summary['p99_ms']:.2f} ms, max {summary['max_ms']:.2f} ms"
+        )
@@ -0,0 +1,123 @@
+import json
+
+import numpy as np
+
+from config import DEVICE_MANIFEST_PATH
+from constants import MYO_SR, header_fingers, header_hand_rotation, header_imu
+
+# One record per sample, per stream. Every stream carries its session clock timestamp (ms) in the last field.
+# EMG values are signed bytes in the FILTERED and RAW Myo modes
+EMG_DTYPE = np.dtype([("emg", np.int8, (8,)), ("timestamp", np.float64)])
+# Quaternion (w, x, y, z), accelerometer (x, y, z), gyroscope (x, y, z)
+IMU_DTYPE = np.dtype([("imu", np.float32, (10,)), ("timestamp", np.float64)])
+# 20 finger joints and wrist quaternion (x, y, z, w) as in the MANUS packet, plus the raw sender timestamp
+# and the sender timestamp mapped onto the session clock
+MANUS_DTYPE = np.dtype(
+    [
+        ("fingers", "<f4", (20,)),
+        ("wrist_quat", "<f4", (4,)),
+        ("device_timestamp", "<i8"),
+        ("timestamp", "<f8"),
+    ]
+)
+
+# Nominal stream rates, used to size the rings
+MYO_IMU_SR = 50
+MANUS_SR = 120
+
+# Streams each device type produces, in recording column order:
+# (stream kind, record dtype, nominal rate in Hz, recording column names)
+DEVICE_STREAMS = {
+    "myo": [
+        ("emg", EMG_DTYPE, MYO_SR, [f"emg_{i}" for i in range(8)]),
+        ("imu", IMU_DTYPE, MYO_IMU_SR, header_imu),
+    ],
+    "manus": [
+        ("manus", MANUS_DTYPE, MANUS_SR, header_fingers + header_hand_rotation),
+    ],
+}
+
+# One Myo and one MANUS glove, this reproduces constants.DATA_CSV_HEADER_STR.
+# Optional keys per device:
+# - myo: "tty" (serial port of the dongle), "address" (MAC of the armband to connect to)
+# - manus: "endpoint" (ZMQ address the SDK client pushes to)
+# - any: "simulated" (true to use the synthetic device of myo/simulator.py or manus/simulator.py instead of hardware),
+#   "speed" (real-time factor of a simulated device)
+DEFAULT_MANIFEST = [
+    {"type": "myo", "name": "myo"},
+    {"type": "manus", "name": "manus"},
+]
+
+
+def load_manifest(path=None):
+    """
+    Load the device manifest, a JSON list of devices like DEFAULT_MANIFEST.
+    :param path: manifest file, defaults to the DEVICE_MANIFEST setting, DEFAULT_MANIFEST if that isn't set either
+    """
+    path = DEVICE_MANIFEST_PATH if path is None else path
+    if path is None:
+        return DEFAULT_MANIFEST
+
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    validate_manifest(manifest)
+    return manifest
+
+
+def validate_manifest(manifest):
+    names = [device["name"] for device in manifest]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Device names in the manifest must be unique, got {names}")
+    for device in manifest:
+        if device["type"] not in DEVICE_STREAMS:
+            raise ValueError(f"Unknown device type {device['type']}, expected one of {list(DEVICE_STREAMS)}")
+    # All streams are aligned onto the EMG of the first device
+    if not manifest or manifest[0]["type"] != "myo":
+        raise ValueError("The first device in the manifest must be a Myo, its EMG is the master clock")
+
+
+def stream_name(device, kind):
+    """
+    Name of one of a device's streams. The device named like its type keeps the plain names
+    (emg, imu, manus), any other device gets its name as a prefix, e.g. myo_left_emg.
+    """
+    if device["name"] == device["type"]:
+        return kind
+    return f"{device['name']}_{kind}"
+
+
+def manifest_streams(manifest):
+    """
+    All streams of a manifest in recording column order, the EMG master first.
+    :return: list of (stream name, record dtype, nominal rate, column names)
+    """
+    streams = []
+    for device in manifest:
+        for kind, dtype, rate, columns in DEVICE_STREAMS[device["type"]]:
+            prefix = stream_name(device, kind)[: -len(kind)]
+            streams.append((stream_name(device, kind), dtype, rate, [prefix + column for column in columns]))
+    return streams
+
+
+def manifest_header(manifest):
+    """
+    CSV header of a recording with the devices of the manifest.
+    """
+    return ",".join(column for _, _, _, columns in manifest_streams(manifest) for column in columns)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from constants import DATA_CSV_HEADER_STR
+
+    # The default manifest must keep the established recording layout
+    assert manifest_header(DEFAULT_MANIFEST) == DATA_CSV_HEADER_STR
+
+    # Print the channel layout of a manifest file, e.g. python -m acquisition.devices two_arms.json
+    manifest = load_manifest(sys.argv[1] if len(sys.argv) > 1 else None)
+    column = 0
+    for name, dtype, rate, columns in manifest_streams(manifest):
+        print(f"{name:<20} {rate:>4} Hz  columns {column}:{column + len(columns)}")
+        column += len(columns)
+    print(f"{column} columns per row")
@@ -0,0 +1,181 @@
+import multiprocessing
+import queue
+import sys
+import tempfile
+import time
+
+from acquisition.devices import manifest_streams
+from acquisition.ring_buffer import StreamBus
+from acquisition.supervisor import WorkerSupervisor
+from constants import MYO_SR
+from inference.worker_inference import worker_myo_receiver
+from myo.data_collection import AcquisitionDaemon
+from myo.worker_myo import worker_myo
+
+# How often the harness samples rates and queue depths, in seconds
+SAMPLE_INTERVAL = 0.1
+# How long the simulated devices may take to come up, and the recorder to write a take
+READY_TIMEOUT = 10
+RESULT_TIMEOUT = 10
+
+
+def simulated_manifest(speed):
+    """
+    The default session (one Myo, one MANUS glove) with both devices simulated at the given real-time factor.
+    """
+    return [
+        {"type": "myo", "name": "myo", "simulated": True, "speed": speed},
+        {"type": "manus", "name": "manus", "simulated": True, "speed": speed},
+    ]
+
+
+class StreamMonitor(object):
+    """
+    Samples the shared counters of every ring of a bus while a test runs.
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.start_ms = bus.clock.now_ms()
+        self.start_received = {name: ring.received for name, ring in bus.streams().items()}
+        self.start_dropped = {name: ring.dropped for name, ring in bus.streams().items()}
+        self.start_read = {name: ring.read_index for name, ring in bus.streams().items()}
+        self.max_depth = {name: 0 for name in bus.streams()}
+
+    def sample(self):
+        for name, ring in self.bus.streams().items():
+            self.max_depth[name] = max(self.max_depth[name], ring.available())
+
+    def report(self, speed):
+        """
+        :return: per stream, achieved rate in device Hz, consumed rate, maximum queue depth and dropped samples
+        """
+        seconds = (self.bus.clock.now_ms() - self.start_ms) / 1000
+        nominal = {name: rate for name, _, rate, _ in manifest_streams(self.bus.manifest)}
+        report = {}
+        for name, ring in self.bus.streams().items():
+            report[name] = {
+                "nominal_hz": nominal[name],
+                # Rates divided by the speed, so that a pipeline keeping up reports the nominal rate at any speed
+                "received_hz": (ring.received - self.start_received[name]) / seconds / speed,
+                "consumed_hz": (ring.read_index - self.start_read[name]) / seconds / speed,
+                "max_depth": self.max_depth[name],
+                "dropped": ring.dropped - self.start_dropped[name],
+            }
+        return report
+
+
+def load_test_recorder(speed, seconds, folder):
+    """
+    Record one take of simulated data through the real acquisition daemon and recorder.
+    :param speed: real-time factor of the simulated devices
+    :param seconds: length of the take in device seconds
+    :param folder: where the take is written
+    :return: dict with the stream report, the rows recorded and expected and the alignment error per stream
+    """
+    daemon = AcquisitionDaemon(simulated_manifest(speed))
+    daemon.start()
+    try:
+        deadline = time.perf_counter() + READY_TIMEOUT
+        while not daemon.is_ready():
+            if daemon.check_error() is not None:
+                return {"error": daemon.check_error()}
+            if time.perf_counter() > deadline:
+                return {"error": "Simulated devices didn't come up"}
+            time.sleep(SAMPLE_INTERVAL)
+
+        monitor = StreamMonitor(daemon.bus)
+        # Resampling puts EMG on a grid of MYO_SR in host time, which only holds in real time.
+        # Nearest-neighbour alignment doesn't assume a rate
+        daemon.arm(folder, "medium", resample=speed == 1)
+        while daemon.seconds_since_arm() * speed < seconds:
+            if daemon.check_error() is not None:
+                return {"error": daemon.check_error()}
+            monitor.sample()
+            time.sleep(SAMPLE_INTERVAL)
+        daemon.disarm()
+
+        deadline = time.perf_counter() + RESULT_TIMEOUT
+        result = daemon.poll_result()
+        while result is None and time.perf_counter() < deadline:
+            monitor.sample()
+            time.sleep(SAMPLE_INTERVAL)
+            result = daemon.poll_result()
+        if result is None:
+            return {"error": "The recorder didn't finish the take"}
+
+        return {
+            "streams": monitor.report(speed),
+            "rows": result["rows"],
+            "expected_rows": int(seconds * MYO_SR),
+            # Session milliseconds are 1/speed device milliseconds
+            "alignment_ms": {name: diff * speed for name, diff in result.get("time_diffs", {}).items()},
+        }
+    finally:
+        daemon.shutdown()
+
+
+def load_test_inference(speed, seconds):
+    """
+    Stream simulated EMG into the live inference worker, as InferenceFromLive does.
+    :return: dict with the stream report, the consumer has to keep up with the EMG rate
+    """
+    device = simulated_manifest(speed)[0]
+    bus = StreamBus(manifest=[device])
+    q_terminate = multiprocessing.Queue()
+    q_ready = multiprocessing.Queue()
+
+    supervisor = WorkerSupervisor(q_terminate, max_restarts=0)
+    supervisor.add("myo", worker_myo, (bus, q_terminate, q_ready, device,))
+    supervisor.add("myo_receiver", worker_myo_receiver, (bus, q_terminate,))
+    supervisor.start()
+    try:
+        try:
+            q_ready.get(timeout=READY_TIMEOUT)
+        except queue.Empty:
+            return {"error": "The simulated Myo didn't come up"}
+        monitor = StreamMonitor(bus)
+        start_ms = bus.clock.now_ms()
+        while (bus.clock.now_ms() - start_ms) / 1000 * speed < seconds:
+            error = supervisor.watch(SAMPLE_INTERVAL)
+            if error is not None:
+                return {"error": error}
+            monitor.sample()
+        return {"streams": monitor.report(speed)}
+    finally:
+        supervisor.shutdown()
+        bus.close()
+        bus.unlink()
+
+
+def print_report(pipeline, speed, report):
+    print(f"{pipeline} at {speed:g}x real time:")
+    if "error" in report:
+        print(f"  failed: {report['error']}")
+        return
+    for name, stream in report["streams"].items():
+        print(
+            f"  {name:>8}: {stream['received_hz']:7.1f} Hz received, {stream['consumed_hz']:7.1f} Hz consumed "
+            f"(nominal {stream['nominal_hz']} Hz), max queue depth {stream['max_depth']}, {stream['dropped']} dropped"
+        )
+    if "rows" in report:
+        print(f"  recorded {report['rows']} of {report['expected_rows']} expected EMG rows")
+        for name, diff in report["alignment_ms"].items():
+            print(f"  mean alignment error emg-{name}: {diff:.2f} ms (device time)")
+
+
+if __name__ == "__main__":
+    # python -m acquisition.load_test [recorder|inference] [SECONDS] [SPEED ...]
+    # e.g. python -m acquisition.load_test recorder 20 1 10 50
+    pipeline = sys.argv[1] if len(sys.argv) > 1 else "recorder"
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    speeds = [float(speed) for speed in sys.argv[3:]] or [1, 10, 50]
+
+    for speed in speeds:
+        if pipeline == "recorder":
+            with tempfile.TemporaryDirectory() as folder:
+                print_report(pipeline, speed, load_test_recorder(speed, seconds, folder))
+        elif pipeline == "inference":
+            print_report(pipeline, speed, load_test_inference(speed, seconds))
+        else:
+            sys.exit(f"Unknown pipeline {pipeline}, expected recorder or inference")
@@ -0,0 +1,78 @@
+import json
+import random
+
+from constants import GESTURES
+
+# The full session: every gesture at every speed, once
+DEFAULT_PROTOCOL = {
+    # List of gesture names or "all" for constants.GESTURES
+    "gestures": "all",
+    "speeds": ["slow", "medium", "fast"],
+    "repetitions": 1,
+    # "sequential" keeps the gesture order, "shuffled" randomises the trials (reproducibly with "seed")
+    "order": "sequential",
+    "seed": 0,
+    # Seconds per take, per-gesture overrides in "recording_lengths"
+    "recording_length": 10,
+    "recording_lengths": {"melody": 20},
+    # Seconds of countdown before and rest after every take
+    "countdown": 3,
+    "rest": 3,
+    # Passed on to AcquisitionDaemon.arm. "resample" interpolates IMU and MANUS onto the EMG grid instead of
+    # snapping them like the published dataset, off unless the operator's script turns it on
+    "pre_roll": 0,
+    "resample": False,
+}
+
+
+def load_protocol(path=None):
+    """
+    Load a protocol script, a JSON object with any of the keys of DEFAULT_PROTOCOL.
+    Missing keys fall back to DEFAULT_PROTOCOL.
+    :param path: JSON file, None for the default protocol
+    """
+    protocol = dict(DEFAULT_PROTOCOL)
+    if path is not None:
+        with open(path, "r") as f:
+            protocol.update(json.load(f))
+
+    gestures = GESTURES if protocol["gestures"] == "all" else protocol["gestures"]
+    unknown = [gesture for gesture in gestures if gesture not in GESTURES]
+    if unknown:
+        raise ValueError(f"Unknown gestures in protocol: {unknown}")
+    protocol["gestures"] = list(gestures)
+
+    if protocol["order"] not in ("sequential", "shuffled"):
+        raise ValueError(f"Unknown protocol order {protocol['order']}, expected sequential or shuffled")
+    return protocol
+
+
+def protocol_trials(protocol):
+    """
+    Expand a protocol into the list of takes to record.
+    :return: list of dicts with gesture, speed, repetition and length (seconds)
+    """
+    trials = [
+        {
+            "gesture": gesture,
+            "speed": speed,
+            "repetition": repetition,
+            "length": protocol["recording_lengths"].get(gesture, protocol["recording_length"]),
+        }
+        for repetition in range(protocol["repetitions"])
+        for gesture in protocol["gestures"]
+        for speed in protocol["speeds"]
+    ]
+
+    if protocol["order"] == "shuffled":
+        random.Random(protocol["seed"]).shuffle(trials)
+    return trials
+
+
+def protocol_duration(protocol):
+    """
+    Lower bound of the time a protocol takes in seconds, XRMI takes last as long as Netz plays.
+    """
+    return sum(
+        protocol["countdown"] + trial["length"] + protocol["rest"] for trial in protocol_trials(protocol)
+    )
@@ -0,0 +1,309 @@
+import datetime
+import os
+import time
+
+import numpy as np
+
+from acquisition.alignment import StreamAligner
+from acquisition.devices import DEFAULT_MANIFEST, manifest_header, manifest_streams
+from acquisition.resampling import quaternion_groups
+from acquisition.segmentation import segment_recording, write_segments
+from acquisition.ring_buffer import records_to_rows
+from acquisition.telemetry import TakeTelemetry
+from dataset.semg import SEMG_SUFFIX, SemgFile
+
+# How often the writer drains the streams and appends to disk
+WRITE_INTERVAL = 0.1
+
+# Seconds of every stream kept in the background, the most a take can reach back (pre-roll)
+PRE_TRIGGER_SECONDS = 2
+
+# How long to wait for samples up to the stop mark to arrive before a take is finalised anyway
+STOP_TIMEOUT = 0.5
+
+# Commands understood by the recorder
+RECORDER_ARM = "arm"
+RECORDER_FINISH = "finish"
+RECORDER_CANCEL = "cancel"
+RECORDER_SHUTDOWN = "shutdown"
+
+
+def recording_filename(speed, index=None):
+    """
+    Unique filename for a new recording of the given speed.
+    :param index: number of the trial when a block is split into several recordings
+    """
+    now = datetime.datetime.now().strftime("%d_%m_%Y_%H_%M_%S")
+    if index is not None:
+        return f"recording_{speed}_{now}_{index}{SEMG_SUFFIX}"
+    return f"recording_{speed}_{now}{SEMG_SUFFIX}"
+
+
+class RecordingFile(object):
+    """
+    A recording that is being written: rows are appended as .semg chunks to a hidden temporary file
+    in the target folder, which is atomically renamed into place on finish.
+    """
+
+    def __init__(self, folder, speed, manifest=DEFAULT_MANIFEST, resampled=False):
+        """
+        :param resampled: the rows hold interpolated rather than snapped IMU and MANUS values, stored in the header
+        """
+        self.folder = folder
+        self.speed = speed
+        os.makedirs(folder, exist_ok=True)
+
+        self.temp_path = os.path.join(folder, f".recording_{speed}.partial")
+        self.file = SemgFile(self.temp_path, manifest, speed=speed, resampled=resampled)
+        self.rows = 0
+
+    def append(self, rows):
+        if len(rows) == 0:
+            return
+        self.file.append(rows)
+        # Make sure what we have survives a crash of the app
+        self.file.flush()
+        self.rows += len(rows)
+
+    def finish(self):
+        """
+        Close the file and move it to its final name.
+        :return: the final path
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+        recording_path = os.path.join(self.folder, recording_filename(self.speed))
+        os.replace(self.temp_path, recording_path)
+        return recording_path
+
+    def discard(self):
+        self.file.close()
+        os.remove(self.temp_path)
+
+
+class BlockFile(object):
+    """
+    A continuous capture of a whole gesture block. Rows are appended as raw float64 to a hidden file
+    (a CSV of an hour would be most of a gigabyte), on finish the block is split into one recording per trial.
+    """
+
+    def __init__(self, folder, speed, manifest=DEFAULT_MANIFEST, resampled=False):
+        self.folder = folder
+        self.speed = speed
+        self.manifest = manifest
+        self.resampled = resampled
+        self.n_columns = len(manifest_header(manifest).split(","))
+        os.makedirs(folder, exist_ok=True)
+
+        self.temp_path = os.path.join(folder, f".block_{speed}.partial")
+        self.file = open(self.temp_path, "wb")
+        self.rows = 0
+
+    def append(self, rows):
+        if len(rows) == 0:
+            return
+        np.asarray(rows, dtype=np.float64).tofile(self.file)
+        self.file.flush()
+        self.rows += len(rows)
+
+    def finish(self):
+        """
+        Segment the block into trials and save each as a recording.
+        :return: list of the paths written
+        """
+        self.file.close()
+
+        block = np.memmap(self.temp_path, dtype=np.float64, mode="r").reshape(-1, self.n_columns)
+        segments = segment_recording(block, self.manifest)
+        # Kept for the telemetry sidecars of the trials
+        self.segments = segments
+        filenames = [recording_filename(self.speed, i) for i in range(len(segments))]
+        paths = write_segments(
+            block, segments, self.folder, filenames, self.manifest, speed=self.speed, resampled=self.resampled
+        )
+
+        # Release the mapping before deleting the file (required on Windows)
+        del block
+        os.remove(self.temp_path)
+        return paths
+
+    def discard(self):
+        self.file.close()
+        os.remove(self.temp_path)
+
+
+class StreamHistory(object):
+    """
+    Bounded pre-trigger buffer: the last PRE_TRIGGER_SECONDS of a stream in queue layout (timestamp last).
+    """
+
+    def __init__(self, seconds=PRE_TRIGGER_SECONDS):
+        self.span_ms = seconds * 1000
+        self.rows = None
+
+    def append(self, rows):
+        if len(rows) == 0:
+            return
+        self.rows = rows if self.rows is None else np.concatenate((self.rows, rows))
+        self.rows = self.rows[self.rows[:, -1] >= self.rows[-1, -1] - self.span_ms]
+
+    def get(self):
+        return np.empty((0, 0)) if self.rows is None else self.rows
+
+
+class Take(object):
+    """
+    One armed recording: aligns the samples between its start and stop marks and appends them to its file.
+    """
+
+    def __init__(self, folder, speed, start_ms, resample=False, block=False, manifest=DEFAULT_MANIFEST, clock=None):
+        """
+        :param resample: put all streams on the exact MYO_SR grid of the EMG instead of snapping them
+        :param block: continuous capture of a gesture block, split into one recording per trial on finish
+        :param manifest: devices of the streams fed in, decides stream order and column layout
+        :param clock: SessionClock of the streams, a telemetry sidecar is written next to each recording if given
+        """
+        self.start_ms = start_ms
+        self.stop_ms = None
+        self.stop_deadline = None
+        self.last_emg_ms = -np.inf
+
+        streams = manifest_streams(manifest)
+        self.stream_names = [name for name, _, _, _ in streams]
+        quaternions = [quaternion_groups(columns) for _, _, _, columns in streams[1:]] if resample else None
+        self.aligner = StreamAligner(len(streams), quaternions)
+        self.block = block
+        if block:
+            self.recording_file = BlockFile(folder, speed, manifest, resample)
+        else:
+            self.recording_file = RecordingFile(folder, speed, manifest, resample)
+        # Per other stream, the time differences of the matched samples
+        self.time_diffs = [[] for _ in streams[1:]]
+        self.telemetry = None
+        if clock is not None:
+            self.telemetry = TakeTelemetry([(name, rate) for name, _, rate, _ in streams], clock)
+
+    def feed(self, emg_data, *other_data):
+        if len(emg_data) > 0:
+            self.last_emg_ms = emg_data[-1, -1]
+            # Only EMG samples inside the marks make it into the recording, the other streams are
+            # fed unfiltered as candidates for the nearest match at the edges
+            stop_ms = np.inf if self.stop_ms is None else self.stop_ms
+            emg_ts = emg_data[:, -1]
+            emg_data = emg_data[(emg_ts >= self.start_ms) & (emg_ts <= stop_ms)]
+
+        if self.telemetry is not None:
+            # Host timestamps, before the aligner puts the EMG on its grid
+            self.telemetry.add_timestamps(*[rows[:, -1] if len(rows) > 0 else None for rows in (emg_data,) + other_data])
+        self._write(*self.aligner.feed(emg_data, *other_data))
+
+    def _write(self, recording, *time_diffs):
+        self.recording_file.append(recording)
+        for diffs, new_diffs in zip(self.time_diffs, time_diffs):
+            diffs.append(new_diffs)
+        if self.telemetry is not None:
+            self.telemetry.add_time_diffs(*time_diffs)
+
+    def stop(self, stop_ms):
+        self.stop_ms = stop_ms
+        self.stop_deadline = time.perf_counter() + STOP_TIMEOUT
+
+    def is_complete(self):
+        """
+        Stopped and all EMG samples up to the stop mark have arrived (or we gave up waiting for them).
+        """
+        if self.stop_ms is None:
+            return False
+        return self.last_emg_ms >= self.stop_ms or time.perf_counter() > self.stop_deadline
+
+    def finish(self):
+        """
+        Align the tail and move the file into place.
+        :return: dict describing the outcome
+        """
+        self._write(*self.aligner.flush())
+
+        result = {"path": None, "paths": [], "rows": self.recording_file.rows}
+        if self.recording_file.rows == 0:
+            self.recording_file.discard()
+            return result
+
+        stop_ms = self.last_emg_ms if self.stop_ms is None else self.stop_ms
+        if self.block:
+            result["paths"] = self.recording_file.finish()
+            print(f"Split a block of {self.recording_file.rows} aligned EMG data points into {len(result['paths'])} recordings.")
+            if self.telemetry is not None:
+                self.telemetry.write_segments(
+                    result["paths"], self.recording_file.segments, self.start_ms, stop_ms, self.recording_file.rows
+                )
+        else:
+            result["paths"] = [self.recording_file.finish()]
+            print(f"Saved {self.recording_file.rows} aligned EMG data points to {result['paths'][0]}.")
+            if self.telemetry is not None:
+                self.telemetry.write(result["paths"][0], self.start_ms, stop_ms, self.recording_file.rows)
+        result["path"] = result["paths"][0] if result["paths"] else None
+        # Mean time difference between each other stream and the EMG rows it was aligned to
+        result["time_diffs"] = {
+            name: float(np.mean(np.concatenate(diffs))) for name, diffs in zip(self.stream_names[1:], self.time_diffs)
+        }
+        for name, diff in result["time_diffs"].items():
+            print(f"Average time difference {self.stream_names[0]}-{name}: {diff:.2f} ms")
+        return result
+
+    def cancel(self):
+        self.recording_file.discard()
+        return {"path": None, "paths": [], "rows": 0}
+
+
+def worker_recorder(bus, q_control, q_result):
+    """
+    Long-lived consumer of the acquisition streams of all devices. Keeps the last PRE_TRIGGER_SECONDS of every stream
+    and records whatever lies between an arm and a finish command, writing it to disk as it comes in.
+    As the streams are already running and stable, a take starts right at its mark - it may even lie
+    up to PRE_TRIGGER_SECONDS in the past.
+    Commands on q_control:
+    - (RECORDER_ARM, folder, speed, start_ms, resample, block): start a take at start_ms on the session clock
+    - (RECORDER_FINISH, stop_ms): end the take at stop_ms and save it
+    - (RECORDER_CANCEL,): discard the take
+    - (RECORDER_SHUTDOWN,): discard any take and exit
+    Every finished or cancelled take puts a result dict into q_result.
+    :param bus: StreamBus the acquisition workers write to
+    """
+    take = None
+    histories = {name: StreamHistory() for name in bus.streams()}
+
+    while True:
+        # Handle commands first, so that an arm doesn't miss samples drained in the same iteration
+        while not q_control.empty():
+            command = q_control.get()
+            if command[0] == RECORDER_ARM:
+                if take is not None:
+                    q_result.put(take.cancel())
+                take = Take(*command[1:], manifest=bus.manifest, clock=bus.clock)
+                # Cut the take from the stream we already have
+                take.feed(*[history.get() for history in histories.values()])
+            elif command[0] == RECORDER_FINISH and take is not None:
+                take.stop(command[1])
+            elif command[0] == RECORDER_CANCEL and take is not None:
+                q_result.put(take.cancel())
+                take = None
+            elif command[0] == RECORDER_SHUTDOWN:
+                if take is not None:
+                    q_result.put(take.cancel())
+                bus.close()
+                return
+
+        rows = {name: records_to_rows(ring.read()) for name, ring in bus.streams().items()}
+        for name, history in histories.items():
+            history.append(rows[name])
+
+        if take is not None:
+            take.feed(*rows.values())
+
+            if take.is_complete():
+                q_result.put(take.finish())
+                take = None
+
+        time.sleep(WRITE_INTERVAL)
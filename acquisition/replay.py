@@ -0,0 +1,156 @@
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+from acquisition.clock import LatencyStats
+from acquisition.devices import DEFAULT_MANIFEST, manifest_header, manifest_streams
+from acquisition.resampling import run_centres
+from acquisition.ring_buffer import StreamBus
+from constants import MYO_SR
+from dataset.loader import load_recording, read_columns
+
+# Speed that replays as fast as the consumers allow
+REPLAY_ASAP = 0
+# Speeds offered in the app
+REPLAY_SPEEDS = {"1x": 1, "2x": 2, "5x": 5, "10x": 10, "As fast as possible": REPLAY_ASAP}
+# The replay timer sleeps until this long before a deadline and spins for the rest, sleep() alone overshoots by ~1 ms
+SPIN_SECONDS = 0.002
+# Samples pushed per step when replaying as fast as possible
+ASAP_CHUNK = 256
+
+
+def wait_until(deadline):
+    """
+    Wait for an absolute time.perf_counter() deadline. Deadlines are absolute, so errors never accumulate.
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > SPIN_SECONDS:
+        time.sleep(remaining - SPIN_SECONDS)
+    while time.perf_counter() < deadline:
+        pass
+
+
+def load_replay_streams(path, manifest=DEFAULT_MANIFEST):
+    """
+    Turn a recording back into the streams it was recorded from. The EMG rows are on the MYO_SR grid,
+    every other stream is recovered from its runs of repeated rows (see resampling.run_centres).
+    :param path: recording (.semg or CSV) with the column layout of the manifest
+    :return: ordered dict of stream name -> record array of the stream's dtype, timestamps in ms from the start
+    """
+    if ",".join(read_columns(path)) != manifest_header(manifest):
+        raise ValueError(f"{path} doesn't have the column layout of the device manifest")
+    recording = load_recording(path)
+
+    streams = {}
+    column = 0
+    for i, (name, dtype, _, columns) in enumerate(manifest_streams(manifest)):
+        values = recording[:, column : column + len(columns)]
+        column += len(columns)
+        if i == 0:
+            rows = np.arange(len(values), dtype=np.float64)
+        else:
+            rows, values = run_centres(values)
+
+        records = np.zeros(len(values), dtype=dtype)
+        # Fill the fields in order, they hold the columns in order
+        field_column = 0
+        for field in dtype.names:
+            if field in ("timestamp", "device_timestamp"):
+                continue
+            width = int(np.prod(dtype[field].shape))
+            records[field] = values[:, field_column : field_column + width].reshape(records[field].shape)
+            field_column += width
+        records["timestamp"] = rows * 1000 / MYO_SR
+        streams[name] = records
+    return streams
+
+
+def worker_replay(bus, q_terminate, q_ready, path, speed=1, q_stats=None):
+    """
+    Replay a recording into the streams of a bus, in place of the device workers, so the live pipelines
+    downstream of the bus run exactly as with hardware. Samples are stamped with the session time they are
+    pushed at, like live samples are stamped on arrival.
+    :param path: recording (.semg or CSV) with the column layout of bus.manifest
+    :param speed: real-time factor, REPLAY_ASAP to push as fast as the consumers read
+    :param q_stats: gets the replay latency summary (push time - scheduled time) when done
+    """
+    try:
+        streams = load_replay_streams(path, bus.manifest)
+    except (OSError, ValueError) as e:
+        q_terminate.put(str(e))
+        bus.close()
+        return
+
+    # One timeline of all samples, each entry pointing at (stream, row)
+    names = list(streams)
+    times = np.concatenate([streams[name]["timestamp"] for name in names])
+    stream_index = np.concatenate([np.full(len(streams[name]), i) for i, name in enumerate(names)])
+    row_index = np.concatenate([np.arange(len(streams[name])) for name in names])
+    order = np.argsort(times, kind="stable")
+    times, stream_index, row_index = times[order], stream_index[order], row_index[order]
+
+    latency = LatencyStats()
+    q_ready.put("replay")
+
+    # Both clocks read from the same instant
+    start_ns = time.perf_counter_ns()
+    start = start_ns / 1e9
+    start_ms = (start_ns - bus.clock.origin_ns) / 1e6
+    i = 0
+    while i < len(times) and q_terminate.empty():
+        if speed == REPLAY_ASAP:
+            # Don't overrun the consumers, a full ring would drop samples
+            if any(ring.capacity - ring.available() < ASAP_CHUNK for ring in bus.streams().values()):
+                time.sleep(0.001)
+                continue
+            j = min(i + ASAP_CHUNK, len(times))
+        else:
+            wait_until(start + times[i] / 1000 / speed)
+            # Everything that is due by now, usually just the sample we waited for
+            j = np.searchsorted(times, (time.perf_counter() - start) * 1000 * speed, side="right")
+            j = max(j, i + 1)
+
+        now_ms = bus.clock.now_ms()
+        for s, name in enumerate(names):
+            rows = row_index[i:j][stream_index[i:j] == s]
+            if len(rows) == 0:
+                continue
+            records = streams[name][rows]
+            records["timestamp"] = now_ms
+            bus.rings[name].push_many(records)
+
+        if speed != REPLAY_ASAP:
+            latency.extend(now_ms - (start_ms + times[i:j] / speed))
+        i = j
+
+    print(f"Replay of {path} finished, latency: {latency}")
+    if q_stats is not None:
+        q_stats.put(latency.summary())
+    bus.close()
+
+
+if __name__ == "__main__":
+    # python -m acquisition.replay RECORDING [SPEED] -> replay timing with a consumer that keeps up (0 = as fast as possible)
+    bus = StreamBus()
+    q_terminate = multiprocessing.Queue()
+    q_stats = multiprocessing.Queue()
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    p_replay = multiprocessing.Process(
+        target=worker_replay, args=(bus, q_terminate, multiprocessing.Queue(), sys.argv[1], speed, q_stats)
+    )
+    timer = time.perf_counter()
+    p_replay.start()
+    consumed = 0
+    while p_replay.is_alive() or bus.emg.available() > 0:
+        consumed += len(bus.emg.read())
+        for ring in list(bus.streams().values())[1:]:
+            ring.read()
+        time.sleep(0.001)
+    print(f"Replayed {consumed} EMG samples in {time.perf_counter() - timer:.2f} s, {bus.emg.dropped} dropped")
+    print(q_stats.get() if not q_stats.empty() else "")
+
+    bus.close()
+    bus.unlink()
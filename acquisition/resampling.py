@@ -0,0 +1,325 @@
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from acquisition.clock import ClockOffsetEstimator
+from acquisition.devices import DEFAULT_MANIFEST, load_manifest, manifest_header, manifest_streams
+from constants import MYO_SR
+from dataset.loader import load_recording, read_columns
+from dataset.semg import SEMG_SUFFIX, find_recordings, header_info, read_semg_header, write_semg
+
+# Above this cosine between two quaternions SLERP falls back to a normalised LERP (the angle is ~0)
+SLERP_DOT_THRESHOLD = 0.9995
+
+# EMG samples held back to tell a gap from a late packet, 50 ms at MYO_SR
+GRID_LOOKAHEAD = 10
+
+_QUAT_COLUMN = re.compile(r"(.*quat)_[wxyz]$")
+
+
+def quaternion_groups(columns):
+    """
+    Find the quaternions among a list of column names: 4 consecutive columns named <prefix>quat_{w,x,y,z}
+    in any order, e.g. imu_quat_w..imu_quat_z or wrist_quat_x..wrist_quat_w.
+    :return: list of column slices
+    """
+    groups = []
+    i = 0
+    while i < len(columns):
+        match = _QUAT_COLUMN.match(columns[i])
+        if match and i + 4 <= len(columns):
+            names = columns[i : i + 4]
+            if all(_QUAT_COLUMN.match(name) and _QUAT_COLUMN.match(name).group(1) == match.group(1) for name in names):
+                groups.append(slice(i, i + 4))
+                i += 4
+                continue
+        i += 1
+    return groups
+
+
+def _bracket(t_new, t):
+    """
+    For every new time the index of the sample at or before it and the weight of the sample after it.
+    Times outside the stream hold the first/last sample.
+    """
+    left = np.searchsorted(t, t_new, side="right") - 1
+    left = np.clip(left, 0, max(len(t) - 2, 0))
+    right = np.minimum(left + 1, len(t) - 1)
+
+    dt = t[right] - t[left]
+    # Samples with the same timestamp (e.g. the two samples of one BLE packet) don't get a weight
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weight = np.where(dt > 0, (t_new - t[left]) / dt, 0.0)
+    return left, right, np.clip(weight, 0.0, 1.0)
+
+
+def _normalise(q):
+    # All-zero quaternions (e.g. a glove that isn't tracking) stay zero instead of turning into NaN
+    norm = np.linalg.norm(q, axis=1, keepdims=True)
+    return np.divide(q, norm, out=np.zeros_like(q), where=norm > 0)
+
+
+def slerp(q0, q1, weight):
+    """
+    Batched spherical linear interpolation.
+    :param q0: array of shape (N, 4), the component order doesn't matter as long as it is the same for all
+    :param q1: array of shape (N, 4)
+    :param weight: array of shape (N,), 0 gives q0 and 1 gives q1
+    :return: unit quaternions of shape (N, 4), zero where both inputs are zero
+    """
+    q0 = _normalise(q0)
+    q1 = _normalise(q1)
+
+    dot = np.sum(q0 * q1, axis=1)
+    # q and -q are the same rotation, take the short way round
+    q1 = np.where(dot[:, None] < 0, -q1, q1)
+    dot = np.abs(dot)
+
+    weight = weight[:, None]
+    is_close = dot > SLERP_DOT_THRESHOLD
+    theta = np.arccos(np.clip(dot, -1.0, 1.0))[:, None]
+    sin_theta = np.sin(theta)
+    # Avoid dividing by ~0, those rows use the LERP result below
+    sin_theta = np.where(is_close[:, None], 1.0, sin_theta)
+
+    result = (np.sin((1 - weight) * theta) * q0 + np.sin(weight * theta) * q1) / sin_theta
+    lerp = q0 + weight * (q1 - q0)
+    result = np.where(is_close[:, None], lerp, result)
+    return _normalise(result)
+
+
+def resample(t_new, t, values, quaternions=()):
+    """
+    Resample a stream onto new sample times.
+    :param t_new: 1D array of the new sample times
+    :param t: 1D array of the sorted sample times of the stream
+    :param values: array of shape (len(t), C)
+    :param quaternions: column slices holding quaternions, these are SLERPed, everything else is interpolated linearly
+    :return: array of shape (len(t_new), C)
+    """
+    left, right, weight = _bracket(np.asarray(t_new, dtype=np.float64), np.asarray(t, dtype=np.float64))
+    values = np.asarray(values, dtype=np.float64)
+
+    resampled = values[left] + weight[:, None] * (values[right] - values[left])
+    for columns in quaternions:
+        resampled[:, columns] = slerp(values[left, columns], values[right, columns], weight)
+    return resampled
+
+
+class SampleGrid(object):
+    """
+    Puts the samples of a stream with a fixed device rate (EMG) onto an exact grid of that rate, chunk by chunk.
+    The grid is fitted to the host timestamps with the sliding regression of ClockOffsetEstimator,
+    so it follows the device crystal drifting against the host clock. A sample's grid index comes from its time,
+    not from counting samples: a lost BLE packet or samples dropped by the ring leave a hole in the grid
+    instead of moving every later sample earlier.
+    A late packet and a gap look the same until the samples after it arrive - a gap makes all of them late,
+    a late packet only itself - so the last GRID_LOOKAHEAD samples are held back until more arrived.
+    The fit only knows the past, so the grid of a take placed chunk by chunk is close to, but not the same as,
+    the grid a fit over the whole take would give.
+    """
+
+    def __init__(self, sr=MYO_SR):
+        self.period = 1000 / sr
+        # Maps nominal device time (grid index * period) to host time
+        self.estimator = ClockOffsetEstimator()
+        self.next_index = 0
+        self.last_time = -np.inf
+        # Rows (timestamp last) waiting for the samples after them
+        self.pending = None
+        # Grid indices skipped because their samples never arrived
+        self.holes = 0
+
+    def place(self, rows):
+        """
+        :param rows: the next samples of the stream, one row per sample with the host timestamp last
+        :return: the rows that could be placed, with their grid time as timestamp
+        """
+        rows = np.asarray(rows, dtype=np.float64)
+        if self.pending is not None:
+            rows = np.concatenate((self.pending, rows))
+        ready = max(len(rows) - GRID_LOOKAHEAD, 0)
+        self.pending = rows[ready:]
+        return self._place(rows, ready)
+
+    def flush(self):
+        """
+        Place the held back samples, with whatever followed them.
+        """
+        rows = self.pending if self.pending is not None else np.empty((0, 0))
+        self.pending = None
+        return self._place(rows, len(rows))
+
+    def _place(self, rows, ready):
+        if ready == 0:
+            return rows[:0]
+        timestamps = rows[:, -1]
+        sequential = self.next_index + np.arange(len(rows))
+        if self.estimator.is_ready:
+            # Lateness against the fit if the samples followed each other without a gap,
+            # each sample taking the least lateness of itself and everything after it
+            lateness = timestamps - self.estimator.to_host(sequential * self.period)
+            lateness = np.minimum.accumulate(lateness[::-1])[::-1][:ready]
+            gaps = np.where(lateness > self.period / 2, np.rint(lateness / self.period), 0).astype(np.int64)
+            skipped = np.maximum.accumulate(gaps)
+        else:
+            skipped = np.zeros(ready, dtype=np.int64)
+        indices = sequential[:ready] + skipped
+        self.holes += int(skipped[-1])
+        self.next_index = int(indices[-1]) + 1
+
+        # The freshest sample has waited the least in a buffer
+        self.estimator.update(indices[-1] * self.period, timestamps[ready - 1])
+        grid = self.estimator.to_host(indices * self.period)
+        # A refit never moves the grid back before samples that were already placed
+        grid = np.maximum.accumulate(np.maximum(grid, self.last_time))
+        self.last_time = grid[-1]
+
+        placed = rows[:ready].copy()
+        placed[:, -1] = grid
+        return placed
+
+
+def resample_streams(master_data, other_data, quaternions):
+    """
+    Interpolate every other stream at the sample times of the master stream,
+    the counterpart of alignment.align_streams.
+    :param master_data: array of shape (N, C + 1), timestamp last
+    :param other_data: list of arrays of shape (M_i, C_i + 1), none of them empty
+    :param quaternions: per other stream, the column slices holding quaternions
+    :return: (recording of shape (N, C + sum(C_i)), list of time differences to the closest real sample per other stream)
+    """
+    master_ts = master_data[:, -1]
+    columns = [master_data[:, :-1]]
+    time_diffs = []
+    for rows, stream_quaternions in zip(other_data, quaternions):
+        left, right, weight = _bracket(master_ts, rows[:, -1])
+        columns.append(resample(master_ts, rows[:, -1], rows[:, :-1], stream_quaternions))
+        time_diffs.append(np.minimum(np.abs(master_ts - rows[left, -1]), np.abs(rows[right, -1] - master_ts)))
+
+    return np.concatenate(columns, axis=1), time_diffs
+
+
+def run_centres(values):
+    """
+    Recover the sample times of a stream that was snapped to the EMG rate by nearest-neighbour alignment:
+    every run of repeated rows is one original sample, taken to sit at the centre of the run.
+    :param values: array of shape (N, C), one row per EMG row
+    :return: (run centres in EMG rows, values of each run)
+    """
+    changed = np.any(values[1:] != values[:-1], axis=1)
+    starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+    ends = np.concatenate((starts[1:], [len(values)]))
+    return (starts + ends - 1) / 2, values[starts]
+
+
+def resample_recording(recording, manifest=DEFAULT_MANIFEST):
+    """
+    Batch version for recordings saved with nearest-neighbour alignment: every non-EMG stream is rebuilt
+    from its runs and interpolated onto the EMG rows, which are the uniform MYO_SR grid. EMG is left as is.
+    :param recording: array of shape (N, columns of the manifest)
+    :return: array of the same shape
+    """
+    resampled = recording.copy()
+    rows = np.arange(len(recording), dtype=np.float64)
+    column = 0
+    for name, _, _, columns in manifest_streams(manifest):
+        stream = slice(column, column + len(columns))
+        column += len(columns)
+        if name.endswith("emg") or len(recording) < 2:
+            continue
+
+        centres, values = run_centres(recording[:, stream])
+        resampled[:, stream] = resample(rows, centres, values, quaternion_groups(columns))
+    return resampled
+
+
+def is_resampled(path):
+    """
+    Whether a recording already holds resampled IMU and MANUS values. Only .semg headers record it, a CSV counts
+    as not resampled.
+    """
+    return path.endswith(SEMG_SUFFIX) and bool(read_semg_header(path).get("resampled", False))
+
+
+def resample_file(path, out_path, manifest=DEFAULT_MANIFEST):
+    """
+    Resample a recording (.semg or CSV) into a new file, the output keeps the input's format.
+    Raw recordings are never rewritten in place, and a recording that is resampled already is refused.
+    """
+    if os.path.abspath(out_path) == os.path.abspath(path):
+        raise ValueError(f"Not resampling {path} in place, give another output path")
+    if is_resampled(path):
+        raise ValueError(f"{path} is resampled already")
+    header = manifest_header(manifest)
+    if ",".join(read_columns(path)) != header:
+        raise ValueError(f"{path} doesn't have the column layout of the device manifest")
+
+    recording = load_recording(path, dtype=np.float64)
+    resampled = resample_recording(recording, manifest)
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    # Write next to the target and swap it in, so an interrupted pass never leaves a half-written recording
+    temp_path = out_path + ".partial"
+    if path.endswith(SEMG_SUFFIX):
+        info = header_info(read_semg_header(path))
+        write_semg(temp_path, resampled, manifest, **dict(info, resampled=True))
+    else:
+        np.savetxt(temp_path, resampled, delimiter=",", header=header)
+    os.replace(temp_path, out_path)
+
+
+def _benchmark():
+    rng = np.random.default_rng(0)
+    seconds = 20
+    emg_ts = np.arange(seconds * MYO_SR) * 1000 / MYO_SR + rng.uniform(0, 3, seconds * MYO_SR)
+    imu_ts = np.sort(rng.uniform(0, seconds * 1000, seconds * 50))
+    manus_ts = np.sort(rng.uniform(0, seconds * 1000, seconds * 120))
+    emg = np.column_stack((rng.normal(size=(len(emg_ts), 8)), emg_ts))
+    imu = np.column_stack((rng.normal(size=(len(imu_ts), 10)), imu_ts))
+    manus = np.column_stack((rng.normal(size=(len(manus_ts), 24)), manus_ts))
+
+    timer = time.perf_counter()
+    grid = SampleGrid()
+    emg = np.concatenate((grid.place(emg), grid.flush()))
+    recording, _ = resample_streams(emg, [imu, manus], [[slice(0, 4)], [slice(20, 24)]])
+    t_record = time.perf_counter() - timer
+
+    timer = time.perf_counter()
+    resample_recording(recording)
+    t_batch = time.perf_counter() - timer
+
+    print(f"{seconds} s take, {recording.shape}: record time {t_record * 1000:.2f} ms, batch pass {t_batch * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    # python -m acquisition.resampling                -> benchmark on a synthetic 20 s take
+    # python -m acquisition.resampling PATH OUT_DIR   -> resample a recording or all recordings below a folder into
+    #                                                    OUT_DIR, the originals are never touched
+    if len(sys.argv) < 2:
+        _benchmark()
+        sys.exit(0)
+    if len(sys.argv) < 3:
+        sys.exit("Usage: python -m acquisition.resampling PATH OUT_DIR (the output can't be written in place)")
+
+    source = sys.argv[1]
+    out_dir = sys.argv[2]
+    manifest = load_manifest()
+
+    if os.path.isfile(source):
+        paths = [source]
+        source = os.path.dirname(source)
+    else:
+        paths = find_recordings(source)
+    if os.path.abspath(out_dir) == os.path.abspath(source):
+        sys.exit("OUT_DIR is the source folder, that would resample the recordings in place")
+
+    for path in paths:
+        if is_resampled(path):
+            print(f"Skipping {path}, it is resampled already")
+            continue
+        resample_file(path, os.path.join(out_dir, os.path.relpath(path, source)), manifest)
+        print(f"Resampled {path}")
@@ -0,0 +1,312 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+from numpy.lib.recfunctions import structured_to_unstructured
+
+from acquisition.clock import SessionClock
+from acquisition.devices import DEFAULT_MANIFEST, manifest_header, manifest_streams
+
+# Fields that are kept for bookkeeping but are not part of a recording row
+METADATA_FIELDS = ("device_timestamp",)
+
+# How many seconds of data each ring can hold before the producer starts dropping samples
+BUS_SECONDS = 120
+
+# Header layout in 64 bit slots: the consumer's read index has a cache line of its own, so producer and consumer don't contend.
+# The producer's line also carries the stream statistics, stored as float64
+_WRITE_INDEX = 0
+_LAST_TIMESTAMP = 1
+_RATE = 2
+_READ_INDEX = 8
+_DROPPED = 16
+_HEADER_BYTES = 192
+
+# The measured rate is updated once per window of this many milliseconds
+RATE_WINDOW_MS = 1000
+
+
+class SharedRingBuffer(object):
+    """
+    Single-producer/single-consumer ring buffer of typed records in shared memory.
+    The write and read indices only ever grow, the slot of a record is index % capacity.
+    The producer only writes the write index, the drop counter and the stream statistics, the consumer only
+    writes the read index, so no lock is needed - any process can read the counters at any time.
+    If the ring is full new records are dropped (and counted) rather than overwriting data the consumer
+    hasn't seen yet.
+    Instances can be passed to child processes as arguments, they re-attach to the same block there.
+    """
+
+    def __init__(self, dtype, capacity, name=None):
+        self.dtype = np.dtype(dtype)
+        self.capacity = int(capacity)
+        # Only the process that created the block may unlink it
+        self._owner = name is None
+
+        size = _HEADER_BYTES + self.capacity * self.dtype.itemsize
+        if self._owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+
+        self._header = np.ndarray((_HEADER_BYTES // 8,), dtype=np.int64, buffer=self._shm.buf)
+        self._stats = np.ndarray((_HEADER_BYTES // 8,), dtype=np.float64, buffer=self._shm.buf)
+        self._data = np.ndarray((self.capacity,), dtype=self.dtype, buffer=self._shm.buf, offset=_HEADER_BYTES)
+
+        if self._owner:
+            self._header[:] = 0
+
+        # Start of the current rate window as (timestamp, samples received), only used by the producer
+        self._rate_window = None
+
+    def __getstate__(self):
+        return {"dtype": self.dtype, "capacity": self.capacity, "name": self._shm.name}
+
+    def __setstate__(self, state):
+        self.__init__(state["dtype"], state["capacity"], name=state["name"])
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def write_index(self):
+        """
+        Total number of records ever written to the ring.
+        """
+        return int(self._header[_WRITE_INDEX])
+
+    @property
+    def read_index(self):
+        """
+        Total number of records ever consumed from the ring.
+        """
+        return int(self._header[_READ_INDEX])
+
+    @property
+    def dropped(self):
+        """
+        Number of records the producer had to drop because the ring was full.
+        """
+        return int(self._header[_DROPPED])
+
+    @property
+    def received(self):
+        """
+        Number of records the producer got, whether they fitted into the ring or not.
+        """
+        return self.write_index + self.dropped
+
+    @property
+    def last_timestamp(self):
+        """
+        Session timestamp of the newest record, 0 before the first one.
+        """
+        return float(self._stats[_LAST_TIMESTAMP])
+
+    def rate(self, now_ms=None):
+        """
+        Measured rate of the stream in Hz over the last RATE_WINDOW_MS.
+        :param now_ms: current session time, if given a stream that went quiet reports 0
+        """
+        if now_ms is not None and now_ms - self.last_timestamp > 2 * RATE_WINDOW_MS:
+            return 0.0
+        return float(self._stats[_RATE])
+
+    def available(self):
+        """
+        Number of records written but not consumed yet.
+        """
+        return self.write_index - self.read_index
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+    def push(self, record):
+        """
+        Append a single record, e.g. (emg_values, timestamp) for the EMG stream.
+        :return: False if the ring was full and the record was dropped
+        """
+        write_index = self.write_index
+        if write_index - self.read_index >= self.capacity:
+            self._header[_DROPPED] += 1
+            self._update_stats(float(record[-1]))
+            return False
+
+        slot = write_index % self.capacity
+        self._data[slot] = record
+        # Publish only after the record is in place
+        self._header[_WRITE_INDEX] = write_index + 1
+        self._update_stats(self._data[slot]["timestamp"])
+        return True
+
+    def push_many(self, records):
+        """
+        Append a batch of records in at most two copies.
+        :param records: structured array (or anything convertible) of this ring's dtype
+        :return: number of records written, the rest was dropped
+        """
+        records = np.asarray(records, dtype=self.dtype)
+        write_index = self.write_index
+        free = self.capacity - (write_index - self.read_index)
+        n = min(len(records), free)
+        if n < len(records):
+            self._header[_DROPPED] += len(records) - n
+
+        start = write_index % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start : start + first] = records[:first]
+        self._data[: n - first] = records[first:n]
+
+        self._header[_WRITE_INDEX] = write_index + n
+        if len(records) > 0:
+            self._update_stats(records["timestamp"][-1])
+        return n
+
+    def _update_stats(self, timestamp):
+        self._stats[_LAST_TIMESTAMP] = timestamp
+        if self._rate_window is None:
+            self._rate_window = (timestamp, self.received)
+            return
+
+        window_start, received_at_start = self._rate_window
+        if timestamp - window_start >= RATE_WINDOW_MS:
+            self._stats[_RATE] = (self.received - received_at_start) * 1000 / (timestamp - window_start)
+            self._rate_window = (timestamp, self.received)
+
+    # ------------------------------------------------------------------
+    # Consumer side
+    # ------------------------------------------------------------------
+    def peek(self, max_records=None):
+        """
+        Zero-copy view of the oldest unread records. The view stops at the end of the ring,
+        so call peek/advance again to get the records that wrapped around.
+        The view is only valid until advance() is called.
+        """
+        read_index = self.read_index
+        n = self.write_index - read_index
+        start = read_index % self.capacity
+        n = min(n, self.capacity - start)
+        if max_records is not None:
+            n = min(n, max_records)
+        return self._data[start : start + n]
+
+    def advance(self, n):
+        """
+        Mark n records as consumed, handing their slots back to the producer.
+        """
+        self._header[_READ_INDEX] = self.read_index + n
+
+    def read(self, max_records=None):
+        """
+        Copy out and consume all unread records (or at most max_records).
+        """
+        chunks = []
+        remaining = self.available() if max_records is None else min(max_records, self.available())
+        while remaining > 0:
+            view = self.peek(remaining)
+            chunks.append(view.copy())
+            self.advance(len(view))
+            remaining -= len(view)
+
+        if not chunks:
+            return np.empty(0, dtype=self.dtype)
+        return np.concatenate(chunks)
+
+    def clear(self):
+        """
+        Discard everything that hasn't been consumed yet.
+        """
+        self._header[_READ_INDEX] = self.write_index
+
+    def close(self):
+        # Drop our views first, otherwise the buffer can't be released
+        self._header = None
+        self._stats = None
+        self._data = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # A consumer still holds a view from peek(), the mapping is released once that is garbage collected
+            pass
+
+    def unlink(self):
+        if self._owner:
+            self._shm.unlink()
+
+
+class StreamBus(object):
+    """
+    The acquisition streams of one session, one ring per stream of every device in the manifest.
+    Created by whoever consumes the data (recorder, live inference, sonification) and handed to the workers.
+    Carries the session clock all producers stamp their samples with.
+    """
+
+    def __init__(self, seconds=BUS_SECONDS, manifest=None):
+        self.clock = SessionClock()
+        self.manifest = DEFAULT_MANIFEST if manifest is None else manifest
+        # Stream name -> ring, in recording column order
+        self.rings = {
+            name: SharedRingBuffer(dtype, rate * seconds)
+            for name, dtype, rate, _ in manifest_streams(self.manifest)
+        }
+
+    @property
+    def master(self):
+        """
+        The EMG stream of the first device, all other streams are aligned onto it.
+        """
+        return next(iter(self.rings.values()))
+
+    # The streams of the primary Myo and MANUS glove
+    @property
+    def emg(self):
+        return self.rings["emg"]
+
+    @property
+    def imu(self):
+        return self.rings["imu"]
+
+    @property
+    def manus(self):
+        return self.rings["manus"]
+
+    def streams(self):
+        return self.rings
+
+    def header(self):
+        """
+        CSV header of a recording of these streams.
+        """
+        return manifest_header(self.manifest)
+
+    def clear(self):
+        for ring in self.streams().values():
+            ring.clear()
+
+    def stream_rates(self):
+        """
+        Measured rate in Hz of every stream, read straight from shared memory.
+        """
+        now_ms = self.clock.now_ms()
+        return {name: ring.rate(now_ms) for name, ring in self.streams().items()}
+
+    def close(self):
+        """
+        Release this process' mapping of the rings. The owner should call unlink() afterwards.
+        """
+        for ring in self.streams().values():
+            ring.close()
+
+    def unlink(self):
+        for ring in self.streams().values():
+            ring.unlink()
+
+
+def records_to_rows(records):
+    """
+    Flatten structured records into the float64 row layout of the old queues (values first, timestamp last).
+    """
+    if len(records) == 0:
+        return np.empty((0, 0))
+    fields = [name for name in records.dtype.names if name not in METADATA_FIELDS]
+    return structured_to_unstructured(records[fields], dtype=np.float64)
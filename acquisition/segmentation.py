@@ -0,0 +1,216 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from acquisition.devices import DEFAULT_MANIFEST, manifest_header, manifest_streams
+from acquisition.resampling import quaternion_groups
+from constants import MYO_SR
+from dataset.loader import load_recording
+from dataset.semg import SEMG_SUFFIX, recording_stem, write_semg
+
+# Window of the moving averages for the EMG envelope and the finger speed
+ENVELOPE_WINDOW_SECONDS = 0.15
+# Fraction of a block assumed to be rest, the activity level below this quantile is the baseline
+REST_QUANTILE = 0.2
+# Activity relative to the baseline that starts and ends a trial (hysteresis)
+ON_THRESHOLD = 3.0
+OFF_THRESHOLD = 1.8
+# Finger speed floor (joint units per second) so that a perfectly still glove doesn't make noise look like movement
+FINGER_SPEED_FLOOR = 20.0
+# Trials closer than this are one trial, shorter ones are dropped
+MERGE_GAP_SECONDS = 0.4
+MIN_TRIAL_SECONDS = 0.5
+# Context kept around each trial
+PADDING_SECONDS = 0.2
+
+
+def _moving_average(values, window):
+    """
+    Centred moving average along the first axis in O(N) via a cumulative sum.
+    """
+    window = max(int(window), 1)
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    padded = np.pad(values, ((window // 2, window - 1 - window // 2), (0, 0)), mode="edge")
+    cumsum = np.cumsum(padded, axis=0)
+    cumsum = np.concatenate((np.zeros((1, values.shape[1])), cumsum))
+    return (cumsum[window:] - cumsum[:-window]) / window
+
+
+def activity_score(emg, fingers=None, sr=MYO_SR):
+    """
+    Activity of every row relative to the resting level of the block: the larger of the EMG envelope
+    and the finger-joint speed, each divided by its own baseline.
+    :param emg: array of shape (N, channels)
+    :param fingers: array of shape (N, joints) or None to only use EMG
+    :return: array of shape (N,)
+    """
+    window = ENVELOPE_WINDOW_SECONDS * sr
+
+    # Mean absolute value envelope, averaged over the channels
+    envelope = _moving_average(np.abs(emg), window).mean(axis=1)
+    score = envelope / max(np.quantile(envelope, REST_QUANTILE), 1e-9)
+
+    if fingers is not None:
+        speed = np.linalg.norm(np.diff(fingers, axis=0, prepend=fingers[:1]), axis=1) * sr
+        speed = _moving_average(speed, window)[:, 0]
+        speed_score = speed / (np.quantile(speed, REST_QUANTILE) + FINGER_SPEED_FLOOR)
+        score = np.maximum(score, speed_score)
+
+    return score
+
+
+def hysteresis(score, on=ON_THRESHOLD, off=OFF_THRESHOLD):
+    """
+    Threshold with hysteresis without a Python loop: a row is active from the point the score rises
+    above on until it falls below off.
+    :return: boolean array of shape (N,)
+    """
+    # 1 where the state is forced on, 0 where it is forced off, -1 where the previous state carries on
+    state = np.full(len(score), -1, dtype=np.int8)
+    state[score >= on] = 1
+    state[score < off] = 0
+    if len(state) > 0 and state[0] < 0:
+        state[0] = 0
+
+    # Index of the last row that forced a state, carried forward
+    last_forced = np.where(state >= 0, np.arange(len(state)), 0)
+    np.maximum.accumulate(last_forced, out=last_forced)
+    return state[last_forced] == 1
+
+
+def find_segments(active, sr=MYO_SR):
+    """
+    Turn an activity mask into trials: close small gaps, drop short blips and add some context.
+    :return: array of shape (T, 2) with [start, end) rows of each trial
+    """
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    # Merge trials separated by less than MERGE_GAP_SECONDS
+    keep_gap = (starts[1:] - ends[:-1]) >= MERGE_GAP_SECONDS * sr
+    starts = starts[np.concatenate(([True], keep_gap))]
+    ends = ends[np.concatenate((keep_gap, [True]))]
+
+    long_enough = (ends - starts) >= MIN_TRIAL_SECONDS * sr
+    starts, ends = starts[long_enough], ends[long_enough]
+
+    padding = int(PADDING_SECONDS * sr)
+    starts = np.maximum(starts - padding, 0)
+    ends = np.minimum(ends + padding, len(active))
+    # Padding must not make neighbouring trials overlap
+    if len(starts) > 1:
+        starts[1:] = np.maximum(starts[1:], ends[:-1])
+
+    return np.column_stack((starts, ends))
+
+
+def segment_columns(manifest=DEFAULT_MANIFEST):
+    """
+    Columns of a recording the activity detector looks at.
+    :return: (EMG column indices of the master stream, finger joint column indices of all MANUS gloves)
+    """
+    emg_columns = []
+    finger_columns = []
+    column = 0
+    for i, (name, _, _, columns) in enumerate(manifest_streams(manifest)):
+        indices = np.arange(column, column + len(columns))
+        column += len(columns)
+        if i == 0:
+            emg_columns.extend(indices)
+        elif name.endswith("manus"):
+            # Everything but the wrist orientation
+            quaternion = np.zeros(len(columns), dtype=bool)
+            for group in quaternion_groups(columns):
+                quaternion[group] = True
+            finger_columns.extend(indices[~quaternion])
+    return np.array(emg_columns), np.array(finger_columns, dtype=np.int64)
+
+
+def segment_recording(recording, manifest=DEFAULT_MANIFEST, sr=MYO_SR):
+    """
+    Detect the trials in a continuous recording.
+    :param recording: array of shape (N, columns of the manifest), may be a memmap
+    :return: array of shape (T, 2) with [start, end) rows of each trial
+    """
+    if len(recording) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    emg_columns, finger_columns = segment_columns(manifest)
+    fingers = recording[:, finger_columns] if len(finger_columns) > 0 else None
+    score = activity_score(recording[:, emg_columns], fingers, sr)
+    return find_segments(hysteresis(score), sr)
+
+
+def write_segments(recording, segments, folder, filenames, manifest=DEFAULT_MANIFEST, **info):
+    """
+    Save each trial as a recording of its own, in the format of its filename (.semg or .csv).
+    :param filenames: one filename per segment
+    :param info: extra .semg header entries, e.g. speed
+    :return: list of the paths written
+    """
+    header = manifest_header(manifest)
+    paths = []
+    for (start, end), filename in zip(segments, filenames):
+        path = os.path.join(folder, filename)
+        if filename.endswith(SEMG_SUFFIX):
+            write_semg(path, recording[start:end], manifest, **info)
+        else:
+            np.savetxt(path, recording[start:end], delimiter=",", header=header)
+        paths.append(path)
+    return paths
+
+
+def _synthesise_block(seconds, rng, sr=MYO_SR):
+    """
+    Rest with trials of 1-3 s every 4-8 s: EMG bursts and finger movement.
+    :return: (recording of shape (N, 42), true [start, end) of every trial)
+    """
+    n = int(seconds * sr)
+    recording = np.zeros((n, 42))
+    recording[:, :8] = rng.normal(0, 2, (n, 8))
+    recording[:, 38] = 1.0
+
+    trials = []
+    position = int(2 * sr)
+    while position < n - 4 * sr:
+        length = int(rng.uniform(1, 3) * sr)
+        trials.append((position, position + length))
+        recording[position : position + length, :8] *= 10
+        recording[position : position + length, 18:38] += np.sin(np.linspace(0, np.pi, length))[:, None] * 60
+        position += length + int(rng.uniform(4, 8) * sr)
+    return recording, np.array(trials)
+
+
+if __name__ == "__main__":
+    # python -m acquisition.segmentation                   -> benchmark on a synthetic hour-long block
+    # python -m acquisition.segmentation BLOCK SPEED       -> split a continuous recording (.csv or .semg) into trials next to it
+    if len(sys.argv) > 2:
+        block = load_recording(sys.argv[1], dtype=np.float64)
+        segments = segment_recording(block)
+        base = recording_stem(os.path.basename(sys.argv[1]))
+        filenames = [f"recording_{sys.argv[2]}_{base}_{i}{SEMG_SUFFIX}" for i in range(len(segments))]
+        folder = os.path.dirname(os.path.abspath(sys.argv[1]))
+        for path in write_segments(block, segments, folder, filenames, speed=sys.argv[2]):
+            print(f"Wrote {path}")
+        sys.exit(0)
+
+    rng = np.random.default_rng(0)
+    block, trials = _synthesise_block(3600, rng)
+
+    timer = time.perf_counter()
+    segments = segment_recording(block)
+    t_segment = time.perf_counter() - timer
+
+    # Every true trial should be found, with its boundaries within the padding plus a smoothing window
+    tolerance = int((PADDING_SECONDS + ENVELOPE_WINDOW_SECONDS) * MYO_SR)
+    assert len(segments) == len(trials), (len(segments), len(trials))
+    assert np.all(np.abs(segments - trials) <= tolerance)
+
+    print(f"1 h block ({len(block)} rows): {len(segments)} trials found in {t_segment:.2f} s")
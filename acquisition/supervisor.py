@@ -0,0 +1,115 @@
+import multiprocessing
+import multiprocessing.connection
+import time
+
+# How often a crashed worker is restarted before its error is reported
+MAX_RESTARTS = 3
+# Seconds the workers get to exit by themselves before they are terminated
+SHUTDOWN_TIMEOUT = 2
+# Seconds a terminated worker gets before it is killed
+KILL_TIMEOUT = 0.5
+
+
+def stop_processes(processes, timeout=SHUTDOWN_TIMEOUT):
+    """
+    Wait for processes that were asked to exit, all within one shared deadline.
+    Stragglers are terminated and, if even that doesn't help, killed - so this never blocks
+    much longer than timeout + 2 * KILL_TIMEOUT.
+    :param processes: list of multiprocessing.Process, unstarted ones are skipped
+    """
+    processes = [process for process in processes if process is not None and process.pid is not None]
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+
+    stuck = [process for process in processes if process.is_alive()]
+    for process in stuck:
+        print(f"Terminating stuck process {process.name}")
+        process.terminate()
+    for process in stuck:
+        process.join(KILL_TIMEOUT)
+        if process.is_alive():
+            print(f"Killing stuck process {process.name}")
+            process.kill()
+            process.join(KILL_TIMEOUT)
+
+
+class WorkerSupervisor(object):
+    """
+    Runs a set of worker processes that share a terminate queue, watches their liveness via the
+    process sentinels and restarts workers that die while no termination was requested.
+    """
+
+    def __init__(self, q_terminate, max_restarts=MAX_RESTARTS):
+        self.q_terminate = q_terminate
+        self.max_restarts = max_restarts
+        # name -> {"target", "args", "restart", "process", "restarts"}
+        self.workers = {}
+
+    def add(self, name, target, args, restart=True, finite=False):
+        """
+        Register a worker.
+        :param restart: restart the worker if it crashes, otherwise report the crash right away
+        :param finite: the worker ends by itself when its job is done (e.g. a replay), a clean exit is no error
+        """
+        self.workers[name] = {
+            "target": target,
+            "args": args,
+            "restart": restart,
+            "finite": finite,
+            "process": None,
+            "restarts": 0,
+        }
+
+    def _spawn(self, name):
+        worker = self.workers[name]
+        worker["process"] = multiprocessing.Process(target=worker["target"], args=worker["args"], name=name)
+        worker["process"].start()
+
+    def start(self):
+        for name in self.workers:
+            self._spawn(name)
+
+    def watch(self, timeout):
+        """
+        Block for up to timeout seconds waiting for a worker to exit and deal with it.
+        :return: error string if a worker died for good, None otherwise
+        """
+        sentinels = {
+            worker["process"].sentinel: name
+            for name, worker in self.workers.items()
+            if worker["process"].is_alive()
+        }
+        if not sentinels:
+            return None
+
+        for sentinel in multiprocessing.connection.wait(list(sentinels), timeout):
+            # Workers leave by themselves when termination was requested, nothing to do then
+            if not self.q_terminate.empty():
+                return None
+
+            name = sentinels[sentinel]
+            worker = self.workers[name]
+            worker["process"].join()
+            exitcode = worker["process"].exitcode
+
+            if worker["finite"] and exitcode == 0:
+                print(f"The {name} worker finished")
+                continue
+
+            if not worker["restart"] or worker["restarts"] >= self.max_restarts:
+                return f"The {name} worker stopped unexpectedly (exit code {exitcode})."
+
+            worker["restarts"] += 1
+            print(f"Restarting {name} worker (exit code {exitcode}, restart {worker['restarts']}/{self.max_restarts})")
+            self._spawn(name)
+
+        return None
+
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        """
+        Request termination and make sure all workers are gone within the deadline.
+        """
+        if self.q_terminate.empty():
+            self.q_terminate.put(True)
+        stop_processes([worker["process"] for worker in self.workers.values()], timeout)
@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from dataset.semg import find_recordings
+
+# Sidecar next to every recording: recording_x.semg -> recording_x.telemetry.npz
+TELEMETRY_SUFFIX = ".telemetry.npz"
+# An interval longer than this many nominal sample periods counts as a gap.
+# EMG arrives in BLE packets of two samples, so an interval of two periods is normal
+GAP_FACTOR = 3
+
+
+def telemetry_path(recording_path):
+    return os.path.splitext(recording_path)[0] + TELEMETRY_SUFFIX
+
+
+def stream_quality(timestamps, nominal_rate):
+    """
+    Timing quality of one stream.
+    :param timestamps: sorted session timestamps in ms
+    :return: (effective rate in Hz, number of gaps, number of duplicate timestamps)
+    """
+    if len(timestamps) < 2:
+        return 0.0, 0, 0
+    intervals = np.diff(timestamps)
+    span = timestamps[-1] - timestamps[0]
+    rate = (len(timestamps) - 1) / span * 1000 if span > 0 else 0.0
+    gaps = int(np.count_nonzero(intervals > GAP_FACTOR * 1000 / nominal_rate))
+    duplicates = int(np.count_nonzero(intervals == 0))
+    return rate, gaps, duplicates
+
+
+class TakeTelemetry(object):
+    """
+    Timing data of one take that doesn't make it into the recording: the host timestamps of every stream's samples
+    and the alignment error of every row. Written as a compressed .npz sidecar next to the recording.
+    """
+
+    def __init__(self, streams, clock):
+        """
+        :param streams: list of (stream name, nominal rate) as in the recording, master first
+        :param clock: SessionClock of the streams, to store the wall-clock start and stop
+        """
+        self.names = [name for name, _ in streams]
+        self.rates = [rate for _, rate in streams]
+        self.clock = clock
+        self._timestamps = [[] for _ in streams]
+        self._time_diffs = [[] for _ in streams[1:]]
+
+    def add_timestamps(self, *timestamps):
+        """
+        :param timestamps: per stream, new session timestamps (None or empty if nothing arrived)
+        """
+        for chunks, new in zip(self._timestamps, timestamps):
+            if new is not None and len(new) > 0:
+                chunks.append(np.asarray(new, dtype=np.float64))
+
+    def add_time_diffs(self, *time_diffs):
+        """
+        :param time_diffs: per other stream, the time differences of newly written rows
+        """
+        for chunks, new in zip(self._time_diffs, time_diffs):
+            if len(new) > 0:
+                chunks.append(np.asarray(new, dtype=np.float32))
+
+    def arrays(self, start_ms, stop_ms, rows):
+        """
+        Everything between the start and stop marks, master samples cut to the rows written.
+        :return: dict of arrays as stored in the sidecar
+        """
+        timestamps = [np.concatenate(chunks) if chunks else np.empty(0) for chunks in self._timestamps]
+        time_diffs = [np.concatenate(chunks) if chunks else np.empty(0, dtype=np.float32) for chunks in self._time_diffs]
+
+        timestamps[0] = timestamps[0][:rows]
+        # The other streams around the master samples, one nominal period of margin for the nearest matches
+        first_ms, last_ms = (timestamps[0][0], timestamps[0][-1]) if rows > 0 else (start_ms, stop_ms)
+        for i in range(1, len(timestamps)):
+            margin = 1000 / self.rates[i]
+            inside = (timestamps[i] >= first_ms - margin) & (timestamps[i] <= last_ms + margin)
+            timestamps[i] = timestamps[i][inside]
+
+        return self._pack(timestamps, [diffs[:rows] for diffs in time_diffs], start_ms, stop_ms)
+
+    def _pack(self, timestamps, time_diffs, start_ms, stop_ms):
+        quality = [stream_quality(ts, rate) for ts, rate in zip(timestamps, self.rates)]
+        data = {
+            "streams": np.array(self.names),
+            "nominal_rates": np.array(self.rates, dtype=np.float64),
+            "effective_rates": np.array([q[0] for q in quality]),
+            "gaps": np.array([q[1] for q in quality], dtype=np.int64),
+            "duplicates": np.array([q[2] for q in quality], dtype=np.int64),
+            "samples": np.array([len(ts) for ts in timestamps], dtype=np.int64),
+            "rows": np.int64(len(timestamps[0])),
+            "start_epoch_ms": np.float64(self.clock.to_epoch_ms(start_ms)),
+            "stop_epoch_ms": np.float64(self.clock.to_epoch_ms(stop_ms)),
+            "mean_time_diffs": np.array([diffs.mean() if len(diffs) > 0 else np.nan for diffs in time_diffs]),
+        }
+        for name, ts in zip(self.names, timestamps):
+            data[f"timestamps_{name}"] = ts
+        for name, diffs in zip(self.names[1:], time_diffs):
+            data[f"time_diffs_{name}"] = diffs
+        return data
+
+    def write(self, recording_path, start_ms, stop_ms, rows):
+        data = self.arrays(start_ms, stop_ms, rows)
+        np.savez_compressed(telemetry_path(recording_path), **data)
+
+    def write_segments(self, recording_paths, segments, start_ms, stop_ms, rows):
+        """
+        Sidecars for the recordings a block was split into.
+        :param segments: [start, end) rows of the block per recording
+        """
+        block = self.arrays(start_ms, stop_ms, rows)
+        master_ts = block[f"timestamps_{self.names[0]}"]
+        for path, (start, end) in zip(recording_paths, segments):
+            timestamps = [master_ts[start:end]]
+            for name, rate in zip(self.names[1:], self.rates[1:]):
+                ts = block[f"timestamps_{name}"]
+                margin = 1000 / rate
+                timestamps.append(ts[(ts >= master_ts[start] - margin) & (ts <= master_ts[end - 1] + margin)])
+            time_diffs = [block[f"time_diffs_{name}"][start:end] for name in self.names[1:]]
+            data = self._pack(timestamps, time_diffs, master_ts[start], master_ts[end - 1])
+            np.savez_compressed(telemetry_path(path), **data)
+
+
+def read_telemetry(recording_path, arrays=False):
+    """
+    Read the sidecar of a recording without touching the recording itself.
+    :param arrays: also load the per-sample timestamps and alignment errors, otherwise only the summary
+    :return: dict, None if the recording has no sidecar
+    """
+    path = telemetry_path(recording_path)
+    if not os.path.exists(path):
+        return None
+    # Members of an .npz are only decompressed when accessed
+    with np.load(path) as sidecar:
+        keys = sidecar.files if arrays else [
+            key for key in sidecar.files if not key.startswith(("timestamps_", "time_diffs_"))
+        ]
+        telemetry = {key: sidecar[key] for key in keys}
+    telemetry["streams"] = [str(name) for name in telemetry["streams"]]
+    return telemetry
+
+
+if __name__ == "__main__":
+    # python -m acquisition.telemetry FOLDER -> timing quality of all recordings below a folder
+    recordings = find_recordings(sys.argv[1])
+
+    timer = time.perf_counter()
+    summaries = {path: read_telemetry(path) for path in recordings}
+    t_read = time.perf_counter() - timer
+
+    for path, telemetry in summaries.items():
+        if telemetry is None:
+            print(f"{path}: no telemetry")
+            continue
+        streams = ", ".join(
+            f"{name} {rate:.1f} Hz/{gaps} gaps/{duplicates} dup"
+            for name, rate, gaps, duplicates in zip(
+                telemetry["streams"], telemetry["effective_rates"], telemetry["gaps"], telemetry["duplicates"]
+            )
+        )
+        print(f"{path}: {int(telemetry['rows'])} rows, {streams}")
+    print(f"Read {len(recordings)} sidecars in {t_read * 1000:.1f} ms")
@@ -1,9 +1,9 @@
 import os
 import tkinter as tk
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import plotly.express as px
 import numpy as np
-import pandas as pd
 from pyfftw import pyfftw
 from scipy import signal
 from tqdm import tqdm
@@ -20,6 +20,12 @@ from constants import (
     FEATURE_VECTOR_DIM,
     MYO_SR,
 )
+from dataset.catalog import DEFAULT_SCHEMA, get_catalog
+from dataset.loader import load_recording
+from dataset.store import get_store
+
+# Fewer CSV recordings than this are parsed in this process, starting the workers would take longer
+PARALLEL_MIN_FILES = 8
 
 
 class AnalysisFrame(tk.Frame):
@@ -434,8 +440,8 @@ class AnalysisFrame(tk.Frame):
         print("Selected speeds:", self.selected_speeds)
         print("Loading files...")
 
-        # Load all CSVs from the user_data folder
-        # NOTE: Samples here contains ALL data, so EMG, IMU, Labels, etc.
+        # Load the recordings from the user_data folder, only the columns the analysis runs on:
+        # the eight EMG channels or the 20 finger joints
         self.samples, self.users, self.sessions, self.gesture_types, self.speeds, _ = (
             load_all_files(
                 data_len=self.data_len_analysis.get(),
@@ -444,6 +450,7 @@ class AnalysisFrame(tk.Frame):
                 selected_sessions=self.selected_sessions,
                 selected_gestures=self.selected_gestures,
                 selected_speeds=self.selected_speeds,
+                modalities=["emg"] if is_emg else ["fingers"],
             )
         )
 
@@ -458,14 +465,11 @@ class AnalysisFrame(tk.Frame):
         # Cut all to min_length so they are homogenous
         self.samples = [sample[:min_length] for sample in self.samples]
 
-        # If we're doing analysis on EMG data, take only the first eight columns
+        # The samples only hold the EMG (8 columns) or finger joint (20 columns) data already
         if is_emg:
             print("Performing PCA on EMG data...")
-            self.samples = [sample[:, :8] for sample in self.samples]
-        # If we're doing analysis on fingerjoint data, take columns 18-38
         else:
             print("Performing PCA on Fingerjoint data...")
-            self.samples = [sample[:, 18:38] for sample in self.samples]
 
         print("Extracting features...")
         # Extract features
@@ -555,6 +559,8 @@ class AnalysisFrame(tk.Frame):
         counter = 0
 
         for sample in tqdm(self.samples):
+            # Windows of packed recordings are int8 EMG, only the window is converted (squaring int8 overflows)
+            sample = np.asarray(sample, dtype=np.float32)
             included_features = [
                 feature for feature, var in self.feature_vars.items() if var.get()
             ]
@@ -630,16 +636,20 @@ def load_all_files(
     selected_sessions=None,
     selected_gestures=None,
     selected_speeds=None,
+    modalities=None,
+    workers=None,
 ):
+    """
+    Load the recordings matching the filters and cut them into windows of data_len rows.
+    :param modalities: only these columns, e.g. ["emg"] or ["fingers"], None for all 42
+    :param workers: processes that parse CSV recordings, defaults to one per core
+    :return: (windows, users, sessions, gesture types, speeds, list of (user, session, gesture, speed, recording)).
+        Recordings from the dataset store are memmap slices in the stored dtype (int8 for a single EMG modality),
+        convert the windows where they are used
+    """
     if dir is None:
         dir = get_user_data_path()
 
-    data_recordings = []
-    users = []
-    sessions = []
-    gesture_types = []
-    speeds = []
-
     # If no filters are provided, treat them as empty lists
     if selected_users is None:
         selected_users = []
@@ -653,51 +663,60 @@ def load_all_files(
     if not os.path.isdir(dir):
         return [], [], [], [], [], []
 
-    # Walk configured user data directory
-    for root, dirs, files in os.walk(dir):
-        for filename in files:
-            if filename.endswith(".csv"):
-                relative_root = os.path.relpath(root, dir)
-                path_parts = relative_root.split(os.sep)
-
-                user_part = path_parts[0] if len(path_parts) > 0 else None
-                session_part = path_parts[1] if len(path_parts) > 1 else None
-                gesture_part = path_parts[2] if len(path_parts) > 2 else None
-                speed = filename.split("_")[1]
-
-                # Filter check
-                if user_part not in selected_users:
-                    continue
-                if session_part not in selected_sessions:
-                    continue
-                if gesture_part not in selected_gestures:
-                    continue
-                if speed not in selected_speeds:
-                    continue
-
-                full_csv_path = os.path.join(root, filename)
-                df = pd.read_csv(full_csv_path, index_col=False)
-                data_recordings.append(df)
-
-                users.append(user_part)
-                sessions.append(session_part)
-                # The last folder might be the gesture label
-                gesture_label = path_parts[-1]  # e.g. 'g_fist'
-                gesture_types.append(gesture_label)
-                speeds.append(speed)
-
-    # Convert them to arrays
-    recordings_np = []
-    for i in range(len(data_recordings)):
-        recordings_np.append(
-            (
-                users[i],
-                sessions[i],
-                gesture_types[i],
-                speeds[i],
-                data_recordings[i].to_numpy(dtype=np.float32),
-            )
-        )
+    # Query the dataset catalog of the user data directory for the recordings matching the filters
+    catalog = get_catalog(dir)
+    catalog.refresh()
+    matching = catalog.recordings(selected_users, selected_sessions, selected_gestures, selected_speeds)
+    if modalities is not None:
+        # Other device layouts don't have the modalities' columns where the recording schema has them
+        skipped = [recording for recording in matching if recording["schema"] != DEFAULT_SCHEMA]
+        for recording in skipped:
+            print(f"Skipping {recording['path']}, it doesn't have the recording schema")
+        matching = [recording for recording in matching if recording["schema"] == DEFAULT_SCHEMA]
+
+    # Recordings packed in the dataset store are mapped and .semg files are read in one go,
+    # only CSVs are worth parsing in parallel
+    store = get_store(dir)
+    store.open()
+    rows = [None] * len(matching)
+    to_parse = []
+    from_store = 0
+    for i, recording in enumerate(matching):
+        position = store.lookup_recording(recording)
+        if position is not None:
+            # The stored dtype, e.g. EMG stays an int8 slice of the mapped array instead of a float32 copy
+            rows[i] = store.rows(position, modalities, dtype=None)
+            from_store += 1
+        elif recording["format"] == "semg":
+            rows[i] = load_recording(recording["path"], modalities)
+        else:
+            to_parse.append(i)
+    # Only the CSVs left to parse count towards starting the workers
+    if len(to_parse) < PARALLEL_MIN_FILES:
+        for i in to_parse:
+            rows[i] = load_recording(matching[i]["path"], modalities)
+        to_parse = []
+
+    def loaded(count):
+        if progressbar is not None:
+            progressbar["value"] = count / max(len(matching), 1) * 100
+            progressbar.update()
+
+    loaded(len(matching) - len(to_parse))
+    if to_parse:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = {
+                pool.submit(load_recording, matching[i]["path"], modalities): i for i in to_parse
+            }
+            # Progress as the recordings come in, in whatever order they finish
+            for count, future in enumerate(as_completed(futures), len(matching) - len(to_parse) + 1):
+                rows[futures[future]] = future.result()
+                loaded(count)
+
+    recordings_np = [
+        (recording["user"], recording["session"], recording["gesture"], recording["speed"], rec)
+        for recording, rec in zip(matching, rows)
+    ]
 
     # This will hold all our processed data points
     proc_samples = []
@@ -706,11 +725,11 @@ def load_all_files(
     final_gesture_types = []
     final_speeds = []
 
-    # For each CSV, do our processing
-    for i in tqdm(range(len(recordings_np))):
-        user, session, gesture_type, speed, rec = recordings_np[i]
+    # For each recording, do our processing
+    for user, session, gesture_type, speed, rec in recordings_np:
         rec_length = rec.shape[0]
         for start in range(0, rec_length - data_len, DATASET_SHIFT_SIZE):
+            # Views into the recording, not copies
             sample = rec[start : start + data_len]
             proc_samples.append(sample)
             final_users.append(user)
@@ -718,15 +737,14 @@ def load_all_files(
             final_gesture_types.append(gesture_type)
             final_speeds.append(speed)
 
-        if progressbar is not None:
-            progressbar["value"] = (i + 1) / len(recordings_np) * 100
-            progressbar.update()
-
     # Keep windows as a list instead of forcing a single ndarray.
     # Some datasets mix CSV schemas (e.g. different column counts across users),
     # which makes np.array(proc_samples) fail with an inhomogeneous shape error.
     all_in_one = proc_samples
-    print(f"Loaded {len(data_recordings)} recordings matching the filters.")
+    print(
+        f"Loaded {len(matching)} recordings matching the filters, {from_store} from the dataset store, "
+        f"{len(to_parse)} parsed in parallel."
+    )
     print(f"Got approximately {len(all_in_one)} samples.")
     return (
         all_in_one,
@@ -738,33 +756,14 @@ def load_all_files(
     )
 
 
-def parse_user_data_structure(base_dir="user_data"):
+def parse_user_data_structure(base_dir=None):
     """
-    Example helper function to parse the user_data folder to list all possible
-    users, sessions, speeds. Adjust logic to your real directory structure.
-    Returns sets: (users, sessions, speeds).
+    List all users, sessions and gestures of the user data folder, from the dataset catalog.
+    Returns sets: (users, sessions, gestures).
     """
-    users = set()
-    sessions = set()
-    gestures = set()
-
-    if not os.path.isdir(base_dir):
-        return users, sessions, gestures
-
-    for root, dirs, files in os.walk(base_dir):
-        relative_root = os.path.relpath(root, base_dir)
-        if relative_root == ".":
-            continue
-
-        path_parts = relative_root.split(os.sep)
-        if len(path_parts) > 0:
-            users.add(path_parts[0])
-        if len(path_parts) > 1:
-            sessions.add(path_parts[1])
-        if len(path_parts) > 2:
-            gestures.add(path_parts[2])
-
-    return users, sessions, gestures
+    catalog = get_catalog(base_dir)
+    catalog.refresh()
+    return catalog.folder_names()
 
 
 def integrated_absolute_second_derivative(x):
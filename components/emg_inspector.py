@@ -13,6 +13,7 @@ from constants import (
     MYO_SR,
     DATASET_SHIFT_SIZE,
 )
+from dataset.store import load_stored
 
 
 class EMGInspectorWindow(tk.Toplevel):
@@ -72,8 +73,8 @@ class EMGInspector(tk.Frame):
         )
         file_label.pack(side=tk.TOP, fill=tk.X, padx=10, pady=5)
 
-        # Read csv file
-        self.data = np.genfromtxt(self.file_path, delimiter=",", skip_header=0)
+        # Read the recording (.semg or CSV), from the dataset store if it is packed
+        self.data = load_stored(self.file_path)
         self.channels = self.data.shape[1]  # Assuming each column is a channel
 
         r_emg_frame = tk.Frame(self, bg=self.root.colour_config["bg"])
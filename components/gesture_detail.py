@@ -1,26 +1,46 @@
-import datetime
 import multiprocessing
 import os
 import signal
-import socket
 import subprocess
+import tempfile
 import time
 import tkinter as tk
 import tkinter.messagebox as msgbox
 from tkinter import LEFT, ttk
 
-import numpy as np
 import psutil
 import send2trash
 
 import helpers
+from acquisition.telemetry import telemetry_path
 from components.browser import BrowserFrame, browser_backend_available
 from components.emg_inspector import EMGInspectorWindow
 from config import FONT, VISUALISER_PATH, get_user_data_path
-from constants import XRMI_GESTURES, DATA_CSV_HEADER_STR
-from helpers import RepeatedTimer
+from constants import XRMI_GESTURES
+from dataset.catalog import get_catalog
+from dataset.semg import CSV_SUFFIX, RECORDING_SUFFIXES, SEMG_SUFFIX, export_csv, recording_stem
 from networking import netz_connector
-from myo.data_collection import start_recording
+from myo.data_collection import get_acquisition_daemon
+
+# Phases of a take: idle -> connecting -> warming -> recording -> finalising -> idle, driven by the root scheduler.
+# A take that fails or is cancelled while connecting goes through disconnecting, the devices are shut down in the background
+IDLE = "idle"
+CONNECTING = "connecting"
+WARMING = "warming"
+RECORDING = "recording"
+FINALISING = "finalising"
+DISCONNECTING = "disconnecting"
+# How often the current phase is checked on, in ms
+POLL_MS = 50
+
+# Seconds per take
+RECORDING_LENGTH = 10
+# Seconds before the click to include, the daemon keeps the streams buffered
+PRE_ROLL_LENGTH = 0
+# Interpolate IMU and MANUS onto the EMG sample grid (SLERP for the quaternions) instead of snapping them.
+# Off by default: the published dataset holds nearest-neighbour snapped values, new recordings match it.
+# Either way the .semg header records which one a recording holds ("resampled")
+RESAMPLE_STREAMS = False
 
 # Visualiser setup -> that's the Three.js app
 # Queue for interacting with the visualiser
@@ -36,23 +56,6 @@ browser_frame = None
 # Inspector setup
 emg_inspector_window = None
 
-# Myo setup
-q_myo = multiprocessing.Queue()
-q_myo_imu = multiprocessing.Queue()
-
-# MANUS setup
-q_manus = multiprocessing.Queue()
-
-# Global socket for Unity communication
-
-unity_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-unity_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-interfaces = socket.getaddrinfo(
-    host=socket.gethostname(), port=None, family=socket.AF_INET
-)
-allips = [ip[-1][0] for ip in interfaces]
-# allips.append("127.0.0.1")
-
 
 def visualiser_process(q_visualiser):
     # Run the visualiser: the command is 'npm run dev' and the working directory is the visualiser path
@@ -162,6 +165,8 @@ class GestureDetail(tk.Frame):
         self.session_id = session_id
         self.gesture = gesture
         self.root = root
+        # Listbox entry -> recording filename
+        self.recording_files = {}
 
         self.create_widgets()
         self.pack_configure(padx=10, pady=10, fill=tk.BOTH, expand=True)
@@ -231,6 +236,16 @@ class GestureDetail(tk.Frame):
         )
 
         self.user_cancelled = False
+        # Current take, see start_new_recording
+        self.state = IDLE
+        self.state_started = 0
+        self.take = None
+        self.step_job = None
+        self.release_job = None
+        self.phase_durations = {}
+        self.daemon = None
+        # A take doesn't outlive its widget
+        self.bind("<Destroy>", self.on_destroy)
 
         # Load sessions for this gesture
         self.load_recordings()
@@ -267,6 +282,30 @@ class GestureDetail(tk.Frame):
             borderwidth=1,
         )
         self.fast_recording_button.pack_configure(side=LEFT, ipadx=30, pady=(5, 0))
+
+        # Continuous mode: record the whole gesture block and split it into trials afterwards
+        self.block_mode = tk.BooleanVar(value=False)
+        self.block_mode_checkbox = tk.Checkbutton(
+            self,
+            text="Continuous block",
+            variable=self.block_mode,
+            bg=self.root.colour_config["bg"],
+            fg=self.root.colour_config["fg"],
+        )
+        self.block_mode_checkbox.pack_configure(side=LEFT, padx=10, pady=(5, 0))
+        self.user_finished_block = False
+        self.finish_block_button = tk.Button(
+            self,
+            text="Finish Block",
+            command=self.finish_block,
+            bg="#2ecc71",
+            fg=self.root.colour_config["fg"],
+            relief=tk.RIDGE,
+            borderwidth=1,
+        )
+        # Hide button by default
+        self.finish_block_button.pack_forget()
+
         self.stop_recording_button = tk.Button(
             self,
             text="Stop Recording",
@@ -285,6 +324,11 @@ class GestureDetail(tk.Frame):
         )
         # Hide the progress bar
         self.progressbar.pack_forget()
+        # Phase of the current take and how long it has been in it
+        self.state_label = tk.Label(
+            self, text="", bg=self.root.colour_config["bg"], fg=self.root.colour_config["fg"]
+        )
+        self.state_label.pack_forget()
 
     def load_recordings(self):
         # Get the session folder path
@@ -299,17 +343,21 @@ class GestureDetail(tk.Frame):
         if not os.path.exists(gesture_folder):
             return
 
-        # Find all CSV files in the session folder
+        # Find all recordings in the session folder, the .semg where a recording was also exported to CSV
+        catalog = get_catalog()
+        catalog.refresh(f"u_{self.user_id}", f"s_{self.session_id}", f"g_{self.gesture}")
         recording_files = [
-            f
-            for f in os.listdir(gesture_folder)
-            if os.path.isfile(os.path.join(gesture_folder, f)) and f.endswith(".csv")
+            recording["filename"]
+            for recording in catalog.recordings(
+                [f"u_{self.user_id}"], [f"s_{self.session_id}"], [f"g_{self.gesture}"]
+            )
         ]
+        self.recording_files = {recording_stem(f): f for f in recording_files}
 
         # For each recording file, extract information and add it to the listbox
         for recording_file in recording_files:
             # Extract the filename
-            filename = recording_file.split(".csv")[0]
+            filename = recording_stem(recording_file)
 
             # Add the recording information to the listbox
             # You can modify this to display additional information from the CSV file
@@ -323,10 +371,9 @@ class GestureDetail(tk.Frame):
         )
 
     def show_visualisation(self):
-        filename = (
+        filename = self.recording_files[
             self.recordings_listbox.get(self.recordings_listbox.curselection()[0])
-            + ".csv"
-        )
+        ]
         # Get full absolute path
         filename = get_user_data_path(
             f"u_{self.user_id}", f"s_{self.session_id}", f"g_{self.gesture}", filename
@@ -356,200 +403,297 @@ class GestureDetail(tk.Frame):
             f"u_{self.user_id}", f"s_{self.session_id}", f"g_{self.gesture}"
         )
         # Get the selected filename
-        selected_filename = self.recordings_listbox.get(selected_index[0]) + ".csv"
+        selected_filename = self.recording_files[self.recordings_listbox.get(selected_index[0])]
+        selected_path = os.path.join(session_folder, selected_filename)
+        # External tools only know the CSV schema, so .semg recordings are opened as a temporary CSV export
+        if selected_filename.endswith(SEMG_SUFFIX):
+            selected_path = export_csv(
+                selected_path, os.path.join(tempfile.gettempdir(), recording_stem(selected_filename) + CSV_SUFFIX)
+            )
         # Open the selected recording file
-        os.startfile(os.path.join(session_folder, selected_filename))
+        os.startfile(selected_path)
 
     def start_new_recording(self, speed: str = "medium"):
-        # Show stop recording button
+        # One take at a time, across all gestures and the protocol runner - they share the one recorder
+        if self.state != IDLE:
+            return
+        self.daemon = get_acquisition_daemon()
+        if not self.daemon.claim(self):
+            msgbox.showinfo("Recording", "Another take is still running, wait for it to finish.")
+            return
+
+        self.take = {
+            "speed": speed,
+            "block": self.block_mode.get(),
+            # Longer recording for melody
+            "length": 20 if self.gesture == "melody" else RECORDING_LENGTH,
+            "netz_take": None,
+            "netz_timed_out": False,
+            "worker_failed": False,
+        }
+        self.phase_durations = {}
+
+        # Show stop recording button, it also cancels connecting
+        if self.take["block"]:
+            self.finish_block_button.pack_configure(side=LEFT, ipadx=30, pady=(5, 0))
         self.stop_recording_button.pack_configure(side=LEFT, ipadx=30, pady=(5, 0))
         self.user_cancelled = False
+        self.user_finished_block = False
 
-        # If we're doing XRMI gestures we need to notify Netz
-        if self.gesture in XRMI_GESTURES:
-            # Message content is the name of the gesture (self.gesture)
-            message = self.gesture.encode("utf-8")
-
-            for ip in allips:
-                print(f"sending on {ip}")
-                sock = socket.socket(
-                    socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP
-                )  # UDP
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-                sock.bind((ip, 0))
-                sock.sendto(message, ("255.255.255.255", 11000))
-                sock.close()
-
-            # Sleep for a bit until Unity got the message
-            time.sleep(1)
-
-        # Helper q to terminate the recording
-        self.q_terminate = multiprocessing.Queue()
-        # Helper q to check if the myo is ready
-        # Only when the myo is ready, the recording will start
-        q_myo_ready = multiprocessing.Queue()
-
-        # Clear all queues
-        q_myo.empty()
-        q_myo_imu.empty()
-        q_manus.empty()
-
-        # Start a new recording
-        start_recording(q_myo, q_myo_imu, q_manus, self.q_terminate, q_myo_ready)
-
-        # Wait for myo to be ready
-        while q_myo_ready.empty() and self.q_terminate.empty():
-            time.sleep(0.01)
+        # The daemon keeps the devices connected between takes, only the first take pays for the setup
+        self.daemon.start()
 
-        # Colour background of the status bar to indicate that the recording is in progress
-        self.root.status_bar.config(bg="#EA2027")
-
-        # Show progress bar
+        # Show progress bar, it has no fixed length until the take is armed
         self.progressbar["value"] = 0
+        self.progressbar.config(mode="indeterminate")
         self.progressbar.pack_configure(pady=(5, 0))
+        self.progressbar.start()
+        self.state_label.pack_configure()
 
-        # Start the recording
-        RECORDING_LENGTH = 10
-        WARMUP_LENGTH = 1
-        # MYO_SR = 50
-        MYO_SR = 200
+        self.set_state(CONNECTING)
+        self.step_job = self.root.scheduler.every(POLL_MS, self.step, name=f"take_{self.gesture}")
 
-        q_netz_finished = multiprocessing.Queue()
+    def set_state(self, state):
+        """
+        Move the take to its next phase and keep track of how long each phase took.
+        """
+        now = time.perf_counter()
+        if self.state != IDLE:
+            self.phase_durations[self.state] = now - self.state_started
+        self.state = state
+        self.state_started = now
 
-        # Open lambda new thread to check if Netz sent the recording finished signal
+    def step(self):
+        """
+        Advance the current take, runs every POLL_MS on the Tk loop until the take is over - the UI never blocks.
+        """
+        {
+            CONNECTING: self.step_connecting,
+            WARMING: self.step_warming,
+            RECORDING: self.step_recording,
+            FINALISING: self.step_finalising,
+        }[self.state]()
+
+        if self.state not in (IDLE, DISCONNECTING):
+            self.state_label.config(text=f"{self.state.capitalize()} {time.perf_counter() - self.state_started:.1f} s")
+
+    def step_connecting(self):
+        if self.daemon.check_error() is not None:
+            self.fail(self.daemon.check_error())
+        elif self.user_cancelled:
+            # Abort the connection attempt, the next take starts over
+            self.disconnect()
+        elif self.daemon.is_connected():
+            self.set_state(WARMING)
+
+    def step_warming(self):
+        # Wait for myo to be warmed up - only takes time on the first take of a session - and for Netz to play
+        if self.daemon.check_error() is not None:
+            self.fail(self.daemon.check_error())
+            return
+        if self.user_cancelled:
+            self.end_take()
+            return
+        if not self.daemon.is_ready():
+            return
+        # XRMI gestures: Netz only gets the gesture once the streams are warm, so it can't start playing
+        # before the recorder can arm. The take is armed once Netz plays it
         if self.gesture in XRMI_GESTURES:
-            p = multiprocessing.Process(
-                target=netz_connector.listen_for_netz_finished_process,
-                args=(q_netz_finished,),
-            )
-            p.start()
+            if self.take["netz_take"] is None:
+                self.take["netz_take"] = netz_connector.get_netz_signalling().start_take(self.gesture)
+            if not self.take["netz_take"].is_started():
+                return
 
-        if self.gesture == "melody":
-            # Longer recording for melody
-            RECORDING_LENGTH = 20
-
-        def check_terminate():
-            if not self.user_cancelled:
-                # Update progress bar
-                self.progressbar["value"] = (
-                    q_myo.qsize() / (MYO_SR * (WARMUP_LENGTH + RECORDING_LENGTH)) * 100
-                )
+        # Arm the recorder - the streams are warm already, so the take starts right now
+        gesture_folder = get_user_data_path(
+            f"u_{self.user_id}", f"s_{self.session_id}", f"g_{self.gesture}"
+        )
+        self.daemon.arm(
+            gesture_folder,
+            self.take["speed"],
+            pre_roll=PRE_ROLL_LENGTH,
+            resample=RESAMPLE_STREAMS,
+            block=self.take["block"],
+        )
 
-                if self.gesture in XRMI_GESTURES:
-                    # Check if Netz sent the recording finished signal
-                    if q_netz_finished.empty():
-                        return
-                else:
-                    # Normal, check if the recording time is up
-                    if q_myo.qsize() < MYO_SR * (WARMUP_LENGTH + RECORDING_LENGTH):
+        # Colour background of the status bar to indicate that the recording is in progress
+        self.root.status_bar.config(bg="#EA2027")
+        # A block has no fixed length
+        if not self.take["block"]:
+            self.progressbar.stop()
+            self.progressbar.config(mode="determinate")
+            self.progressbar["value"] = 0
+        self.set_state(RECORDING)
+
+    def step_recording(self):
+        # A worker failing puts its error into the daemon's terminate queue
+        self.take["worker_failed"] = self.daemon.check_error() is not None
+
+        if not self.user_cancelled and not self.take["worker_failed"]:
+            # Update progress bar and the live stream rates
+            self.root.show_stream_rates(self.daemon.bus.stream_rates())
+
+            if self.take["block"]:
+                # A block runs until the operator finishes it
+                if not self.user_finished_block:
+                    return
+            elif self.take["netz_take"] is not None:
+                # Check if Netz sent the recording finished signal
+                netz_take = self.take["netz_take"]
+                if not netz_take.is_finished():
+                    if not netz_take.is_timed_out():
                         return
+                    self.take["netz_timed_out"] = True
+            else:
+                # Normal, check if the recording time is up
+                self.progressbar["value"] = self.daemon.seconds_since_arm() / self.take["length"] * 100
+                if self.daemon.seconds_since_arm() < self.take["length"]:
+                    return
+
+        # Mark the end of the take, the recorder keeps it unless it was cancelled
+        self.daemon.disarm(
+            keep=not self.user_cancelled and not self.take["worker_failed"] and not self.take["netz_timed_out"]
+        )
+        self.set_state(FINALISING)
+
+    def step_finalising(self):
+        # The recorder only has to align and write the last few samples (and split a block)
+        result = self.daemon.poll_result()
+        if result is None:
+            if self.daemon.check_error() is None:
+                return
+            # The recorder itself may be gone, don't wait for it
+            result = {"path": None, "paths": [], "rows": 0}
+
+        # Colour background of the status bar to indicate that the recording is finished
+        self.root.status_bar.config(bg=self.root.status_bar_bg)
+        self.root.show_stream_rates(None)
+        # Hide the take controls before any dialog, the take is over.
+        # A worker failed -> disconnect, the next take reconnects
+        error = self.daemon.check_error()
+        if error is not None and result["path"] is None and not (self.take["block"] and result["rows"] > 0):
+            self.disconnect()
+        else:
+            self.end_take()
 
-            # Stop timer
-            repeating_timer.stop()
-
-            # Terminate the recording
-            self.q_terminate.put(True)
-
-            # Get data from our queues
-            emg_data = []
-            imu_data = []
-            manus_data = []
-
-            while not q_myo.empty():
-                current = q_myo.get()
-                emg_data.append(current)
-
-            while not q_myo_imu.empty():
-                current = q_myo_imu.get()
-                imu_data.append(current)
+        if self.take["block"] and result["rows"] > 0:
+            # Display how many trials were found in the block
+            msgbox.showinfo(
+                "Block Finished",
+                f"Block split into {len(result['paths'])} recordings.",
+            )
+        elif result["path"] is not None:
+            # Display a confirmation message
+            recording_filename = os.path.basename(result["path"])
+            msgbox.showinfo(
+                "Recording Finished", f"Recording saved as {recording_filename}"
+            )
+        elif error is not None:
+            # A worker failed -> display error dialog box
+            msgbox.showerror("Recording Error", error)
+        elif self.take["netz_timed_out"]:
+            msgbox.showerror(
+                "Recording Error",
+                f"Netz didn't finish the gesture within {netz_connector.NETZ_FINISH_TIMEOUT} s, the take was discarded.",
+            )
+        elif self.user_cancelled:
+            # User cancelled the recording -> display a message
+            msgbox.showinfo("Recording Cancelled", "Recording was cancelled.")
+        else:
+            # Recording empty -> display error dialog box
+            msgbox.showerror("Recording Error", "No data was recorded.")
 
-            while not q_manus.empty():
-                current = q_manus.get()
-                manus_data.append(current)
+        # Update the recordings listbox
+        self.load_recordings()
+        # Update total number of datapoints
+        self.root.update_total_datapoints()
 
-            # Now, for each data point in q_myo find the corresponding data point in q_manus - the one with
-            # the closest timestamp
-            recording = []
-            time_diffs_myo_imu = []
-            time_diffs_myo_manus = []
-            for emg in emg_data:
-                timestamp = emg[-1]
+    def fail(self, error):
+        # Disconnect, the next take will try to connect again. This stops the step job first,
+        # Tk keeps running it while the dialog is open
+        self.disconnect()
+        msgbox.showerror("Recording Error", error)
 
-                # Find the closest timestamp in the imu data
-                closest_imu = min(imu_data, key=lambda x: abs(x[-1] - timestamp))
-                time_diffs_myo_imu.append(abs(closest_imu[-1] - timestamp))
+    def disconnect(self):
+        """
+        Shut the devices down after a failed or cancelled take. That waits for the workers to exit,
+        so it runs in the background and the take controls show it until the take is over.
+        """
+        self.root.scheduler.cancel(self.step_job)
+        self.set_state(DISCONNECTING)
+        self.stop_recording_button.pack_forget()
+        self.finish_block_button.pack_forget()
+        self.state_label.config(text="Disconnecting...")
+        self.root.scheduler.run_in_background(self.daemon.shutdown, on_done=self.on_disconnected)
+
+    def on_disconnected(self, result):
+        # The widget may be gone by now, e.g. another user was loaded
+        if self.winfo_exists():
+            self.end_take()
+        else:
+            self.daemon.release(self)
 
-                # Find the closest timestamp in the manus data
-                closest_manus = min(manus_data, key=lambda x: abs(x[-1] - timestamp))
-                time_diffs_myo_manus.append(abs(closest_manus[-1] - timestamp))
+    def end_take(self):
+        """
+        Back to idle: hide the take controls, hand the daemon back and report how long each phase took.
+        """
+        self.set_state(IDLE)
+        self.root.scheduler.cancel(self.step_job)
+        self.daemon.release(self)
+        print(
+            f"Take of {self.gesture}: "
+            + ", ".join(f"{state} {seconds:.2f} s" for state, seconds in self.phase_durations.items())
+            + f", step jitter {self.step_job.jitter}"
+        )
 
-                recording.append(emg[:-1] + closest_imu[:-1] + closest_manus[:-1])
+        # Hide progress bar
+        self.progressbar.stop()
+        self.progressbar.config(mode="determinate")
+        self.progressbar.pack_forget()
+        self.state_label.pack_forget()
+        # Hide the stop recording button
+        self.stop_recording_button.pack_forget()
+        self.finish_block_button.pack_forget()
 
-            # Ditch the first 1s of data points (warmup)
-            recording = recording[MYO_SR:]
+    def on_destroy(self, event):
+        """
+        The widget is destroyed while its take runs, e.g. when another user is loaded: cancel the take and hand
+        the daemon back once the recorder confirmed, so the next take doesn't get this take's result.
+        """
+        if event.widget is not self or self.state in (IDLE, DISCONNECTING):
+            return
+        self.root.scheduler.cancel(self.step_job)
+        # The app disconnected already when it is closing
+        if not self.daemon.is_running():
+            self.daemon.release(self)
+            return
+        self.root.status_bar.config(bg=self.root.status_bar_bg)
+        self.root.show_stream_rates(None)
+        if self.state == RECORDING:
+            self.daemon.disarm(keep=False)
+        elif self.state != FINALISING:
+            # Not armed yet, the devices keep connecting for the next take
+            self.daemon.release(self)
+            return
+        self.release_job = self.root.scheduler.every(POLL_MS, self.release_after_result)
 
-            print(
-                f"Matched {len(recording)} EMG data points with {len(manus_data)} hand pose samples."
-            )
-            avg_time_diff_imu = float("{:.2f}".format(np.mean(time_diffs_myo_imu)))
-            avg_time_diff_manus = float("{:.2f}".format(np.mean(time_diffs_myo_manus)))
-            print(f"Average time difference myo-imu: {avg_time_diff_imu} ms")
-            print(f"Average time difference myo-manus: {avg_time_diff_manus} ms")
-
-            # Colour background of the status bar to indicate that the recording is finished
-            self.root.status_bar.config(bg=self.root.status_bar_bg)
-
-            # Save recording if it's not empty
-            if recording and not self.user_cancelled:
-                # Generate a unique filename for the recording
-                now = datetime.datetime.now().strftime("%d_%m_%Y_%H_%M_%S")
-                recording_filename = f"recording_{speed}_{now}.csv"
-                # Get the session folder path
-                session_folder = get_user_data_path(
-                    f"u_{self.user_id}", f"s_{self.session_id}", f"g_{self.gesture}"
-                )
-                # Create the recording file
-                recording_path = os.path.join(session_folder, recording_filename)
-                os.makedirs(session_folder, exist_ok=True)
-
-                np.savetxt(
-                    recording_path,
-                    np.array(recording, dtype=float),
-                    delimiter=",",
-                    header=DATA_CSV_HEADER_STR,
-                )
-                # Display a confirmation message
-                msgbox.showinfo(
-                    "Recording Finished", f"Recording saved as {recording_filename}"
-                )
-            else:
-                if self.user_cancelled:
-                    # User cancelled the recording -> display a message
-                    msgbox.showinfo("Recording Cancelled", "Recording was cancelled.")
-                else:
-                    # Retrieve error string from q_terminate (2nd element in the queue)
-                    error = self.q_terminate.get()
-                    # Recording empty -> display error dialog box
-                    msgbox.showerror("Recording Error", error)
-
-            # Hide progress bar
-            self.progressbar.pack_forget()
-            # Update the recordings listbox
-            self.load_recordings()
-            # Update total number of datapoints
-            self.root.update_total_datapoints()
-            # Hide the stop recording button
-            self.stop_recording_button.pack_forget()
-            self.user_cancelled = False
-
-        # Start a repeating timer to check if the recording is finished
-        repeating_timer = RepeatedTimer(0.1, check_terminate)
+    def release_after_result(self):
+        if self.daemon.poll_result() is None and self.daemon.check_error() is None:
+            return
+        self.root.scheduler.cancel(self.release_job)
+        if self.daemon.check_error() is None:
+            self.daemon.release(self)
+        else:
+            self.root.scheduler.run_in_background(self.daemon.shutdown, on_done=lambda result: self.daemon.release(self))
 
     def stop_recording(self):
-        # Terminate the recording
-        self.q_terminate.put(True)
+        # Cancel the recording, the devices stay connected for the next take
         self.user_cancelled = True
 
+    def finish_block(self):
+        # End the continuous block, it is split into trials and saved
+        self.user_finished_block = True
+
     def get_normalised_path(self):
         # Get the selected recording index
         selected_index = self.recordings_listbox.curselection()
@@ -561,7 +705,7 @@ class GestureDetail(tk.Frame):
             f"u_{self.user_id}", f"s_{self.session_id}", f"g_{self.gesture}"
         )
         # Get the selected filename
-        selected_filename = self.recordings_listbox.get(selected_index[0]) + ".csv"
+        selected_filename = self.recording_files[self.recordings_listbox.get(selected_index[0])]
         # Create full path
         selected_filename = os.path.join(session_folder, selected_filename)
         # Normalize the file path
@@ -572,17 +716,24 @@ class GestureDetail(tk.Frame):
         # Get selected item index
         selected_index = self.recordings_listbox.curselection()
         if selected_index:
-            selected_filename = self.recordings_listbox.get(selected_index[0]) + ".csv"
+            selected_filename = self.recording_files[self.recordings_listbox.get(selected_index[0])]
             # Ask for confirmation
             if msgbox.askyesno(
                 "Delete recording for gesture",
                 f"Are you sure you want to delete recording {selected_filename}?",
             ):
-                # Delete the csv file
+                # Delete the recording, and its CSV export if it has one
                 session_folder = get_user_data_path(
                     f"u_{self.user_id}", f"s_{self.session_id}", f"g_{self.gesture}"
                 )
-                send2trash.send2trash(os.path.join(session_folder, selected_filename))
+                for suffix in RECORDING_SUFFIXES:
+                    path = os.path.join(session_folder, recording_stem(selected_filename) + suffix)
+                    if os.path.exists(path):
+                        send2trash.send2trash(path)
+                # The telemetry sidecar goes with its recording
+                sidecar = telemetry_path(os.path.join(session_folder, selected_filename))
+                if os.path.exists(sidecar):
+                    send2trash.send2trash(sidecar)
                 # os.remove(os.path.join(session_folder, selected_filename))
 
                 # Delete the selected item from listbox
@@ -0,0 +1,302 @@
+import tkinter as tk
+import tkinter.messagebox as msgbox
+from tkinter import ttk
+
+from acquisition.protocol import protocol_trials
+from config import FONT, get_user_data_path
+from constants import XRMI_GESTURES
+from myo.data_collection import get_acquisition_daemon
+from networking import netz_connector
+
+# How often the runner checks on the devices and the current take
+POLL_MS = 50
+
+
+class ProtocolRunner(tk.Toplevel):
+    """
+    Records all takes of a protocol back to back over the warm acquisition daemon:
+    countdown, take, rest, next take. Every step is scheduled with after() on the Tk main loop,
+    so the window stays responsive and there is no dead time beyond the scripted countdown and rest.
+    """
+
+    def __init__(self, root, user_id, session_id, protocol, on_take_saved=None):
+        """
+        :param protocol: protocol as returned by acquisition.protocol.load_protocol
+        :param on_take_saved: called with the gesture name after every saved take
+        """
+        super().__init__(root)
+        self.root = root
+        self.user_id = user_id
+        self.session_id = session_id
+        self.protocol_script = protocol
+        self.on_take_saved = on_take_saved
+
+        self.trials = protocol_trials(protocol)
+        self.index = 0
+        self.saved = 0
+        self.failed = 0
+
+        self.daemon = get_acquisition_daemon()
+        self.is_paused = False
+        self.is_aborted = False
+        self.is_recording = False
+        self.netz_timed_out = False
+        self.netz_take = None
+        # The devices are shut down in the background after a failure, the window closes once that is done
+        self.is_disconnecting = False
+        # Pending after() job, cancelled on close
+        self.job = None
+
+        self.title(f"Protocol - User {user_id}, Session {session_id}")
+        self.configure(bg=root.colour_config["bg"])
+        # A manual take shares the recorder, the protocol waits until it is over
+        if not self.daemon.claim(self):
+            msgbox.showinfo("Run Protocol", "A take is still running, wait for it to finish.", parent=root)
+            self.destroy()
+            return
+        self.create_widgets()
+        self.protocol("WM_DELETE_WINDOW", self.abort)
+        # No manual takes while the protocol runs
+        self.grab_set()
+
+        self.daemon.start()
+        self.schedule(POLL_MS, self.wait_for_devices)
+
+    def create_widgets(self):
+        bg = self.root.colour_config["bg"]
+        fg = self.root.colour_config["fg"]
+
+        self.trial_label = tk.Label(self, text="", font=(FONT, 16), bg=bg, fg=fg)
+        self.trial_label.pack(padx=20, pady=(20, 5))
+        self.countdown_label = tk.Label(self, text="", font=(FONT, 48), bg=bg, fg=fg)
+        self.countdown_label.pack(padx=20, pady=5)
+        self.status_label = tk.Label(self, text="Connecting devices...", font=(FONT, 12), bg=bg, fg=fg)
+        self.status_label.pack(padx=20, pady=5)
+
+        tk.Label(self, text="Take", bg=bg, fg=fg).pack()
+        self.take_progressbar = ttk.Progressbar(self, orient=tk.HORIZONTAL, length=400, mode="determinate")
+        self.take_progressbar.pack(padx=20, pady=(0, 5))
+        tk.Label(self, text="Protocol", bg=bg, fg=fg).pack()
+        self.protocol_progressbar = ttk.Progressbar(self, orient=tk.HORIZONTAL, length=400, mode="determinate")
+        self.protocol_progressbar.pack(padx=20, pady=(0, 10))
+
+        button_frame = tk.Frame(self, bg=bg)
+        button_frame.pack(pady=(0, 20))
+        self.pause_button = tk.Button(
+            button_frame, text="Pause", command=self.toggle_pause, bg=bg, fg=fg, relief=tk.RIDGE, borderwidth=1
+        )
+        self.pause_button.pack(side=tk.LEFT, ipadx=30, padx=5)
+        tk.Button(
+            button_frame, text="Abort", command=self.abort, bg="#e74c3c", fg=fg, relief=tk.RIDGE, borderwidth=1
+        ).pack(side=tk.LEFT, ipadx=30, padx=5)
+
+    def schedule(self, delay_ms, callback):
+        self.job = self.after(delay_ms, callback)
+
+    def wait_for_devices(self):
+        if self.daemon.check_error() is not None:
+            self.fail(self.daemon.check_error())
+            return
+        if self.is_aborted:
+            self.close()
+            return
+        if not self.daemon.is_ready():
+            self.status_label.config(text="Warming up..." if self.daemon.is_connected() else "Connecting devices...")
+            self.schedule(POLL_MS, self.wait_for_devices)
+            return
+        self.start_trial()
+
+    def start_trial(self):
+        if self.is_aborted:
+            self.close()
+            return
+        if self.index >= len(self.trials):
+            self.finish()
+            return
+
+        trial = self.trials[self.index]
+        self.trial_label.config(
+            text=f"{self.index + 1}/{len(self.trials)}: {trial['gesture']} - {trial['speed']}"
+        )
+        self.protocol_progressbar["value"] = self.index / len(self.trials) * 100
+        self.take_progressbar["value"] = 0
+        self.status_label.config(text="Get ready")
+        self.netz_take = None
+
+        countdown = self.protocol_script["countdown"]
+        if trial["gesture"] in XRMI_GESTURES:
+            # Netz needs a head start to play the gesture
+            countdown = max(countdown, netz_connector.NETZ_STARTUP_DELAY)
+        self.countdown(countdown)
+
+    def countdown(self, remaining):
+        if self.is_aborted:
+            self.close()
+            return
+        # Once Netz has the gesture it plays it whether we wait or not, the take goes ahead and the pause
+        # holds the protocol before the next one
+        if self.is_paused and self.netz_take is None:
+            self.status_label.config(text="Paused")
+            self.schedule(POLL_MS, lambda: self.countdown(remaining))
+            return
+
+        trial = self.trials[self.index]
+        if trial["gesture"] in XRMI_GESTURES and remaining == netz_connector.NETZ_STARTUP_DELAY:
+            # Netz gets the gesture so that it starts playing it as the countdown ends
+            self.netz_take = netz_connector.get_netz_signalling().start_take(trial["gesture"])
+
+        if remaining <= 0:
+            self.countdown_label.config(text="")
+            self.wait_for_netz()
+            return
+
+        self.status_label.config(text="Pausing after this take" if self.is_paused else "Get ready")
+        self.countdown_label.config(text=str(remaining))
+        self.schedule(1000, lambda: self.countdown(remaining - 1))
+
+    def wait_for_netz(self):
+        if self.is_aborted:
+            self.close()
+            return
+        # Netz acknowledges the gesture when it starts playing it
+        if self.trials[self.index]["gesture"] in XRMI_GESTURES and not self.netz_take.is_started():
+            self.status_label.config(text="Waiting for Netz")
+            self.schedule(POLL_MS, self.wait_for_netz)
+            return
+        self.record()
+
+    def record(self):
+        trial = self.trials[self.index]
+        gesture_folder = get_user_data_path(
+            f"u_{self.user_id}", f"s_{self.session_id}", f"g_{trial['gesture']}"
+        )
+        self.daemon.arm(
+            gesture_folder,
+            trial["speed"],
+            pre_roll=self.protocol_script["pre_roll"],
+            resample=self.protocol_script["resample"],
+        )
+        self.is_recording = True
+        self.netz_timed_out = False
+
+        # Colour background of the status bar to indicate that the recording is in progress
+        self.root.status_bar.config(bg="#EA2027")
+        self.status_label.config(text="Recording")
+        self.schedule(POLL_MS, self.check_take)
+
+    def check_take(self):
+        if self.daemon.check_error() is not None:
+            self.fail(self.daemon.check_error())
+            return
+
+        trial = self.trials[self.index]
+        self.root.show_stream_rates(self.daemon.bus.stream_rates())
+
+        if self.is_aborted:
+            is_done = True
+        elif trial["gesture"] in XRMI_GESTURES:
+            # Netz decides when the gesture is over, a take it never finishes is dropped
+            if self.netz_take.is_timed_out():
+                self.netz_timed_out = True
+            is_done = self.netz_take.is_finished() or self.netz_timed_out
+        else:
+            self.take_progressbar["value"] = self.daemon.seconds_since_arm() / trial["length"] * 100
+            is_done = self.daemon.seconds_since_arm() >= trial["length"]
+
+        if not is_done:
+            self.schedule(POLL_MS, self.check_take)
+            return
+
+        self.daemon.disarm(keep=not self.is_aborted and not self.netz_timed_out)
+        self.status_label.config(text="Saving")
+        self.schedule(POLL_MS, self.wait_for_result)
+
+    def wait_for_result(self):
+        result = self.daemon.poll_result()
+        if result is None:
+            if self.daemon.check_error() is not None:
+                self.fail(self.daemon.check_error())
+                return
+            self.schedule(POLL_MS, self.wait_for_result)
+            return
+
+        self.is_recording = False
+        self.root.status_bar.config(bg=self.root.status_bar_bg)
+        self.root.show_stream_rates(None)
+
+        if self.is_aborted:
+            self.close()
+            return
+
+        trial = self.trials[self.index]
+        if result["path"] is not None:
+            self.saved += 1
+            if self.on_take_saved is not None:
+                self.on_take_saved(trial["gesture"])
+        else:
+            self.failed += 1
+            print(f"No data recorded for {trial['gesture']} - {trial['speed']}")
+
+        self.index += 1
+        self.rest(self.protocol_script["rest"])
+
+    def rest(self, remaining):
+        if self.is_aborted:
+            self.close()
+            return
+        if remaining <= 0 or self.index >= len(self.trials):
+            self.start_trial()
+            return
+
+        self.status_label.config(text="Rest")
+        self.countdown_label.config(text=str(remaining))
+        self.schedule(1000, lambda: self.rest(remaining - 1))
+
+    def toggle_pause(self):
+        # Pausing holds the protocol before the next take, a running take is always completed,
+        # as is one whose gesture Netz was already sent
+        self.is_paused = not self.is_paused
+        self.pause_button.config(text="Resume" if self.is_paused else "Pause")
+
+    def abort(self):
+        if self.is_disconnecting:
+            return
+        self.is_aborted = True
+        if not self.is_recording:
+            self.close()
+        # Otherwise check_take cancels the take and closes the window once the recorder confirmed
+
+    def fail(self, error):
+        self.is_recording = False
+        self.root.status_bar.config(bg=self.root.status_bar_bg)
+        self.root.show_stream_rates(None)
+        # Disconnect in the background, the next take will try to connect again.
+        # The window stays up and keeps the daemon until that is done
+        self.is_disconnecting = True
+        self.status_label.config(text="Disconnecting...")
+        self.root.scheduler.run_in_background(self.daemon.shutdown, on_done=self.on_disconnected)
+        # Not parented to the window, it closes on its own while the dialog is still open
+        msgbox.showerror("Protocol Error", error, parent=self.root)
+
+    def on_disconnected(self, result):
+        if self.winfo_exists():
+            self.close()
+        else:
+            self.daemon.release(self)
+
+    def finish(self):
+        self.protocol_progressbar["value"] = 100
+        msgbox.showinfo(
+            "Protocol Finished",
+            f"{self.saved} recordings saved, {self.failed} takes without data.",
+            parent=self,
+        )
+        self.close()
+
+    def close(self):
+        if self.job is not None:
+            self.after_cancel(self.job)
+            self.job = None
+        self.daemon.release(self)
+        self.grab_release()
+        self.destroy()
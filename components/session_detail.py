@@ -1,11 +1,14 @@
 import os
 import tkinter as tk
+import tkinter.filedialog as filedialog
 import tkinter.messagebox as msgbox
-from tkinter import RIGHT
+from tkinter import LEFT, RIGHT
 
 import send2trash
 
+from acquisition.protocol import load_protocol, protocol_duration, protocol_trials
 from components.gesture_detail import GestureDetail
+from components.protocol_runner import ProtocolRunner
 from config import FONT, get_user_data_path
 from constants import GESTURES
 
@@ -17,6 +20,7 @@ class SessionDetail(tk.Frame):
         self.session_id = session_id
         self.root = root
         self.is_recording = False
+        self.gesture_details = {}
 
         self.create_widgets()
         self.pack_configure(padx=10, pady=10, fill=tk.BOTH, expand=True)
@@ -33,6 +37,12 @@ class SessionDetail(tk.Frame):
                                                fg='white',
                                                relief=tk.RIDGE, borderwidth=1)
         self.delete_session_button.pack_configure(side=RIGHT, ipadx=10, pady=(0, 0))
+        tk.Button(top_frame,
+                  text="Run Protocol",
+                  command=self.run_protocol,
+                  bg=self.root.colour_config["bg"],
+                  fg=self.root.colour_config["fg"],
+                  relief=tk.RIDGE, borderwidth=1).pack_configure(side=LEFT, ipadx=10)
 
         # Create two frames for the two columns
         left_frame = tk.Frame(self, name="testoo", bg=self.root.colour_config["bg"])
@@ -51,8 +61,32 @@ class SessionDetail(tk.Frame):
             else:
                 gesture_detail = GestureDetail(right_frame, self.user_id, self.session_id, gesture, self.root)
                 gesture_detail.pack(fill='x', anchor='nw', expand=True)
+            self.gesture_details[gesture] = gesture_detail
 
 
+    def run_protocol(self):
+        # Cancelling the file dialog runs the full session
+        path = filedialog.askopenfilename(
+            title="Choose a protocol script (cancel for the full session)",
+            filetypes=[("Protocol", "*.json")],
+        )
+        try:
+            protocol = load_protocol(path or None)
+        except (OSError, ValueError) as e:
+            msgbox.showerror("Protocol Error", str(e))
+            return
+
+        minutes = protocol_duration(protocol) / 60
+        if not msgbox.askyesno(
+            "Run Protocol",
+            f"Record {len(protocol_trials(protocol))} takes (at least {minutes:.0f} min) in session {self.session_id}?",
+        ):
+            return
+        ProtocolRunner(self.root, self.user_id, self.session_id, protocol, on_take_saved=self.on_take_saved)
+
+    def on_take_saved(self, gesture):
+        self.gesture_details[gesture].load_recordings()
+        self.root.update_total_datapoints()
 
     def delete_session(self):
         # Ask for confirmation
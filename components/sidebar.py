@@ -4,6 +4,7 @@ import tkinter.messagebox as msgbox
 from tkinter import simpledialog, ttk
 
 from config import FONT, ensure_user_data_dir, get_user_data_path, user_data_dir_exists
+from dataset.catalog import get_catalog
 
 
 class Sidebar(tk.Frame):
@@ -65,23 +66,23 @@ class Sidebar(tk.Frame):
         if not user_data_dir_exists():
             return
 
-        user_folders = [
-            folder
-            for folder in os.listdir(get_user_data_path())
-            if folder.startswith("u_")
-        ]
-        for folder in sorted(user_folders, key=lambda x: int(x.split("_")[1])):
+        # Users in order of their ID, from the dataset catalog
+        catalog = get_catalog()
+        catalog.refresh()
+        # Folder -> name of all users in one query
+        users = catalog.users()
+        for folder, name in users.items():
             user_id = folder.split("_")[1]
-            user_name = self.get_user_name(folder)
+            user_name = "Unknown" if name is None else name
             # self.listbox.insert(tk.END, f"ID {user_id} - {user_name}")
             self.listbox.insert(tk.END, f"ID {user_id}")
 
     def get_user_name(self, folder):
-        name_path = get_user_data_path(folder, "name.txt")
-        if os.path.exists(name_path):
-            with open(name_path, "r") as name_file:
-                return name_file.read().strip()
-        return "Unknown"
+        # Only this user's folder is refreshed, name.txt may have been edited since load_users
+        catalog = get_catalog()
+        catalog.refresh(folder)
+        name = catalog.users().get(folder)
+        return "Unknown" if name is None else name
 
     def on_select(self, event):
         selected_index = self.listbox.curselection()
@@ -110,12 +111,9 @@ class Sidebar(tk.Frame):
         if not user_data_dir_exists():
             return 0
 
-        existing_ids = [
-            int(folder[2:])
-            for folder in os.listdir(get_user_data_path())
-            if folder.startswith("u_")
-        ]
-        return 0 if not existing_ids else max(existing_ids) + 1
+        catalog = get_catalog()
+        catalog.refresh()
+        return catalog.next_user_id()
 
     def create_new_user_folder(self, user_id, user_name):
         ensure_user_data_dir()
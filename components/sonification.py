@@ -4,30 +4,31 @@ import time
 import tkinter as tk
 from queue import Queue
 from tkinter import ttk
+from tkinter.filedialog import askopenfilename
 
-import helpers
-from config import FONT
+from acquisition.replay import REPLAY_SPEEDS, worker_replay
+from acquisition.ring_buffer import StreamBus
+from acquisition.supervisor import stop_processes
+from config import FONT, get_user_data_path
 from constants import DATA_LEN
+from myo.data_collection import get_acquisition_daemon
 from myo.worker_myo import worker_myo
 
 
-def worker_myo_receiver_soni(q_myo, q_myo_imu, q_terminate):
+def worker_myo_receiver_soni(bus, q_terminate):
     """
     Receive processed myo data and send it to INFERENCE
-    :param q_myo: sEMG signals
+    :param bus: StreamBus the Myo worker writes sEMG signals to
     :param q_terminate:
     :return:
     """
     last_imu = None
 
     while q_terminate.empty():
-        while not q_myo.empty():
-            # print("Myo data: ", q_myo.get())
-
-            emg_data = q_myo.get()[:8]
-            # while not q_myo_imu.empty():
-            #     last_imu = q_myo_imu.get()[:10]
-            # emg_data.extend(last_imu)
+        for emg_data in bus.emg.read()["emg"]:
+            # for imu_data in bus.imu.read()["imu"]:
+            #     last_imu = imu_data
+            # emg_data = np.concatenate((emg_data, last_imu))
 
             # Do sonification here
             print(emg_data)
@@ -37,6 +38,7 @@ def worker_myo_receiver_soni(q_myo, q_myo_imu, q_terminate):
         time.sleep(0.001)
 
     # Finish the process
+    bus.close()
     print("Myo sonification worker finished.")
 
 class SonificationFrame(tk.Frame):
@@ -49,13 +51,13 @@ class SonificationFrame(tk.Frame):
 
         self.p_myo = None
         self.p_myo_receiver = None
-        self.q_myo = None
-        self.q_myo_imu = None
+        self.bus = None
         self.q_terminate = None
         self.q_myo_ready = None
 
         self.running = False
         self.should_terminate_sonification = False
+        self.callback_job = None
 
         self.width = 200
         self.height = 400
@@ -90,16 +92,24 @@ class SonificationFrame(tk.Frame):
         self.start_button.config(width=40)
         self.start_button.pack_configure(pady=10, ipady=5, anchor=tk.CENTER)
 
+        # Sonify a recording instead of the Myo
+        replay_frame = tk.Frame(main_frame, bg=self.root.colour_config["bg"])
+        replay_frame.pack_configure(pady=10, anchor=tk.CENTER)
+        self.replay_button = tk.Button(replay_frame, text="Replay Recording", command=self.replay)
+        self.replay_button.config(width=26)
+        self.replay_button.pack_configure(side=tk.LEFT, ipady=5)
+        self.replay_speed = tk.StringVar(value=list(REPLAY_SPEEDS)[0])
+        tk.OptionMenu(replay_frame, self.replay_speed, *REPLAY_SPEEDS).pack_configure(side=tk.LEFT, padx=5)
+
         # Pack the frame
         main_frame.pack_configure(fill='both', expand=False, anchor='nw', padx=20, pady=20)
         #Frame padding 20 px
 
     def myo_callback_loop(self):
 
-        # Get q_myo size and replace points accordingly
-        size = self.q_myo.qsize()
-        for i in range(size):
-            y = self.q_myo.get()[0] # TODO add other EMG channels
+        # Take all new EMG samples and replace points accordingly
+        for emg in self.bus.emg.read()["emg"]:
+            y = int(emg[0]) # TODO add other EMG channels
             # Remove oldest item from list
             self.points.pop(0)
             # Add new item
@@ -109,14 +119,27 @@ class SonificationFrame(tk.Frame):
 
         if self.should_terminate_sonification:
             print("Terminating live sonification")
-            self.repeating_timer.stop()
+            self.root.scheduler.cancel(self.callback_job)
             self.should_terminate_sonification = False
             self.q_terminate.put(True)
 
-            self.p_myo.join(1000)
-            # self.p_myo_receiver.join(1000)
+            stop_processes([self.p_myo])
+
+            self.bus.close()
+            self.bus.unlink()
 
-    def toggle_live_sonification(self):
+    def replay(self):
+        if self.running:
+            return
+        f_path = askopenfilename(
+            initialdir=get_user_data_path(),
+            title="Select Recording to Replay",
+            filetypes=(("Recordings", "*.semg *.csv"), ("All Files", "*.*")),
+        )
+        if f_path:
+            self.toggle_live_sonification(replay_path=f_path)
+
+    def toggle_live_sonification(self, replay_path=None):
         self.running = not self.running
         if not self.running:
             # Update button text
@@ -127,22 +150,29 @@ class SonificationFrame(tk.Frame):
             self.start_button.config(text="Stop Live Sonification")
 
         # Start sonification
-        self.q_myo = multiprocessing.Queue()
-        self.q_myo_imu = multiprocessing.Queue()
+        self.bus = StreamBus()
         self.q_terminate = multiprocessing.Queue()
         self.q_myo_ready = multiprocessing.Queue()
 
-        # Many myo data collection process - same as in data_collection.py
-        self.p_myo = multiprocessing.Process(target=worker_myo,
-                                             args=(self.q_myo, self.q_myo_imu, self.q_terminate, self.q_myo_ready,))
+        if replay_path is None:
+            # The Myo can only be connected once, release it from the recording daemon
+            get_acquisition_daemon().shutdown()
+            # Many myo data collection process - same as in data_collection.py
+            self.p_myo = multiprocessing.Process(target=worker_myo,
+                                                 args=(self.bus, self.q_terminate, self.q_myo_ready,))
+        else:
+            # The recording takes the place of the Myo
+            speed = REPLAY_SPEEDS[self.replay_speed.get()]
+            self.p_myo = multiprocessing.Process(target=worker_replay,
+                                                 args=(self.bus, self.q_terminate, self.q_myo_ready, replay_path, speed,))
         # Custom myo receiver process
         self.p_myo_receiver = multiprocessing.Process(target=worker_myo_receiver_soni,
-                                                      args=(self.q_myo, self.q_myo_imu, self.q_terminate,))
+                                                      args=(self.bus, self.q_terminate,))
 
         self.p_myo.start()
         # self.p_myo_receiver.start()
 
-        self.repeating_timer = helpers.RepeatedTimer(0.05, self.myo_callback_loop)
+        self.callback_job = self.root.scheduler.every(50, self.myo_callback_loop, name="live_sonification")
 
     def update_signal(self):
         self.canvas.delete("line")
@@ -49,6 +49,11 @@ VISUALISER_PATH = str(
     )
 )
 
+# JSON list of the acquisition devices, see acquisition/devices.py. Unset: one Myo and one MANUS glove
+DEVICE_MANIFEST_PATH = _get_env("DEVICE_MANIFEST", None)
+if DEVICE_MANIFEST_PATH is not None:
+    DEVICE_MANIFEST_PATH = str(_expand_path(DEVICE_MANIFEST_PATH))
+
 
 def get_user_data_path(*parts):
     return str(USER_DATA_DIR.joinpath(*parts))
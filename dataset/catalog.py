@@ -0,0 +1,411 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from config import get_user_data_path
+from dataset.loader import RECORDING_COLUMNS, read_columns, read_csv_header
+from dataset.semg import SEMG_SUFFIX, count_semg_rows, list_recordings
+
+# Catalog of the user data folder, kept inside it so it moves with the data.
+# In its own folder: SQLite creates and deletes a -journal next to the database on every commit,
+# which in the user data folder itself would change its mtime and have every refresh list it again
+CATALOG_FOLDER = ".catalog"
+CATALOG_FILENAME = "catalog.sqlite"
+# Where older versions kept the catalog, removed when the new one is created
+LEGACY_CATALOG_FILENAME = ".catalog.sqlite"
+SCHEMA_VERSION = 2
+# Folder levels below the user data folder: u_<id>/s_<id>/g_<gesture>/recordings
+FOLDER_PREFIXES = ["u_", "s_", "g_"]
+# Name of a user, in their folder
+NAME_FILENAME = "name.txt"
+GESTURE_DEPTH = 3
+# A folder modified this recently may still change within its mtime resolution, it is listed again next time
+MTIME_SETTLE_SECONDS = 2
+# Recordings with the 42-column schema are marked with this instead of their column names
+DEFAULT_SCHEMA = "recording"
+# Bytes read at a time when counting CSV lines
+COUNT_CHUNK_SIZE = 1 << 20
+# Row counts are written in batches of this many recordings
+COUNT_BATCH_SIZE = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    depth INTEGER,
+    name TEXT,
+    name_mtime REAL,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS folders_parent ON folders (parent);
+CREATE TABLE IF NOT EXISTS recordings (
+    path TEXT PRIMARY KEY,
+    folder TEXT,
+    user TEXT,
+    session TEXT,
+    gesture TEXT,
+    filename TEXT,
+    speed TEXT,
+    format TEXT,
+    size INTEGER,
+    mtime REAL,
+    rows INTEGER,
+    columns INTEGER,
+    schema TEXT
+);
+CREATE INDEX IF NOT EXISTS recordings_folder ON recordings (folder);
+CREATE INDEX IF NOT EXISTS recordings_filters ON recordings (user, session, gesture, speed);
+"""
+
+
+def count_csv_rows(path):
+    """
+    Data lines of a recording CSV, without parsing them.
+    """
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(COUNT_CHUNK_SIZE)
+            if not chunk:
+                break
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    # A last line without a newline still counts
+    if last != b"\n":
+        lines += 1
+    _, header_lines = read_csv_header(path)
+    return max(lines - header_lines, 0)
+
+
+def _folder_sort_key(name):
+    # u_10 after u_9
+    suffix = name.split("_", 1)[1] if "_" in name else name
+    return (0, int(suffix), "") if suffix.isdigit() else (1, 0, suffix)
+
+
+class DatasetCatalog(object):
+    """
+    SQLite index of the users, sessions, gestures and recordings below the user data folder.
+    A refresh only lists the folders whose mtime changed since the last one and only reads the recordings
+    that are new or changed, so keeping it current is a few stat calls.
+    """
+
+    def __init__(self, root=None):
+        """
+        :param root: user data folder, defaults to USER_DATA_DIR
+        """
+        self.root = get_user_data_path() if root is None else root
+        self.folder = os.path.join(self.root, CATALOG_FOLDER)
+        self.path = os.path.join(self.folder, CATALOG_FILENAME)
+        # One refresh at a time, the UI and the background both refresh
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder, exist_ok=True)
+            for suffix in ("", "-journal"):
+                try:
+                    os.remove(os.path.join(self.root, LEGACY_CATALOG_FILENAME + suffix))
+                except FileNotFoundError:
+                    pass
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            # Only a cache of the folder, rebuilt from scratch
+            db.executescript("DROP TABLE IF EXISTS folders; DROP TABLE IF EXISTS recordings;")
+            db.executescript(_SCHEMA)
+            db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            db.commit()
+        return db
+
+    def _query(self, sql, parameters=()):
+        if not os.path.isdir(self.root):
+            return []
+        db = self._connect()
+        try:
+            return db.execute(sql, parameters).fetchall()
+        finally:
+            db.close()
+
+    # ------------------------------------------------------------------
+    # Refresh
+    # ------------------------------------------------------------------
+    def refresh(self, *parts, count_rows=False):
+        """
+        Bring the catalog up to date with the folder.
+        :param parts: only this part of the tree, e.g. ("u_3",) or ("u_3", "s_1", "g_fist")
+        :param count_rows: also count the rows of recordings that haven't been counted yet, this reads them
+        :return: number of recordings added, changed or removed
+        """
+        if not os.path.isdir(self.root):
+            return 0
+        with self.lock:
+            db = self._connect()
+            try:
+                # All known folders in one query, a refresh without changes then only stats them
+                known = {}
+                children = {}
+                for row in db.execute("SELECT path, parent, mtime, name_mtime FROM folders"):
+                    known[row["path"]] = (row["mtime"], row["name_mtime"])
+                    children.setdefault(row["parent"], []).append(row["path"])
+                changes = self._scan(db, "/".join(parts), len(parts), known, children)
+                db.commit()
+            finally:
+                db.close()
+        if count_rows:
+            # Outside the lock, counting a new dataset reads all of it and must not hold up the UI's refreshes
+            self._count_rows("/".join(parts))
+        return changes
+
+    def _scan(self, db, relative, depth, known, known_children):
+        full_path = os.path.join(self.root, *relative.split("/")) if relative else self.root
+        try:
+            mtime = os.stat(full_path).st_mtime
+        except FileNotFoundError:
+            return self._remove_folder(db, relative)
+
+        known_mtime, known_name_mtime = known.get(relative, (None, None))
+        changed = known_mtime != mtime
+        # Editing name.txt doesn't change the mtime of its folder, it is checked on its own
+        name_mtime = self._name_mtime(full_path, depth)
+        if changed:
+            settled = mtime if time.time() - mtime > MTIME_SETTLE_SECONDS else 0
+            parent = relative.rpartition("/")[0] if depth > 0 else None
+            db.execute(
+                "INSERT OR REPLACE INTO folders (path, parent, depth, name, name_mtime, mtime) VALUES (?, ?, ?, ?, ?, ?)",
+                (relative, parent, depth, self._folder_name(full_path, depth), name_mtime, settled),
+            )
+        elif name_mtime != known_name_mtime:
+            db.execute(
+                "UPDATE folders SET name = ?, name_mtime = ? WHERE path = ?",
+                (self._folder_name(full_path, depth), name_mtime, relative),
+            )
+
+        if depth == GESTURE_DEPTH:
+            return self._sync_recordings(db, relative, full_path) if changed else 0
+
+        changes = 0
+        if changed:
+            children = {
+                entry.name
+                for entry in os.scandir(full_path)
+                if entry.is_dir() and entry.name.startswith(FOLDER_PREFIXES[depth])
+            }
+            for path in known_children.get(relative, []):
+                if path.rpartition("/")[2] not in children:
+                    changes += self._remove_folder(db, path)
+        else:
+            children = [path.rpartition("/")[2] for path in known_children.get(relative, [])]
+
+        for child in children:
+            child = f"{relative}/{child}" if relative else child
+            changes += self._scan(db, child, depth + 1, known, known_children)
+        return changes
+
+    def _folder_name(self, full_path, depth):
+        # Users carry their name in name.txt
+        if depth != 1:
+            return None
+        name_path = os.path.join(full_path, NAME_FILENAME)
+        if not os.path.exists(name_path):
+            return None
+        with open(name_path, "r") as name_file:
+            return name_file.read().strip()
+
+    def _name_mtime(self, full_path, depth):
+        # Settled like the folder mtimes, a name.txt written just now is read again next time
+        if depth != 1:
+            return None
+        try:
+            mtime = os.stat(os.path.join(full_path, NAME_FILENAME)).st_mtime
+        except FileNotFoundError:
+            return None
+        return mtime if time.time() - mtime > MTIME_SETTLE_SECONDS else 0
+
+    def _remove_folder(self, db, relative):
+        # Not LIKE, "_" in the folder names would be a wildcard
+        below = (relative, len(relative) + 1, relative + "/")
+        removed = db.execute(
+            "DELETE FROM recordings WHERE folder = ? OR substr(folder, 1, ?) = ?", below
+        ).rowcount
+        db.execute("DELETE FROM folders WHERE path = ? OR substr(path, 1, ?) = ?", below)
+        return removed
+
+    def _sync_recordings(self, db, relative, full_path):
+        user, session, gesture = relative.split("/")
+        files = {entry.name: entry.stat() for entry in os.scandir(full_path) if entry.is_file()}
+        current = set(list_recordings(files))
+        known = {
+            row["filename"]: row
+            for row in db.execute("SELECT filename, size, mtime FROM recordings WHERE folder = ?", (relative,))
+        }
+
+        changes = 0
+        for filename in set(known) - current:
+            db.execute("DELETE FROM recordings WHERE path = ?", (f"{relative}/{filename}",))
+            changes += 1
+        for filename in current:
+            stat = files[filename]
+            row = known.get(filename)
+            if row is not None and row["size"] == stat.st_size and row["mtime"] == stat.st_mtime:
+                continue
+            columns = read_columns(os.path.join(full_path, filename))
+            db.execute(
+                "INSERT OR REPLACE INTO recordings "
+                "(path, folder, user, session, gesture, filename, speed, format, size, mtime, rows, columns, schema) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, ?, ?)",
+                (
+                    f"{relative}/{filename}",
+                    relative,
+                    user,
+                    session,
+                    gesture,
+                    filename,
+                    filename.split("_")[1] if "_" in filename else None,
+                    "semg" if filename.endswith(SEMG_SUFFIX) else "csv",
+                    stat.st_size,
+                    stat.st_mtime,
+                    len(columns),
+                    DEFAULT_SCHEMA if columns == RECORDING_COLUMNS else ",".join(columns),
+                ),
+            )
+            changes += 1
+        return changes
+
+    def _count_rows(self, relative):
+        pending = self._query(
+            "SELECT path, format, mtime FROM recordings WHERE rows IS NULL AND (? = '' OR substr(path, 1, ?) = ?)",
+            (relative, len(relative) + 1, relative + "/"),
+        )
+        counted = []
+        for row in pending:
+            full_path = os.path.join(self.root, *row["path"].split("/"))
+            try:
+                rows = count_semg_rows(full_path) if row["format"] == "semg" else count_csv_rows(full_path)
+            except (OSError, ValueError) as e:
+                print(f"Couldn't count the rows of {full_path}: {e}")
+                continue
+            counted.append((rows, row["path"], row["mtime"]))
+            if len(counted) == COUNT_BATCH_SIZE:
+                self._write_counts(counted)
+                counted = []
+        self._write_counts(counted)
+
+    def _write_counts(self, counted):
+        if not counted:
+            return
+        with self.lock:
+            db = self._connect()
+            try:
+                # Only if the recording didn't change while it was counted
+                db.executemany("UPDATE recordings SET rows = ? WHERE path = ? AND mtime = ?", counted)
+                db.commit()
+            finally:
+                db.close()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def _children(self, parent, depth):
+        rows = self._query("SELECT path, name FROM folders WHERE depth = ? AND parent = ?", (depth, parent))
+        folders = {row["path"].rpartition("/")[2]: row["name"] for row in rows}
+        return {name: folders[name] for name in sorted(folders, key=_folder_sort_key)}
+
+    def users(self):
+        """
+        :return: ordered dict of user folder (u_<id>) -> name, None if the user has no name.txt
+        """
+        return self._children("", 1)
+
+    def sessions(self, user):
+        """
+        :return: session folders (s_<id>) of a user, in order
+        """
+        return list(self._children(user, 2))
+
+    def gestures(self, user, session):
+        return list(self._children(f"{user}/{session}", 3))
+
+    def folder_names(self):
+        """
+        :return: (users, sessions, gestures), all folder names that occur on each level
+        """
+        rows = self._query("SELECT path, depth FROM folders WHERE depth > 0")
+        levels = [set(), set(), set()]
+        for row in rows:
+            levels[row["depth"] - 1].add(row["path"].rpartition("/")[2])
+        return tuple(levels)
+
+    def recordings(self, users=None, sessions=None, gestures=None, speeds=None):
+        """
+        Recordings matching all given filters, one per recording (the .semg if it was also exported to CSV).
+        :param users: user folder names, None for any. Same for the other filters
+        :return: list of dicts with path (absolute), user, session, gesture, filename, speed, format, size, mtime,
+        rows (None if not counted yet), columns and schema
+        """
+        conditions = []
+        parameters = []
+        for column, values in (("user", users), ("session", sessions), ("gesture", gestures), ("speed", speeds)):
+            if values is None:
+                continue
+            values = list(values)
+            conditions.append(f"{column} IN ({', '.join('?' * len(values))})" if values else "0")
+            parameters.extend(values)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._query(f"SELECT * FROM recordings {where} ORDER BY path", parameters)
+
+        root = self.root.rstrip("/\\") + os.sep
+        recordings = []
+        for row in rows:
+            recording = dict(row)
+            recording["path"] = root + row["path"].replace("/", os.sep)
+            recordings.append(recording)
+        return recordings
+
+    def total_rows(self):
+        """
+        :return: (rows of all counted recordings, number of recordings not counted yet)
+        """
+        rows = self._query("SELECT COALESCE(SUM(rows), 0), COUNT(*) - COUNT(rows) FROM recordings")
+        return tuple(rows[0]) if rows else (0, 0)
+
+    def next_user_id(self):
+        ids = [int(user[2:]) for user in self.users() if user[2:].isdigit()]
+        return 0 if not ids else max(ids) + 1
+
+
+# One catalog per user data folder
+_catalogs = {}
+
+
+def get_catalog(root=None):
+    root = get_user_data_path() if root is None else root
+    if root not in _catalogs:
+        _catalogs[root] = DatasetCatalog(root)
+    return _catalogs[root]
+
+
+if __name__ == "__main__":
+    # python -m dataset.catalog [FOLDER] -> build or refresh the catalog of a user data folder and time it
+    catalog = get_catalog(sys.argv[1] if len(sys.argv) > 1 else None)
+
+    timer = time.perf_counter()
+    changes = catalog.refresh(count_rows=True)
+    t_refresh = time.perf_counter() - timer
+
+    timer = time.perf_counter()
+    catalog.refresh(count_rows=True)
+    t_noop = time.perf_counter() - timer
+
+    timer = time.perf_counter()
+    recordings = catalog.recordings(speeds=["medium"])
+    t_query = time.perf_counter() - timer
+
+    rows, uncounted = catalog.total_rows()
+    print(f"Refresh with {changes} changes: {t_refresh * 1000:.1f} ms, refresh without changes: {t_noop * 1000:.1f} ms")
+    print(f"{len(catalog.users())} users, {rows} rows in total ({uncounted} recordings not counted)")
+    print(f"Query for medium speed: {len(recordings)} recordings in {t_query * 1000:.2f} ms")
@@ -0,0 +1,215 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from acquisition.devices import DEFAULT_MANIFEST, manifest_header
+from dataset.semg import (
+    CSV_SUFFIX,
+    SEMG_SUFFIX,
+    find_recordings,
+    read_semg,
+    read_semg_header,
+    recording_dtype,
+    records_to_rows,
+    recording_stem,
+    rows_to_records,
+    write_semg,
+)
+
+# Column range [start, end) of each modality in the recording schema:
+# emg (8 Myo sEMG), imu (10 Myo IMU), fingers (20 MANUS joints), wrist_quat (4 wrist quaternion)
+RECORDING_DTYPE = recording_dtype(DEFAULT_MANIFEST)
+MODALITIES = {}
+_column = 0
+for _name in RECORDING_DTYPE.names:
+    _width = int(np.prod(RECORDING_DTYPE[_name].shape))
+    MODALITIES[_name] = (_column, _column + _width)
+    _column += _width
+RECORDING_COLUMNS = manifest_header(DEFAULT_MANIFEST).split(",")
+
+
+def modality_columns(modalities=None):
+    """
+    :param modalities: list of modality names, None for all columns
+    :return: column indices of the modalities, in the order given
+    """
+    if modalities is None:
+        return list(range(len(RECORDING_COLUMNS)))
+    unknown = [modality for modality in modalities if modality not in MODALITIES]
+    if unknown:
+        raise ValueError(f"Unknown modalities {unknown}, expected any of {list(MODALITIES)}")
+    return [column for modality in modalities for column in range(*MODALITIES[modality])]
+
+
+def read_csv_header(path):
+    """
+    The two header variants of recording CSVs: "# emg_0,..." as np.savetxt writes it, or a plain "emg_0,..." line.
+    :return: (column names or None if the file has no header line, number of lines to skip)
+    """
+    with open(path, "r") as f:
+        line = f.readline().strip()
+    if line.startswith("#"):
+        return line.lstrip("#").strip().split(","), 1
+    # A header line starts with a column name, a data line with a number
+    if line and (line[0].isalpha() or line[0] == "_"):
+        return line.split(","), 1
+    return None, 0
+
+
+def read_columns(path):
+    """
+    Column names of a recording in either format, without reading its rows.
+    """
+    if path.endswith(SEMG_SUFFIX):
+        return read_semg_header(path)["columns"]
+    columns, _ = read_csv_header(path)
+    return RECORDING_COLUMNS if columns is None else columns
+
+
+def _load_csv(path, columns, dtype):
+    """
+    :param columns: column indices of the recording schema, None for all columns of any layout
+    """
+    names, skip = read_csv_header(path)
+    if columns is None:
+        # All columns: the pandas C parser is the fastest
+        return pd.read_csv(path, header=None, skiprows=skip, dtype=dtype, engine="c").to_numpy()
+
+    if names is not None and names != RECORDING_COLUMNS:
+        raise ValueError(f"{path} doesn't have the 42-column recording schema")
+    # A projection: numpy's parser stops tokenising each line after the last column it needs
+    return np.loadtxt(path, delimiter=",", skiprows=skip, usecols=columns, dtype=dtype, comments=None, ndmin=2)
+
+
+def load_recording(path, modalities=None, dtype=np.float32, records=False):
+    """
+    Load a recording (.semg or CSV with either header variant) straight into one typed array.
+    :param modalities: only these modalities of the recording schema, e.g. ["emg"] or ["fingers", "wrist_quat"],
+    None for all columns (of any device layout)
+    :param dtype: dtype of the rows
+    :param records: return a record array with one field per modality (int8 EMG, float32 otherwise) instead of rows
+    :return: array of shape (N, columns of the modalities), or a record array
+    """
+    if path.endswith(SEMG_SUFFIX):
+        _, recording = read_semg(path)
+        if modalities is not None:
+            modality_columns(modalities)
+            recording = recording[list(modalities)]
+        return recording if records else records_to_rows(recording, dtype)
+
+    if modalities is None and not records:
+        return _load_csv(path, None, dtype)
+    names = list(RECORDING_DTYPE.names) if modalities is None else list(modalities)
+    rows = _load_csv(path, modality_columns(names), np.float64 if records else dtype)
+    if records:
+        return rows_to_records(rows, np.dtype([(name, RECORDING_DTYPE[name]) for name in names]))
+    return rows
+
+
+def convert_csv(path, out_path=None, manifest=DEFAULT_MANIFEST):
+    """
+    Convert a CSV recording with the column layout of the manifest to .semg.
+    :return: the path written
+    """
+    if ",".join(read_columns(path)) != manifest_header(manifest):
+        raise ValueError(f"{path} doesn't have the column layout of the device manifest")
+
+    out_path = recording_stem(path) + SEMG_SUFFIX if out_path is None else out_path
+    speed = os.path.basename(path).split("_")[1]
+    rows = _load_csv(path, None, np.float64)
+    write_semg(out_path, rows, manifest, speed=speed, converted_from=os.path.basename(path))
+    return out_path
+
+
+def _legacy_loaders():
+    """
+    How the app parsed recordings before this module, per read site.
+    """
+
+    def pandas_full(path):
+        # load_all_files, extract_hand_pose_data_from_gt_csv
+        return pd.read_csv(path, index_col=False).to_numpy(dtype=np.float32)
+
+    def genfromtxt(path):
+        # EMGInspector
+        return np.genfromtxt(path, delimiter=",", skip_header=0)
+
+    def split_lines(path):
+        # InferenceFromFile
+        data = []
+        with open(path, "r") as file:
+            for line in file:
+                line_data = line.strip().split(",")
+                if "emg" in line_data[0]:
+                    continue
+                data.append([int(float(x)) for x in line_data[:8]])
+        return data
+
+    return {"pd.read_csv": pandas_full, "np.genfromtxt": genfromtxt, "split loop (EMG)": split_lines}
+
+
+def _benchmark(paths, repeats=3):
+    loaders = dict(_legacy_loaders())
+    loaders["load_recording csv"] = lambda path: load_recording(path)
+    loaders["load_recording csv emg"] = lambda path: load_recording(path, ["emg"])
+    loaders["load_recording csv fingers"] = lambda path: load_recording(path, ["fingers"])
+
+    with tempfile.TemporaryDirectory() as folder:
+        semg_paths = {
+            path: convert_csv(path, os.path.join(folder, f"{i}{SEMG_SUFFIX}")) for i, path in enumerate(paths)
+        }
+        loaders["load_recording semg"] = lambda path: load_recording(semg_paths[path])
+        loaders["load_recording semg emg"] = lambda path: load_recording(semg_paths[path], ["emg"])
+
+        rows = sum(len(load_recording(path, ["emg"])) for path in paths)
+        print(f"{len(paths)} recordings, {rows / len(paths):.0f} rows on average")
+        for name, loader in loaders.items():
+            best = np.inf
+            for _ in range(repeats):
+                timer = time.perf_counter()
+                for path in paths:
+                    loader(path)
+                best = min(best, time.perf_counter() - timer)
+            print(f"{name:>28}: {best / len(paths) * 1000:8.2f} ms per file")
+
+
+if __name__ == "__main__":
+    # python -m dataset.loader                 -> load time per file of every read path, on a synthetic 10 s recording
+    # python -m dataset.loader bench PATH      -> the same on a recording or all CSV recordings below a folder
+    # python -m dataset.loader convert FOLDER  -> .semg next to every CSV recording below a folder, the CSVs are kept
+    if len(sys.argv) > 2 and sys.argv[1] == "convert":
+        timer = time.perf_counter()
+        converted = []
+        for path in find_recordings(sys.argv[2]):
+            if not path.endswith(CSV_SUFFIX):
+                continue
+            try:
+                converted.append(convert_csv(path))
+            except ValueError as e:
+                # e.g. EMG outside int8, the CSV stays the only copy
+                print(f"Not converting {path}: {e}")
+        size_csv = sum(os.path.getsize(recording_stem(path) + CSV_SUFFIX) for path in converted)
+        size_semg = sum(os.path.getsize(path) for path in converted)
+        print(
+            f"Converted {len(converted)} recordings in {time.perf_counter() - timer:.1f} s, "
+            f"{size_csv / 1e6:.1f} MB of CSV -> {size_semg / 1e6:.1f} MB"
+        )
+    elif len(sys.argv) > 2 and sys.argv[1] == "bench":
+        source = sys.argv[2]
+        if os.path.isfile(source):
+            paths = [source]
+        else:
+            paths = [path for path in find_recordings(source) if path.endswith(CSV_SUFFIX)]
+        _benchmark(paths)
+    else:
+        rng = np.random.default_rng(0)
+        recording = rng.normal(0, 30, (2000, len(RECORDING_COLUMNS)))
+        recording[:, :8] = np.rint(recording[:, :8]).clip(-128, 127)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "recording_medium_synthetic.csv")
+            np.savetxt(path, recording, delimiter=",", header=",".join(RECORDING_COLUMNS))
+            _benchmark([path])
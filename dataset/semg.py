@@ -0,0 +1,291 @@
+import datetime
+import json
+import os
+import shutil
+import struct
+import sys
+import time
+
+import numpy as np
+from numpy.lib import recfunctions
+
+from acquisition.devices import DEFAULT_MANIFEST, DEVICE_STREAMS, manifest_header, manifest_streams, stream_name
+
+# Native recording format: recording_x.semg, exported to recording_x.csv with the published schema on demand
+SEMG_SUFFIX = ".semg"
+CSV_SUFFIX = ".csv"
+RECORDING_SUFFIXES = (SEMG_SUFFIX, CSV_SUFFIX)
+
+# File layout:
+#   MAGIC, header length (uint32), JSON header,
+#   then chunks of CHUNK_MARKER, row count (uint32) and that many records of the recording dtype.
+# Chunks are appended while a take is captured, a crash leaves at most a torn last chunk which readers skip
+MAGIC = b"SEMG"
+VERSION = 1
+CHUNK_MARKER = b"CHNK"
+LENGTH = struct.Struct("<I")
+
+
+def recording_dtype(manifest=DEFAULT_MANIFEST):
+    """
+    Record dtype of one recording row: the value fields of every stream of the manifest in column order,
+    typed as the devices deliver them (EMG int8, everything else float32). Timestamps are not stored.
+    """
+    fields = []
+    for device in manifest:
+        for kind, dtype, _, columns in DEVICE_STREAMS[device["type"]]:
+            # Prefixed like the stream's columns, e.g. myo_left_emg
+            prefix = stream_name(device, kind)[: -len(kind)]
+            width = 0
+            for field in dtype.names:
+                if field in ("timestamp", "device_timestamp"):
+                    continue
+                fields.append((prefix + field, dtype[field].base.str, dtype[field].shape))
+                width += int(np.prod(dtype[field].shape))
+            if width != len(columns):
+                raise ValueError(f"The fields of stream {kind} don't cover its {len(columns)} columns")
+    return np.dtype(fields)
+
+
+def rows_to_records(rows, dtype):
+    """
+    :param rows: array of shape (N, columns) as in the CSV
+    :return: record array of the recording dtype, integer fields rounded
+    :raises ValueError: if a value doesn't fit its integer field (e.g. EMG outside int8), instead of wrapping it
+    """
+    rows = np.asarray(rows)
+    records = np.empty(len(rows), dtype=dtype)
+    column = 0
+    for field in dtype.names:
+        width = int(np.prod(dtype[field].shape))
+        values = rows[:, column : column + width]
+        if dtype[field].base.kind in "iu":
+            values = np.rint(values)
+            if np.isnan(values).any():
+                raise ValueError(f"{field} has missing values, they can't be stored as {dtype[field].base}")
+            limits = np.iinfo(dtype[field].base)
+            if values.size > 0 and (values.min() < limits.min or values.max() > limits.max):
+                raise ValueError(
+                    f"{field} has values in [{values.min():g}, {values.max():g}], "
+                    f"outside the range of {dtype[field].base} [{limits.min}, {limits.max}]"
+                )
+        records[field] = values.reshape(records[field].shape)
+        column += width
+    return records
+
+
+def records_to_rows(records, dtype=np.float32):
+    """
+    :return: array of shape (N, columns) as in the CSV
+    """
+    return recfunctions.structured_to_unstructured(records, dtype=dtype)
+
+
+def _header(manifest, info):
+    header = {
+        "format": "semg",
+        "version": VERSION,
+        "columns": manifest_header(manifest).split(","),
+        "fields": [
+            [name, dtype.base.str, list(dtype.shape)] for name, (dtype, _) in recording_dtype(manifest).fields.items()
+        ],
+        # Rows are EMG samples of the first device
+        "rate": manifest_streams(manifest)[0][2],
+        "devices": manifest,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    header.update(info)
+    return header
+
+
+def header_info(header):
+    """
+    The extra entries of a header (speed, ...), to carry them over to a rewritten recording.
+    """
+    layout = ("format", "version", "columns", "fields", "rate", "devices", "created")
+    return {key: value for key, value in header.items() if key not in layout}
+
+
+def _header_dtype(header):
+    return np.dtype([(name, dtype, tuple(shape)) for name, dtype, shape in header["fields"]])
+
+
+class SemgFile(object):
+    """
+    A .semg recording open for appending.
+    """
+
+    def __init__(self, path, manifest=DEFAULT_MANIFEST, **info):
+        """
+        :param info: extra header entries, e.g. speed
+        """
+        self.dtype = recording_dtype(manifest)
+        self.file = open(path, "wb")
+        header = json.dumps(_header(manifest, info)).encode("utf-8")
+        self.file.write(MAGIC + LENGTH.pack(len(header)) + header)
+        self.rows = 0
+
+    def append(self, rows):
+        """
+        :param rows: array of shape (N, columns), written as one chunk
+        """
+        if len(rows) == 0:
+            return
+        records = rows_to_records(rows, self.dtype)
+        self.file.write(CHUNK_MARKER + LENGTH.pack(len(records)) + records.tobytes())
+        self.rows += len(records)
+
+    def flush(self):
+        self.file.flush()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def write_semg(path, rows, manifest=DEFAULT_MANIFEST, **info):
+    semg_file = SemgFile(path, manifest, **info)
+    semg_file.append(rows)
+    semg_file.close()
+
+
+def _read_header(data, path):
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a .semg recording")
+    (length,) = LENGTH.unpack_from(data, len(MAGIC))
+    start = len(MAGIC) + LENGTH.size
+    header = json.loads(bytes(data[start : start + length]).decode("utf-8"))
+    if header.get("version", 0) > VERSION:
+        raise ValueError(f"{path} is version {header['version']} of the .semg format, this app reads up to {VERSION}")
+    return header, start + length
+
+
+def read_semg_header(path):
+    """
+    The header of a .semg recording (columns, fields, rate, devices, speed, ...) without reading its rows.
+    """
+    with open(path, "rb") as f:
+        start = f.read(len(MAGIC) + LENGTH.size)
+        if len(start) < len(MAGIC) + LENGTH.size:
+            raise ValueError(f"{path} is not a .semg recording")
+        (length,) = LENGTH.unpack_from(start, len(MAGIC))
+        header, _ = _read_header(start + f.read(length), path)
+    return header
+
+
+def count_semg_rows(path):
+    """
+    Rows of a .semg recording from its chunk headers, without reading the rows.
+    """
+    header = read_semg_header(path)
+    itemsize = _header_dtype(header).itemsize
+    size = os.path.getsize(path)
+    rows = 0
+    with open(path, "rb") as f:
+        f.seek(len(MAGIC))
+        (length,) = LENGTH.unpack(f.read(LENGTH.size))
+        offset = len(MAGIC) + LENGTH.size + length
+        while offset + len(CHUNK_MARKER) + LENGTH.size <= size:
+            f.seek(offset)
+            chunk = f.read(len(CHUNK_MARKER) + LENGTH.size)
+            if chunk[: len(CHUNK_MARKER)] != CHUNK_MARKER:
+                break
+            (chunk_rows,) = LENGTH.unpack_from(chunk, len(CHUNK_MARKER))
+            offset += len(CHUNK_MARKER) + LENGTH.size + chunk_rows * itemsize
+            # Same as read_semg, a torn last chunk doesn't count
+            if offset > size:
+                break
+            rows += chunk_rows
+    return rows
+
+
+def read_semg(path):
+    """
+    :return: (header dict, record array of the recording's dtype)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    header, offset = _read_header(data, path)
+    dtype = _header_dtype(header)
+
+    chunks = []
+    while offset + len(CHUNK_MARKER) + LENGTH.size <= len(data):
+        if data[offset : offset + len(CHUNK_MARKER)] != CHUNK_MARKER:
+            print(f"{path}: corrupt chunk at byte {offset}, ignoring the rest")
+            break
+        (rows,) = LENGTH.unpack_from(data, offset + len(CHUNK_MARKER))
+        offset += len(CHUNK_MARKER) + LENGTH.size
+        if offset + rows * dtype.itemsize > len(data):
+            print(f"{path}: torn last chunk, ignoring it")
+            break
+        chunks.append(np.frombuffer(data, dtype=dtype, count=rows, offset=offset))
+        offset += rows * dtype.itemsize
+
+    records = np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+    return header, records
+
+
+def is_recording(filename):
+    return filename.endswith(RECORDING_SUFFIXES)
+
+
+def recording_stem(filename):
+    return os.path.splitext(filename)[0]
+
+
+def list_recordings(filenames):
+    """
+    One filename per recording, the .semg where a recording also has an exported CSV.
+    :param filenames: filenames of one folder
+    :return: sorted filenames
+    """
+    recordings = {}
+    for filename in sorted(filenames):
+        if not is_recording(filename):
+            continue
+        stem = recording_stem(filename)
+        if stem not in recordings or filename.endswith(SEMG_SUFFIX):
+            recordings[stem] = filename
+    return sorted(recordings.values())
+
+
+def find_recordings(folder):
+    """
+    :return: paths of all recordings below a folder, one per recording
+    """
+    return [
+        os.path.join(root, filename)
+        for root, _, filenames in os.walk(folder)
+        for filename in list_recordings(filenames)
+    ]
+
+
+def export_csv(path, out_path=None):
+    """
+    Export a .semg recording with the published CSV schema, the same layout np.savetxt gave the original recordings.
+    :param out_path: defaults to the recording's path with a .csv suffix
+    :return: the path written
+    """
+    header, records = read_semg(path)
+    out_path = recording_stem(path) + CSV_SUFFIX if out_path is None else out_path
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    np.savetxt(out_path, records_to_rows(records, np.float64), delimiter=",", header=",".join(header["columns"]))
+    return out_path
+
+
+if __name__ == "__main__":
+    # python -m dataset.semg FOLDER OUT_FOLDER -> CSV release of all recordings below a folder
+    source, out_folder = sys.argv[1], sys.argv[2]
+    paths = find_recordings(source)
+
+    timer = time.perf_counter()
+    for path in paths:
+        out_path = os.path.join(out_folder, recording_stem(os.path.relpath(path, source)) + CSV_SUFFIX)
+        if path.endswith(SEMG_SUFFIX):
+            export_csv(path, out_path)
+        else:
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            shutil.copyfile(path, out_path)
+    print(f"Exported {len(paths)} recordings to {out_folder} in {time.perf_counter() - timer:.1f} s")
@@ -0,0 +1,349 @@
+import datetime
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from config import get_user_data_path
+from dataset.catalog import DEFAULT_SCHEMA, get_catalog
+from dataset.loader import MODALITIES, RECORDING_DTYPE, load_recording, modality_columns
+
+# Packed copy of the whole user data folder for full-dataset reads: one contiguous array per modality
+# (emg int8, everything else float32) and an index of where every recording's rows are.
+# Kept inside the user data folder next to the catalog, rebuilt with python -m dataset.store build
+STORE_FOLDER = ".store"
+STORE_VERSION = 1
+# Every build goes into a new generation folder and CURRENT names the one to read,
+# so a build never overwrites arrays that the app still has mapped (Windows can't replace mapped files)
+CURRENT_FILENAME = "CURRENT"
+META_FILENAME = "store.json"
+INDEX_FILENAME = "index.npy"
+
+
+def _modality_dtype(modality):
+    return RECORDING_DTYPE[modality].base
+
+
+def _modality_width(modality):
+    return int(np.prod(RECORDING_DTYPE[modality].shape))
+
+
+def _index_dtype(recordings):
+    # Fixed-width text columns, as wide as the longest value
+    width = {
+        key: max([len(recording[key] or "") for recording in recordings] + [1])
+        for key in ("path", "user", "session", "gesture", "speed")
+    }
+    return np.dtype(
+        [(key, f"U{width[key]}") for key in ("path", "user", "session", "gesture", "speed")]
+        + [("start_row", "i8"), ("n_rows", "i8"), ("size", "i8"), ("mtime", "f8")]
+    )
+
+
+class DatasetStore(object):
+    """
+    The packed arrays of a user data folder, memory-mapped. Rows of a recording are slices of the mapped arrays,
+    so reading the whole dataset is served from the page cache instead of parsing every recording.
+    """
+
+    def __init__(self, root=None):
+        """
+        :param root: user data folder, defaults to USER_DATA_DIR
+        """
+        self.root = get_user_data_path() if root is None else root
+        self.folder = os.path.join(self.root, STORE_FOLDER)
+        self.generation = None
+        self.meta = None
+        self.index = None
+        self.arrays = {}
+        # Catalog path (u_x/s_y/g_z/recording_...) -> position in the index
+        self.positions = {}
+
+    # ------------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------------
+    def build(self, progress=None):
+        """
+        Pack all recordings with the recording schema into a new generation of the store.
+        :param progress: called with (recordings packed, recordings to pack)
+        :return: number of recordings packed
+        """
+        catalog = get_catalog(self.root)
+        catalog.refresh(count_rows=True)
+        recordings = []
+        for recording in catalog.recordings():
+            # Other device layouts have other columns, they are read from their files
+            if recording["schema"] != DEFAULT_SCHEMA:
+                print(f"Not packing {recording['path']}, it doesn't have the recording schema")
+                continue
+            if recording["rows"] is None:
+                print(f"Not packing {recording['path']}, its rows couldn't be counted")
+                continue
+            recordings.append(recording)
+        total = sum(recording["rows"] for recording in recordings)
+
+        generation = f"build_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        folder = os.path.join(self.folder, generation)
+        os.makedirs(folder)
+        arrays = {
+            modality: np.lib.format.open_memmap(
+                os.path.join(folder, f"{modality}.npy"),
+                mode="w+",
+                dtype=_modality_dtype(modality),
+                shape=(total, _modality_width(modality)),
+            )
+            for modality in MODALITIES
+        }
+
+        entries = []
+        start = 0
+        for i, recording in enumerate(recordings):
+            try:
+                records = load_recording(recording["path"], records=True)
+            except ValueError as e:
+                # e.g. EMG outside int8, it is read from its file instead
+                print(f"Not packing {recording['path']}: {e}")
+                start += recording["rows"]
+                continue
+            # The catalog counted lines, a stray blank line makes it more than there are rows
+            if len(records) > recording["rows"]:
+                print(f"{recording['path']} has {len(records)} rows, only packing the {recording['rows']} counted")
+                records = records[: recording["rows"]]
+            n_rows = len(records)
+            for modality, array in arrays.items():
+                array[start : start + n_rows] = records[modality].reshape(n_rows, -1)
+
+            entries.append(
+                (
+                    os.path.relpath(recording["path"], self.root).replace(os.sep, "/"),
+                    recording["user"],
+                    recording["session"],
+                    recording["gesture"],
+                    recording["speed"] or "",
+                    start,
+                    n_rows,
+                    recording["size"],
+                    recording["mtime"],
+                )
+            )
+            # Rows a recording has less than counted stay unused
+            start += recording["rows"]
+            if progress is not None:
+                progress(i + 1, len(recordings))
+
+        for array in arrays.values():
+            array.flush()
+        del arrays
+        np.save(os.path.join(folder, INDEX_FILENAME), np.array(entries, dtype=_index_dtype(recordings)))
+        meta = {
+            "version": STORE_VERSION,
+            "built": datetime.datetime.now().isoformat(timespec="seconds"),
+            "recordings": len(entries),
+            "rows": total,
+            "modalities": {
+                modality: [_modality_dtype(modality).str, _modality_width(modality)] for modality in MODALITIES
+            },
+        }
+        with open(os.path.join(folder, META_FILENAME), "w") as meta_file:
+            json.dump(meta, meta_file, indent=2)
+
+        # Switch readers to the new generation, then drop the old ones that aren't mapped anymore
+        current_path = os.path.join(self.folder, CURRENT_FILENAME)
+        with open(current_path + ".tmp", "w") as current_file:
+            current_file.write(generation)
+        os.replace(current_path + ".tmp", current_path)
+        self.close()
+        for name in os.listdir(self.folder):
+            if name.startswith("build_") and name != generation:
+                shutil.rmtree(os.path.join(self.folder, name), ignore_errors=True)
+        return len(entries)
+
+    # ------------------------------------------------------------------
+    # Read
+    # ------------------------------------------------------------------
+    def _current_generation(self):
+        try:
+            with open(os.path.join(self.folder, CURRENT_FILENAME), "r") as current_file:
+                return current_file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def open(self):
+        """
+        Map the current generation, a no-op if it is mapped already.
+        :return: True if the folder has a store
+        """
+        generation = self._current_generation()
+        if generation is None:
+            self.close()
+            return False
+        if generation == self.generation:
+            return True
+
+        folder = os.path.join(self.folder, generation)
+        with open(os.path.join(folder, META_FILENAME), "r") as meta_file:
+            meta = json.load(meta_file)
+        if meta["version"] != STORE_VERSION:
+            print(f"The dataset store is version {meta['version']}, rebuild it for version {STORE_VERSION}")
+            self.close()
+            return False
+
+        self.meta = meta
+        self.index = np.load(os.path.join(folder, INDEX_FILENAME))
+        self.arrays = {
+            modality: np.load(os.path.join(folder, f"{modality}.npy"), mmap_mode="r") for modality in meta["modalities"]
+        }
+        self.positions = {path: i for i, path in enumerate(self.index["path"].tolist())}
+        self.generation = generation
+        return True
+
+    def close(self):
+        # Slices handed out keep their mapping alive until they are dropped
+        self.generation = None
+        self.meta = None
+        self.index = None
+        self.arrays = {}
+        self.positions = {}
+
+    def lookup(self, relative, size=None, mtime=None):
+        """
+        :param relative: path of the recording in the catalog, e.g. u_0/s_1/g_fist/recording_medium_x.semg
+        :param size: only if it was packed at this size, None to not check. Same for mtime
+        :return: position of the recording in the index, None if it isn't packed (or changed since)
+        """
+        # Mapped by open(), which callers do once before a batch of lookups
+        if self.index is None:
+            return None
+        position = self.positions.get(relative)
+        if position is None:
+            return None
+        entry = self.index[position]
+        if size is not None and int(entry["size"]) != size:
+            return None
+        if mtime is not None and float(entry["mtime"]) != mtime:
+            return None
+        return position
+
+    def lookup_recording(self, recording):
+        """
+        Position of a recording of DatasetCatalog.recordings in the index, if it is packed and didn't change since.
+        """
+        relative = os.path.relpath(recording["path"], self.root).replace(os.sep, "/")
+        return self.lookup(relative, recording["size"], recording["mtime"])
+
+    def lookup_file(self, path):
+        """
+        Position of a recording file in the index, if it is packed and didn't change since.
+        """
+        try:
+            relative = os.path.relpath(os.path.abspath(path), os.path.abspath(self.root))
+        except ValueError:
+            # Another drive on Windows
+            return None
+        if relative.startswith(".."):
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        self.open()
+        return self.lookup(relative.replace(os.sep, "/"), stat.st_size, stat.st_mtime)
+
+    def recording(self, position):
+        """
+        :return: dict of modality -> memmap slice of the recording's rows, no copy
+        """
+        entry = self.index[position]
+        start, end = int(entry["start_row"]), int(entry["start_row"] + entry["n_rows"])
+        return {modality: array[start:end] for modality, array in self.arrays.items()}
+
+    def rows(self, position, modalities=None, dtype=np.float32):
+        """
+        Rows of a recording in the column layout of load_recording.
+        A single modality of the stored dtype is a memmap slice, anything else is copied into one array.
+        :param modalities: e.g. ["emg"], None for all columns
+        :param dtype: dtype of the rows, None for the stored dtype of a single modality
+        """
+        modalities = list(MODALITIES) if modalities is None else list(modalities)
+        modality_columns(modalities)
+        slices = self.recording(position)
+        if len(modalities) == 1 and (dtype is None or slices[modalities[0]].dtype == dtype):
+            return slices[modalities[0]]
+        return np.hstack([slices[modality].astype(dtype or np.float32) for modality in modalities])
+
+    def select(self, users=None, sessions=None, gestures=None, speeds=None):
+        """
+        Positions of the packed recordings matching all given filters, in path order.
+        :param users: user folder names, None for any. Same for the other filters
+        """
+        if not self.open():
+            return np.empty(0, dtype=np.int64)
+        mask = np.ones(len(self.index), dtype=bool)
+        for column, values in (("user", users), ("session", sessions), ("gesture", gestures), ("speed", speeds)):
+            if values is not None:
+                mask &= np.isin(self.index[column], list(values))
+        return np.flatnonzero(mask)
+
+
+# One store per user data folder
+_stores = {}
+
+
+def get_store(root=None):
+    root = get_user_data_path() if root is None else root
+    if root not in _stores:
+        _stores[root] = DatasetStore(root)
+    return _stores[root]
+
+
+def load_stored(path, modalities=None, dtype=np.float32):
+    """
+    load_recording that serves the rows from the dataset store when the recording is packed and unchanged.
+    Same arguments and column layout as load_recording, a single modality in its stored dtype is not copied.
+    """
+    store = get_store()
+    position = store.lookup_file(path)
+    if position is None:
+        return load_recording(path, modalities, dtype or np.float32)
+    return store.rows(position, modalities, dtype)
+
+
+if __name__ == "__main__":
+    # python -m dataset.store build [FOLDER] -> pack all recordings of a user data folder
+    # python -m dataset.store [FOLDER]       -> load time of the whole dataset, parsed vs. from the store
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        store = get_store(sys.argv[2] if len(sys.argv) > 2 else None)
+        timer = time.perf_counter()
+        packed = store.build()
+        store.open()
+        size = sum(array.nbytes for array in store.arrays.values())
+        print(
+            f"Packed {packed} recordings, {store.meta['rows']} rows ({size / 1e6:.1f} MB) "
+            f"in {time.perf_counter() - timer:.1f} s"
+        )
+    else:
+        store = get_store(sys.argv[1] if len(sys.argv) > 1 else None)
+        if not store.open():
+            sys.exit(f"No dataset store in {store.root}, build it with: python -m dataset.store build")
+        catalog = get_catalog(store.root)
+        paths = [recording["path"] for recording in catalog.recordings() if recording["schema"] == DEFAULT_SCHEMA]
+
+        for modalities in (None, ["emg"], ["fingers"]):
+            timer = time.perf_counter()
+            rows = sum(len(load_recording(path, modalities)) for path in paths)
+            t_parse = time.perf_counter() - timer
+
+            timer = time.perf_counter()
+            positions = store.select()
+            stored = [store.rows(position, modalities, None) for position in positions]
+            # Touch every value so the pages are actually read
+            for rows_of_recording in stored:
+                np.sum(rows_of_recording, dtype=np.float64)
+            t_store = time.perf_counter() - timer
+            print(
+                f"{'all columns' if modalities is None else modalities[0]:>12}: {len(paths)} recordings, "
+                f"{rows} rows, load_recording {t_parse * 1000:.0f} ms, store {t_store * 1000:.0f} ms"
+            )
@@ -1,17 +1,25 @@
 import os
-from threading import Timer
 import shutil
 import csv
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
-import pandas as pd
 
-from config import get_user_data_path, user_data_dir_exists
-from constants import FEATURE_VECTOR_DIM, MANUS_LABEL_INDICES, NUM_FEATURES_PER_SAMPLE
+from acquisition.clock import LatencyStats
+from config import user_data_dir_exists
+from constants import FEATURE_VECTOR_DIM, MANUS_LABEL_INDICES
+from dataset.catalog import get_catalog
+from dataset.store import load_stored
 
 excluded_elements = ["delete_session_button", "theme_toggle_button"]
 
+# How often the scheduler checks whether background work is done, in ms
+BACKGROUND_POLL_MS = 20
+# Latest runs of a job its jitter percentiles are taken over
+JITTER_WINDOW = 1000
+
 
 # Function to recursively iterate through all children of a widget
 def configure_recursively(widget, config):
@@ -44,54 +52,150 @@ def configure_recursively(widget, config):
 
 
 def get_total_number_of_datapoints():
-    # Get the total number of datapoints
-    total_no_files = 0
+    # Exact number of rows of all recordings, only new recordings are read
     if not user_data_dir_exists():
         return 0
 
-    user_data_dir = get_user_data_path()
-    for user_folder in os.listdir(user_data_dir):
-        user_folder_path = os.path.join(user_data_dir, user_folder)
-        if not os.path.isdir(user_folder_path):
-            continue
-        for session_folder in os.listdir(user_folder_path):
-            session_folder_path = os.path.join(user_folder_path, session_folder)
-            if not os.path.isdir(session_folder_path):
-                continue
-            for gesture_folder in os.listdir(session_folder_path):
-                gesture_folder_path = os.path.join(session_folder_path, gesture_folder)
-                if not os.path.isdir(gesture_folder_path):
-                    continue
-                for file in os.listdir(gesture_folder_path):
-                    if file.endswith(".csv"):
-                        total_no_files += 1
-    return total_no_files * 2000
-
-
-class RepeatedTimer(object):
-    def __init__(self, interval, function, *args, **kwargs):
-        self._timer = None
-        self.interval = interval
-        self.function = function
-        self.args = args
-        self.kwargs = kwargs
-        self.is_running = False
-        self.start()
+    catalog = get_catalog()
+    catalog.refresh(count_rows=True)
+    rows, _ = catalog.total_rows()
+    return rows
 
-    def _run(self):
-        self.is_running = False
-        self.start()
-        self.function(*self.args, **self.kwargs)
 
-    def start(self):
-        if not self.is_running:
-            self._timer = Timer(self.interval, self._run)
-            self._timer.start()
-            self.is_running = True
+class ScheduledJob(object):
+    """
+    A job of the TkScheduler. Periodic jobs run at fixed deadlines, a job that falls behind skips the ticks it
+    missed instead of running them back to back.
+    """
+
+    def __init__(self, name, function, args, interval_ms=None):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.interval_ms = interval_ms
+        # time.perf_counter() the job is due next
+        self.due = None
+        self.after_id = None
+        self.is_cancelled = False
+        # How late each run started (percentiles over the latest runs, periodic jobs run for hours),
+        # and how many ticks were skipped
+        self.jitter = LatencyStats(window=JITTER_WINDOW)
+        self.coalesced = 0
+        # Background jobs: (function, args, on_done) to run once more after the current run
+        self.rerun = None
+
+
+class TkScheduler(object):
+    """
+    Central scheduler on the Tk event loop: every job runs on the Tk thread via after(), so jobs may update widgets.
+    Blocking work goes to a small thread pool, its result is handed back on the Tk thread.
+    """
 
-    def stop(self):
-        self._timer.cancel()
-        self.is_running = False
+    def __init__(self, widget, max_workers=2):
+        """
+        :param widget: any Tk widget, usually the root
+        """
+        self.widget = widget
+        self.jobs = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tk_scheduler")
+        self._count = 0
+
+    def _add(self, name, function, args, interval_ms, delay_ms):
+        if name is None:
+            self._count += 1
+            name = f"{getattr(function, '__name__', 'job')}_{self._count}"
+        job = ScheduledJob(name, function, args, interval_ms)
+        job.due = time.perf_counter() + delay_ms / 1000
+        self.jobs[name] = job
+        job.after_id = self.widget.after(int(delay_ms), self._run, job)
+        return job
+
+    def every(self, interval_ms, function, *args, name=None):
+        """
+        Run function(*args) every interval_ms, first after one interval.
+        :return: the job, pass it to cancel()
+        """
+        return self._add(name, function, args, interval_ms, interval_ms)
+
+    def once(self, delay_ms, function, *args, name=None):
+        """
+        Run function(*args) once after delay_ms. If a job of the same name is still pending the call is coalesced
+        into it, e.g. many refresh requests in a row cause a single refresh.
+        """
+        if name is not None and name in self.jobs and not self.jobs[name].is_cancelled:
+            self.jobs[name].coalesced += 1
+            return self.jobs[name]
+        return self._add(name, function, args, None, delay_ms)
+
+    def run_in_background(self, function, *args, on_done=None, name=None):
+        """
+        Run blocking work in the thread pool and call on_done(result) on the Tk thread when it is done.
+        Coalesced by name: requests while a job of the same name runs make it run once more when it is done,
+        so the last result covers whatever changed after the first run started.
+        """
+        if name is not None and name in self.jobs and not self.jobs[name].is_cancelled:
+            job = self.jobs[name]
+            job.coalesced += 1
+            job.rerun = (function, args, on_done)
+            return job
+        running = {"future": self.executor.submit(function, *args), "on_done": on_done}
+
+        def check():
+            future, callback = running["future"], running["on_done"]
+            if not future.done():
+                return
+            if job.rerun is not None:
+                rerun_function, rerun_args, running["on_done"] = job.rerun
+                job.rerun = None
+                running["future"] = self.executor.submit(rerun_function, *rerun_args)
+            else:
+                self.cancel(job)
+            if callback is not None:
+                callback(future.result())
+
+        job = self._add(name, check, (), BACKGROUND_POLL_MS, BACKGROUND_POLL_MS)
+        return job
+
+    def _run(self, job):
+        if job.is_cancelled:
+            return
+        now = time.perf_counter()
+        job.jitter.extend([(now - job.due) * 1000])
+
+        if job.interval_ms is None:
+            self.jobs.pop(job.name, None)
+            job.is_cancelled = True
+        else:
+            # Next fixed deadline, skipping the ones already missed
+            interval = job.interval_ms / 1000
+            job.due += interval
+            if job.due < now:
+                missed = int((now - job.due) // interval) + 1
+                job.coalesced += missed
+                job.due += missed * interval
+            job.after_id = self.widget.after(max(int((job.due - now) * 1000), 0), self._run, job)
+
+        job.function(*job.args)
+
+    def cancel(self, job):
+        if job is None or job.is_cancelled:
+            return
+        job.is_cancelled = True
+        if job.after_id is not None:
+            self.widget.after_cancel(job.after_id)
+        if self.jobs.get(job.name) is job:
+            del self.jobs[job.name]
+
+    def stats(self):
+        """
+        :return: per running job, how late its runs started and how many ticks it skipped
+        """
+        return {name: {"jitter": job.jitter.summary(), "coalesced": job.coalesced} for name, job in self.jobs.items()}
+
+    def shutdown(self):
+        for job in list(self.jobs.values()):
+            self.cancel(job)
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 
 def create_visualiser_csv(data):
@@ -361,18 +465,15 @@ def update_visualiser_temp_file(temp_csv_path):
 
 def extract_hand_pose_data_from_gt_csv(filename):
     """
-    Extract hand pose data from a ground truth CSV file - the ones containing EMG data and hand pose data
-    :param filename: Path to the CSV file
+    Extract hand pose data from a ground truth recording - the ones containing EMG data and hand pose data
+    :param filename: Path to the recording (.semg or CSV)
     :return: Numpy array in the shape of (1, sequence_length, MODEL_OUTPUT_DIM)
     """
 
-    data = pd.read_csv(filename, index_col=False)
-    data = data.to_numpy(dtype=np.float32)
+    # Only the finger joints, from the dataset store if the recording is packed
+    data = load_stored(filename, ["fingers"])
     data = np.expand_dims(data, axis=0)
 
-    # Discard EMG columns
-    data = data[:, :, NUM_FEATURES_PER_SAMPLE:]
-
     # Take only the indices we're interested in
     data = data[:, :, MANUS_LABEL_INDICES]
 
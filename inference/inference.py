@@ -9,13 +9,18 @@ import numpy as np
 import zmq
 
 import helpers
+from acquisition.replay import REPLAY_SPEEDS, worker_replay
+from acquisition.ring_buffer import StreamBus
+from acquisition.supervisor import WorkerSupervisor
 from components import gesture_detail
 from config import FONT, get_user_data_path
 from constants import FEATURE_VECTOR_DIM
+from dataset.store import load_stored
 from inference.worker_inference import (
     worker_myo_receiver,
     worker_inference_res_to_visualiser,
 )
+from myo.data_collection import get_acquisition_daemon
 from myo.worker_myo import worker_myo
 from components.gesture_detail import show_visualisation
 
@@ -36,7 +41,7 @@ class InferenceFromFile(tk.Frame):
         f_path = askopenfilename(
             initialdir=get_user_data_path(),
             title="Select File",
-            filetypes=(("CSV Files", "*.csv*"), ("All Files", "*.*")),
+            filetypes=(("Recordings", "*.semg *.csv"), ("All Files", "*.*")),
         )
 
         self.load_file(f_path)
@@ -100,53 +105,43 @@ class InferenceFromFile(tk.Frame):
     def run_inference_on_file(self, filepath):
         print("Running inference on file " + self.file_label.cget("text"))
 
-        # Open file and send data to the server
-        with open(filepath, "r") as file:
-            send_data = {"from_file": True, "data": []}
-            for line in file:
-                line_data = line.strip().split(",")
-                # Skip header line
-                if "emg" in line_data[0]:
-                    continue
-                # Parse first FEATURE_VECTOR_DIM values as EMG data
-                emg_data = [int(float(x)) for x in line_data[:FEATURE_VECTOR_DIM]]
-                send_data["data"].append(emg_data)
-
-            js = json.dumps(send_data).encode("utf-8")
-            self.inference_frame.pub_socket.send(js)
-
-            # Wait for the result
-            result = self.inference_frame.sub_socket.recv()
-            result = json.loads(result.decode("utf-8"))
-
-            data = result["data"]
-            shape = result["shape"]
-            if shape[1] == 1:
-                print("Inference socket clogged with real time data, skipping...")
-                while shape[1] == 1:
-                    result = self.inference_frame.sub_socket.recv()
-                    result = json.loads(result.decode("utf-8"))
-                    data = result["data"]
-                    shape = result["shape"]
-            print("Received inference result with shape:", shape)
-
-            data = np.array(data).reshape(shape)
-
-            # Convert data to temp CSV
-            temp_csv_path = helpers.create_visualiser_csv(data)
-            helpers.update_visualiser_temp_file(temp_csv_path)
-
-            gesture_detail.show_visualisation()
+        # Load only the EMG data (int8, no copy if the recording is in the dataset store) and send it to the server
+        emg_data = load_stored(filepath, ["emg"], None)[:, :FEATURE_VECTOR_DIM].astype(int)
+        send_data = {"from_file": True, "data": emg_data.tolist()}
+
+        js = json.dumps(send_data).encode("utf-8")
+        self.inference_frame.pub_socket.send(js)
+
+        # Wait for the result
+        result = self.inference_frame.sub_socket.recv()
+        result = json.loads(result.decode("utf-8"))
+
+        data = result["data"]
+        shape = result["shape"]
+        if shape[1] == 1:
+            print("Inference socket clogged with real time data, skipping...")
+            while shape[1] == 1:
+                result = self.inference_frame.sub_socket.recv()
+                result = json.loads(result.decode("utf-8"))
+                data = result["data"]
+                shape = result["shape"]
+        print("Received inference result with shape:", shape)
+
+        data = np.array(data).reshape(shape)
+
+        # Convert data to temp CSV
+        temp_csv_path = helpers.create_visualiser_csv(data)
+        helpers.update_visualiser_temp_file(temp_csv_path)
+
+        gesture_detail.show_visualisation()
 
 
 class InferenceFromLive(tk.Frame):
     def __init__(self, parent, root, inference_frame):
         super().__init__(parent, bg=root.colour_config["bg"])
-        self.p_inference_visualiser_bridge = None
-        self.p_myo = None
-        self.p_myo_receiver = None
-        self.q_myo = None
-        self.q_myo_imu = None
+        self.supervisor = None
+        self.check_terminate_job = None
+        self.bus = None
         self.q_terminate = None
         self.q_myo_ready = None
         self.root = root
@@ -189,55 +184,88 @@ class InferenceFromLive(tk.Frame):
         )
         self.stop_inference_button.pack_configure(pady=10, ipady=5)
 
+        # Feed a recording through the live pipeline instead of the Myo, e.g. to benchmark it
+        replay_frame = tk.Frame(self, bg=self.root.colour_config["bg"])
+        replay_frame.pack_configure(pady=10)
+        self.replay_button = tk.Button(
+            replay_frame,
+            text="Replay Recording",
+            command=self.replay,
+            bg=self.root.colour_config["bg"],
+            fg=self.root.colour_config["fg"],
+            relief=tk.RIDGE,
+            borderwidth=1,
+        )
+        self.replay_button.pack_configure(side=tk.LEFT, ipady=5)
+        self.replay_speed = tk.StringVar(value=list(REPLAY_SPEEDS)[0])
+        tk.OptionMenu(replay_frame, self.replay_speed, *REPLAY_SPEEDS).pack_configure(side=tk.LEFT, padx=5)
+
         self.inference_button.config(width=40)
         self.stop_inference_button.config(width=40)
+        self.replay_button.config(width=26)
 
     def check_terminate_live_inference(self):
+        # Restart crashed workers, stop if one fails for good
+        error = self.supervisor.watch(0)
+        if error is not None:
+            print(error)
+            self.should_terminate_live_inference = True
+
         if self.should_terminate_live_inference:
             print("Terminating live inference")
             self.should_terminate_live_inference = False
-            self.q_terminate.put(True)
+            self.root.scheduler.cancel(self.check_terminate_job)
+
+            # Never hangs on a stuck worker
+            self.supervisor.shutdown()
 
-            self.p_myo.join(1000)
-            self.p_myo_receiver.join(1000)
-            self.p_inference_visualiser_bridge.join(1000)
+            self.bus.close()
+            self.bus.unlink()
+
+    def replay(self):
+        f_path = askopenfilename(
+            initialdir=get_user_data_path(),
+            title="Select Recording to Replay",
+            filetypes=(("Recordings", "*.semg *.csv"), ("All Files", "*.*")),
+        )
+        if f_path:
+            self.infer(replay_path=f_path)
 
-    def infer(self):
+    def infer(self, replay_path=None):
+        """
+        :param replay_path: recording to replay at the selected speed instead of streaming from the Myo
+        """
         print("Infer from live data")
 
-        self.q_myo = multiprocessing.Queue()
-        self.q_myo_imu = multiprocessing.Queue()
+        self.bus = StreamBus()
         self.q_terminate = multiprocessing.Queue()
         self.q_myo_ready = multiprocessing.Queue()
 
-        # Many myo data collection process - same as in data_collection.py
-        self.p_myo = multiprocessing.Process(
-            target=worker_myo,
-            args=(
-                self.q_myo,
-                self.q_myo_imu,
-                self.q_terminate,
-                self.q_myo_ready,
-            ),
-        )
+        self.supervisor = WorkerSupervisor(self.q_terminate)
+        if replay_path is None:
+            # The Myo can only be connected once, release it from the recording daemon
+            get_acquisition_daemon().shutdown()
+            # Many myo data collection process - same as in data_collection.py
+            self.supervisor.add("myo", worker_myo, (self.bus, self.q_terminate, self.q_myo_ready,))
+        else:
+            # A replay runs once, inference keeps running after it ended until stopped
+            speed = REPLAY_SPEEDS[self.replay_speed.get()]
+            self.supervisor.add(
+                "replay",
+                worker_replay,
+                (self.bus, self.q_terminate, self.q_myo_ready, replay_path, speed,),
+                restart=False,
+                finite=True,
+            )
         # Custom myo receiver process
-        self.p_myo_receiver = multiprocessing.Process(
-            target=worker_myo_receiver,
-            args=(
-                self.q_myo,
-                self.q_terminate,
-            ),
+        self.supervisor.add("myo_receiver", worker_myo_receiver, (self.bus, self.q_terminate,))
+        self.supervisor.add(
+            "inference_visualiser_bridge", worker_inference_res_to_visualiser, (self.q_terminate,)
         )
-        self.p_inference_visualiser_bridge = multiprocessing.Process(
-            target=worker_inference_res_to_visualiser, args=(self.q_terminate,)
-        )
-
-        self.p_myo.start()
-        self.p_myo_receiver.start()
-        self.p_inference_visualiser_bridge.start()
+        self.supervisor.start()
 
-        repeating_timer = helpers.RepeatedTimer(
-            0.1, self.check_terminate_live_inference
+        self.check_terminate_job = self.root.scheduler.every(
+            100, self.check_terminate_live_inference, name="live_inference"
         )
 
         # Visualiser to front
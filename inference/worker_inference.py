@@ -5,6 +5,8 @@ import onnxruntime as ort
 import numpy as np
 import zmq
 
+from acquisition.clock import LatencyStats
+
 
 # Port on which we send the live myo data to inference engine
 LIVE_PUB_PORT = 55512
@@ -28,10 +30,10 @@ config = {
 }
 
 
-def worker_myo_receiver(q_myo, q_terminate):
+def worker_myo_receiver(bus, q_terminate):
     """
     Receive processed myo data and send it to INFERENCE
-    :param q_myo: sEMG signals
+    :param bus: StreamBus the Myo worker writes sEMG signals to
     :param q_terminate:
     :return:
     """
@@ -58,14 +60,16 @@ def worker_myo_receiver(q_myo, q_terminate):
     hs = np.float32(hs)
     inputs = np.float32(inputs)
 
+    # Time from a sample arriving on the bus to its inference result being sent
+    latency = LatencyStats()
+
     switch = True
     while q_terminate.empty():
-        while not q_myo.empty():
-            # print("Myo data: ", q_myo.get())
-
-            emg_data = q_myo.get()
-            emg_data = emg_data[:8]
-            emg_data = np.abs(np.array(emg_data))
+        # Zero-copy view of all EMG samples that arrived since the last iteration
+        records = bus.emg.peek()
+        for emg_data in records["emg"]:
+            # Widen before abs(), int8 can't represent abs(-128)
+            emg_data = np.abs(emg_data.astype(np.float32))
 
             # if not switch:
             # switch = not switch
@@ -99,10 +103,15 @@ def worker_myo_receiver(q_myo, q_terminate):
 
             switch = not switch
 
+        if len(records) > 0:
+            latency.extend(bus.clock.now_ms() - records["timestamp"])
+        bus.emg.advance(len(records))
         time.sleep(0.001)
 
     # Kill the pub socket
     pub_to_bridge.close()
+    bus.close()
+    print(f"Inference latency: {latency}")
     print("Myo worker finished.")
 
 
@@ -33,8 +33,11 @@ from config import (
     FONT,
     get_user_data_path,
 )
-from helpers import configure_recursively, get_total_number_of_datapoints
+from dataset.catalog import get_catalog
+from helpers import TkScheduler, configure_recursively, get_total_number_of_datapoints
 from inference.inference import InferenceFrame
+from myo.data_collection import get_acquisition_daemon
+from networking.netz_connector import close_netz_signalling
 
 if os.name == "nt":
     try:
@@ -77,6 +80,8 @@ class App(tk.Tk):
         }
 
         self.wm_protocol("WM_DELETE_WINDOW:q")
+        # All periodic UI work runs through this, on the Tk thread
+        self.scheduler = TkScheduler(self)
         self.create_status_bar()
         self.create_widgets()
 
@@ -130,8 +135,24 @@ class App(tk.Tk):
         self.notebook.select(1)
 
     def update_total_datapoints(self):
-        self.datapoints.set(
-            f"Total number of datapoints: {get_total_number_of_datapoints()}"
+        # Walks every recording, so it runs in the background. Requests while it runs are coalesced
+        self.scheduler.run_in_background(
+            get_total_number_of_datapoints,
+            on_done=lambda total: self.datapoints.set(f"Total number of datapoints: {total}"),
+            name="total_datapoints",
+        )
+
+    def show_stream_rates(self, rates):
+        """
+        Show the measured rate of each stream in the status bar
+        :param rates: dict of stream name -> Hz, None to clear
+        """
+        if rates is None:
+            self.stream_rates.set("")
+            return
+        self.stream_rates_label.configure(bg=self.status_bar.cget("bg"))
+        self.stream_rates.set(
+            "   ".join(f"{name.upper()} {rate:.0f} Hz" for name, rate in rates.items())
         )
 
     def create_status_bar(self):
@@ -157,6 +178,17 @@ class App(tk.Tk):
         self.update_total_datapoints()
         self.datapoints_label.pack(side=tk.RIGHT, padx=10)
 
+        # Live stream rates during a recording
+        self.stream_rates = tk.StringVar()
+        self.stream_rates_label = tk.Label(
+            self.status_bar,
+            bg=self.status_bar_bg,
+            textvariable=self.stream_rates,
+            fg="white",
+            anchor="e",
+        )
+        self.stream_rates_label.pack(side=tk.RIGHT, padx=10)
+
         # Light/dark theme toggle button
         # Load the ico file
         photo_image = ImageTk.PhotoImage(file="resources/day-and-night.ico")
@@ -191,16 +223,10 @@ class App(tk.Tk):
             fg=self.colour_config["fg"],
         ).pack(pady=(10, 0))
 
-        user_folder = get_user_data_path(f"u_{user_id}")
-        if not os.path.isdir(user_folder):
-            return
-        session_folders = [
-            folder for folder in os.listdir(user_folder) if folder.startswith("s_")
-        ]
-
-        for session_folder in sorted(
-            session_folders, key=lambda x: int(x.split("_")[1])
-        ):
+        # Sessions in order of their ID, from the dataset catalog
+        catalog = get_catalog()
+        catalog.refresh(f"u_{user_id}")
+        for session_folder in catalog.sessions(f"u_{user_id}"):
             session_id = session_folder.split("_")[1]
             session_detail = SessionDetail(
                 self.detail_frame.interior, user_id, session_id, self
@@ -223,9 +249,9 @@ class App(tk.Tk):
         ensure_user_data_dir()
         user_folder = get_user_data_path(f"u_{user_id}")
         os.makedirs(user_folder, exist_ok=True)
-        existing_sessions = [
-            folder for folder in os.listdir(user_folder) if folder.startswith("s_")
-        ]
+        catalog = get_catalog()
+        catalog.refresh(f"u_{user_id}")
+        existing_sessions = catalog.sessions(f"u_{user_id}")
         next_session_id = (
             1
             if not existing_sessions
@@ -286,6 +312,11 @@ class App(tk.Tk):
         if p_visualiser is not None:
             p_visualiser.wait()
 
+        # Disconnect the Myo and MANUS
+        get_acquisition_daemon().shutdown()
+        close_netz_signalling()
+
+        self.scheduler.shutdown()
         self.destroy()
 
 
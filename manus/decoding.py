@@ -0,0 +1,88 @@
+import struct
+import time
+
+import numpy as np
+
+# A MANUS packet as sent by the SDKClient, 104 bytes, little endian:
+# - 20 floats finger data as (thumb, index, middle, ring, pinky) x (mcp_stretch, mcp_bend, pip_bend, dip_bend)
+# - 4 floats wrist orientation quaternion as (x, y, z, w)
+# - 1 long long sender timestamp
+MANUS_PACKET_DTYPE = np.dtype(
+    [
+        ("fingers", "<f4", (20,)),
+        ("wrist_quat", "<f4", (4,)),
+        ("timestamp", "<i8"),
+    ]
+)
+MANUS_PACKET_SIZE = MANUS_PACKET_DTYPE.itemsize
+
+
+def decode_frames(messages):
+    """
+    Decode a batch of raw MANUS messages with a single np.frombuffer call.
+    Messages that don't have the packet size are skipped.
+    :param messages: list of bytes objects, one per received frame
+    :return: read-only structured array of MANUS_PACKET_DTYPE, one record per valid frame
+    """
+    valid = [message for message in messages if len(message) == MANUS_PACKET_SIZE]
+    if len(valid) < len(messages):
+        print(f"Skipped {len(messages) - len(valid)} malformed MANUS packet(s)")
+
+    return np.frombuffer(b"".join(valid), dtype=MANUS_PACKET_DTYPE)
+
+
+def decode_frame(message):
+    """
+    Decode a single raw MANUS message.
+    :return: structured record of MANUS_PACKET_DTYPE
+    """
+    return np.frombuffer(message, dtype=MANUS_PACKET_DTYPE, count=1)[0]
+
+
+def _decode_frame_struct(message):
+    """
+    The original struct based parser, kept as a reference for the benchmark.
+    """
+    finger_data = struct.unpack("20f", message[0:80])
+    wrist_quat = struct.unpack("4f", message[80:96])
+    timestamp = struct.unpack("q", message[96:104])
+
+    data = list(finger_data)
+    data += list(wrist_quat)
+    data.append(timestamp[0])
+    return data
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    N_FRAMES = 100000
+
+    # Random frames in the wire format
+    frames = np.zeros(N_FRAMES, dtype=MANUS_PACKET_DTYPE)
+    frames["fingers"] = rng.normal(size=(N_FRAMES, 20))
+    frames["wrist_quat"] = rng.normal(size=(N_FRAMES, 4))
+    frames["timestamp"] = np.arange(N_FRAMES)
+    messages = [frame.tobytes() for frame in frames]
+
+    timer = time.perf_counter()
+    legacy = [_decode_frame_struct(message) for message in messages]
+    t_struct = (time.perf_counter() - timer) / N_FRAMES
+
+    # Both decoders must agree
+    assert np.allclose(np.array(legacy)[:, :24], np.concatenate((frames["fingers"], frames["wrist_quat"]), axis=1))
+    assert np.array_equal(np.array([row[-1] for row in legacy]), frames["timestamp"])
+
+    print(f"struct, per frame: {t_struct * 1e6:.2f} us/frame")
+
+    # A poll wake-up typically drains a handful of frames, so compare a few batch sizes
+    for batch_size in [1, 10, 100, 1000]:
+        timer = time.perf_counter()
+        for start in range(0, N_FRAMES, batch_size):
+            decoded = decode_frames(messages[start : start + batch_size])
+        t_batch = (time.perf_counter() - timer) / N_FRAMES
+        print(
+            f"np.frombuffer, batches of {batch_size:>4}: {t_batch * 1e6:.2f} us/frame "
+            f"({t_struct / t_batch:.1f}x)"
+        )
+
+    assert np.array_equal(decode_frames(messages), frames)
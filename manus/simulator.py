@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+import zmq
+
+from acquisition.devices import MANUS_SR
+from manus.decoding import MANUS_PACKET_DTYPE, MANUS_PACKET_SIZE
+from manus.worker_manus import MANUS_ENDPOINT
+
+# Synthetic gestures: the fingers close and open once every GESTURE_PERIOD_SECONDS (device time)
+GESTURE_PERIOD_SECONDS = 6
+# Joint angle range in degrees
+MAX_BEND = 90
+JOINT_NOISE = 0.5
+# Longest the sender sleeps between two checks for termination
+MAX_SLEEP_SECONDS = 0.01
+
+
+def synthesise_frames(t, rng):
+    """
+    MANUS packets at the given device times: all fingers bending together, wrist rolling with the forearm.
+    :param t: 1D array of device times in seconds
+    :return: structured array of MANUS_PACKET_DTYPE, the timestamp field is left to the caller
+    """
+    frames = np.zeros(len(t), dtype=MANUS_PACKET_DTYPE)
+    bend = MAX_BEND / 2 * (1 - np.cos(2 * np.pi * t / GESTURE_PERIOD_SECONDS))
+    frames["fingers"] = bend[:, None] + rng.normal(0, JOINT_NOISE, (len(t), 20))
+
+    angle = np.pi / 4 * np.sin(2 * np.pi * t / GESTURE_PERIOD_SECONDS)
+    # (x, y, z, w) as in the packet
+    frames["wrist_quat"][:, 0] = np.sin(angle / 2)
+    frames["wrist_quat"][:, 3] = np.cos(angle / 2)
+    return frames
+
+
+def worker_manus_simulator(q_terminate, device=None):
+    """
+    Stand-in for the MANUS SDKClient: pushes synthetic 104 byte packets at MANUS_SR to the endpoint
+    worker_manus connects to. The sender timestamps are epoch milliseconds of a device clock that runs
+    "speed" times faster than real time, so worker_manus has to map them onto the session clock as usual.
+    :param device: manifest entry of the simulated glove, uses its "endpoint" and "speed"
+    """
+    device = {} if device is None else device
+    speed = float(device.get("speed", 1))
+    rng = np.random.default_rng(0)
+
+    context = zmq.Context()
+    socket = context.socket(zmq.PUSH)
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.bind(device.get("endpoint", MANUS_ENDPOINT))
+    print(f"Simulated MANUS glove streaming to {device.get('endpoint', MANUS_ENDPOINT)} ({speed:g}x real time)")
+
+    start_time = time.perf_counter()
+    start_epoch_ms = int(time.time() * 1000)
+    sent = 0
+
+    while q_terminate.empty():
+        now = (time.perf_counter() - start_time) * speed
+        due = int(now * MANUS_SR)
+        if due <= sent:
+            time.sleep(min((sent + 1) / MANUS_SR - now, MAX_SLEEP_SECONDS * speed) / speed)
+            continue
+
+        t = np.arange(sent, due) / MANUS_SR
+        frames = synthesise_frames(t, rng)
+        frames["timestamp"] = start_epoch_ms + np.round(t * 1000).astype(np.int64)
+        payload = frames.tobytes()
+        for i in range(len(frames)):
+            # One message per packet, like the SDK client
+            socket.send(payload[i * MANUS_PACKET_SIZE : (i + 1) * MANUS_PACKET_SIZE])
+        sent = due
+
+    socket.close()
+    context.term()
+    print("Simulated MANUS glove finished")
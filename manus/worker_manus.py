@@ -1,39 +1,84 @@
-import struct
-
+import numpy as np
 import zmq
 
+from acquisition.clock import ClockOffsetEstimator
+from acquisition.devices import stream_name
+from manus.decoding import decode_frames
+
+# How long a single poll may block before we re-check for termination
+POLL_TIMEOUT_MS = 50
+# Where the MANUS SDK client pushes its packets to
+MANUS_ENDPOINT = "tcp://127.0.0.1:5555"
+
+DEFAULT_MANUS = {"type": "manus", "name": "manus"}
+
+
+def worker_manus(bus, q_terminate, q_ready=None, device=DEFAULT_MANUS):
+    """
+    Ingest process of one MANUS glove.
+    :param q_ready: gets the device name once the socket is set up
+    :param device: manifest entry of the glove, decides its stream on the bus and the endpoint to connect to
+    """
+    ring = bus.rings[stream_name(device, "manus")]
 
-def worker_manus(q, q_terminate):
     # Prepare our context and socket
     context = zmq.Context()
     socket = context.socket(zmq.PULL)
+    # Don't wait for undelivered messages on close
+    socket.setsockopt(zmq.LINGER, 0)
 
     # Connect to the server socket
-    socket.connect("tcp://127.0.0.1:5555")
+    socket.connect(device.get("endpoint", MANUS_ENDPOINT))
+    if q_ready is not None:
+        q_ready.put(device["name"])
+
+    # Maps the MANUS sender clock onto the session clock
+    estimator = ClockOffsetEstimator()
+
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
 
     # Worker function
     while q_terminate.empty():
-        # Receive raw bytes from MANUS
-        message = socket.recv()
+        # Wait for data, but never longer than POLL_TIMEOUT_MS so that we notice termination
+        events = dict(poller.poll(POLL_TIMEOUT_MS))
+        if socket not in events:
+            continue
+
+        # Drain everything that is pending right now
+        messages = []
+        while True:
+            try:
+                # Receive raw bytes from MANUS
+                messages.append(socket.recv(zmq.NOBLOCK))
+            except zmq.Again:
+                break
+
+        arrival_ms = bus.clock.now_ms()
 
-        # Parse: The first 20 floats in a message are the finger data
-        # coming in as (thumb, index, middle, ring, pinky)
-        # and for each, (mcp_stretch, mcp_bend, pip_bend, dip_bend)
-        finger_data = struct.unpack("20f", message[0:80])
+        # Decode the whole batch at once
+        frames = decode_frames(messages)
+        if len(frames) == 0:
+            continue
 
-        # The next 4 floats are the quaternion describing the wrist orientation
-        # coming in as (x, y, z, w)
-        wrist_quat = struct.unpack("4f", message[80:96])
+        # The newest frame has spent the least time in buffers, use it to track the sender clock
+        estimator.update(frames["timestamp"][-1], arrival_ms)
 
-        # At position 20 we have the timestamp - q is a long long (8 bytes)
-        timestamp = struct.unpack("q", message[96:104])
+        records = np.empty(len(frames), dtype=ring.dtype)
+        records["fingers"] = frames["fingers"]
+        records["wrist_quat"] = frames["wrist_quat"]
+        records["device_timestamp"] = frames["timestamp"]
+        records["timestamp"] = estimator.to_host(frames["timestamp"])
 
-        data = list(finger_data)
-        data += list(wrist_quat)
-        data.append(timestamp[0])
+        # Forward the whole batch to the MANUS ring
+        ring.push_many(records)
 
-        # Add to the queue
-        q.put(data)
+    if estimator.is_ready:
+        print(
+            f"{device['name']} clock drift: {estimator.drift_ppm:.1f} ppm, "
+            f"residual jitter: {estimator.residual_ms:.2f} ms"
+        )
 
     socket.close()
     context.term()
+    bus.close()
@@ -1,46 +1,244 @@
 import multiprocessing
-import time
-
-import numpy as np
+import threading
 
+from acquisition.devices import load_manifest
+from acquisition.recording_writer import (
+    PRE_TRIGGER_SECONDS,
+    RECORDER_ARM,
+    RECORDER_CANCEL,
+    RECORDER_FINISH,
+    RECORDER_SHUTDOWN,
+    worker_recorder,
+)
+from acquisition.ring_buffer import StreamBus
+from acquisition.supervisor import SHUTDOWN_TIMEOUT, WorkerSupervisor, stop_processes
 from myo.worker_myo import worker_myo
+from manus.simulator import worker_manus_simulator
 from manus.worker_manus import worker_manus
 
+# The first second after connecting is unstable, takes can only start after it
+WARMUP_SECONDS = 1
+
+# Ingest process per device type, called as worker(bus, q_terminate, q_ready, device)
+DEVICE_WORKERS = {
+    "myo": worker_myo,
+    "manus": worker_manus,
+}
 
-def worker_collection(q_myo, q_myo_imu, q_manus, q_terminate, q_myo_ready):
-    p_myo = multiprocessing.Process(target=worker_myo, args=(q_myo, q_myo_imu, q_terminate, q_myo_ready,))
-    p_manus = multiprocessing.Process(target=worker_manus, args=(q_manus, q_terminate,))
-    p_myo.start()
-    p_manus.start()
+# Out-of-process stand-ins for devices with "simulated" set, called as simulator(q_terminate, device).
+# The simulated Myo runs inside worker_myo instead, like the real one
+DEVICE_SIMULATORS = {
+    "manus": worker_manus_simulator,
+}
 
-    # emgs is a list of lists acting like a queue
-    timer = time.time()
-    avg_fps = 0
-    counter = 0
+
+def worker_collection(bus, q_terminate, q_ready, q_recorder_control, q_recorder_result):
+    supervisor = WorkerSupervisor(q_terminate)
+    # Start the recorder first so that it consumes the streams from the first sample on.
+    # It holds the state of the current take, so a crash can't be papered over with a restart
+    supervisor.add("recorder", worker_recorder, (bus, q_recorder_control, q_recorder_result,), restart=False)
+    # One ingest process per device, each writes to its own rings, so nothing is shared per sample
+    for device in bus.manifest:
+        if device.get("simulated") and device["type"] in DEVICE_SIMULATORS:
+            supervisor.add(f"{device['name']}_simulator", DEVICE_SIMULATORS[device["type"]], (q_terminate, device,))
+        supervisor.add(device["name"], DEVICE_WORKERS[device["type"]], (bus, q_terminate, q_ready, device,))
+    supervisor.start()
 
     try:
-        # while session_detail.is_recording:
+        # Keep the devices connected until the session ends or a worker fails for good
         while q_terminate.empty():
-            time.sleep(0.01)
+            error = supervisor.watch(0.1)
+            if error is not None:
+                print(error)
+                # Surface the error to the app, this also stops the other workers
+                q_terminate.put(error)
 
     except KeyboardInterrupt:
-        print("Avg fps: ", counter / (time.time() - timer))
-        print("Finished recording")
-        # Close the socket and context
-        # socket.close()
-        # context.term()
-
-    # Finished
-    p_myo.join(100)
-    p_manus.join(100)
-
-
-def start_recording(q_myo, q_myo_imu, q_manus, q_terminate, q_myo_ready):
-    # Clear all queues
-    q_myo.empty()
-    q_myo_imu.empty()
-    q_manus.empty()
-
-    # Start a new recording
-    p_collection = multiprocessing.Process(target=worker_collection, args=(q_myo, q_myo_imu, q_manus, q_terminate, q_myo_ready,))
-    p_collection.start()
+        print("Finished acquisition")
+
+    # Finished - the recorder doesn't watch q_terminate
+    q_recorder_control.put((RECORDER_SHUTDOWN,))
+    supervisor.shutdown()
+
+
+class AcquisitionDaemon(object):
+    """
+    Keeps the devices of the manifest (by default a Myo and the MANUS glove) and the recorder alive for
+    a whole session, so the seconds of Myo setup are paid once instead of once per take.
+    A take is just an arm/disarm pair of commands marking its start and stop in the live streams.
+    """
+
+    def __init__(self, manifest=None):
+        """
+        :param manifest: list of devices, defaults to the configured device manifest
+        """
+        self.manifest = manifest
+        # Whoever records takes over the daemon right now, one at a time across the whole app
+        self.owner = None
+        # Takes shut the daemon down in the background, the app may do it on close at the same time
+        self.shutdown_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.bus = None
+        self.p_collection = None
+        self.q_terminate = None
+        self.q_ready = None
+        # Names of the devices that are connected
+        self.ready_devices = set()
+        self.q_recorder_control = None
+        self.q_recorder_result = None
+
+        # Session time the last device reported ready
+        self.ready_ms = None
+        self.error = None
+        # Session time the current take was armed at
+        self.arm_ms = 0
+
+    def claim(self, owner):
+        """
+        Reserve the daemon for the takes of owner, e.g. a GestureDetail or the ProtocolRunner.
+        All of them share the one recorder, a take armed by another owner would cancel the running one.
+        :return: True if owner has the daemon now, False if another owner is still using it
+        """
+        if self.owner is not None and self.owner is not owner:
+            return False
+        self.owner = owner
+        return True
+
+    def release(self, owner):
+        """
+        Give the daemon back once the take of owner is over, including its disconnect if it failed.
+        """
+        if self.owner is owner:
+            self.owner = None
+
+    def is_running(self):
+        return self.p_collection is not None and self.p_collection.is_alive()
+
+    def start(self):
+        """
+        Connect the devices, unless that already happened.
+        """
+        if self.is_running() and self.error is None:
+            return
+        # Clean up after a failed daemon
+        self.shutdown()
+
+        # Shared memory streams of all devices of the session
+        manifest = load_manifest() if self.manifest is None else self.manifest
+        self.bus = StreamBus(manifest=manifest)
+        # Helper q to terminate the workers, they put their error string in here if they fail
+        self.q_terminate = multiprocessing.Queue()
+        # Helper q the devices put their name into once they are connected
+        self.q_ready = multiprocessing.Queue()
+        self.q_recorder_control = multiprocessing.Queue()
+        self.q_recorder_result = multiprocessing.Queue()
+
+        self.p_collection = multiprocessing.Process(
+            target=worker_collection,
+            args=(
+                self.bus,
+                self.q_terminate,
+                self.q_ready,
+                self.q_recorder_control,
+                self.q_recorder_result,
+            ),
+        )
+        self.p_collection.start()
+
+    def is_connected(self):
+        """
+        :return: True once all devices of the manifest reported ready
+        """
+        if self.ready_ms is None:
+            if self.q_ready is None:
+                return False
+            while not self.q_ready.empty():
+                self.ready_devices.add(self.q_ready.get())
+            if len(self.ready_devices) < len(self.bus.manifest):
+                return False
+            self.ready_ms = self.bus.clock.now_ms()
+        return True
+
+    def is_ready(self):
+        """
+        :return: True once all devices are connected and have been streaming for WARMUP_SECONDS
+        """
+        return self.is_connected() and self.bus.clock.now_ms() - self.ready_ms >= WARMUP_SECONDS * 1000
+
+    def check_error(self):
+        """
+        :return: the error string of a failed worker, None if everything is fine
+        """
+        if self.error is None and self.q_terminate is not None and not self.q_terminate.empty():
+            self.error = str(self.q_terminate.get())
+            # Put a token back, so the remaining workers see the termination request too
+            self.q_terminate.put(True)
+        return self.error
+
+    def arm(self, folder, speed, pre_roll=0, resample=False, block=False):
+        """
+        Start recording a take into folder from now on.
+        :param pre_roll: seconds before now to include in the take, at most PRE_TRIGGER_SECONDS
+        :param resample: interpolate all streams onto the exact MYO_SR grid instead of nearest-neighbour alignment
+        :param block: record until disarmed and split the capture into one recording per detected trial
+        """
+        self.arm_ms = self.bus.clock.now_ms()
+        start_ms = self.arm_ms - min(pre_roll, PRE_TRIGGER_SECONDS) * 1000
+        self.q_recorder_control.put((RECORDER_ARM, folder, speed, start_ms, resample, block))
+
+    def seconds_since_arm(self):
+        """
+        How much EMG has been streamed since the take was armed, from the shared stream counters.
+        """
+        return max(0.0, (self.bus.master.last_timestamp - self.arm_ms) / 1000)
+
+    def disarm(self, keep=True):
+        """
+        Stop the current take now. Its outcome arrives via poll_result().
+        :param keep: save the take if True, discard it otherwise
+        """
+        if keep:
+            self.q_recorder_control.put((RECORDER_FINISH, self.bus.clock.now_ms()))
+        else:
+            self.q_recorder_control.put((RECORDER_CANCEL,))
+
+    def poll_result(self):
+        """
+        :return: the result dict of the last disarmed take, None if it isn't written yet
+        """
+        if self.q_recorder_result is None or self.q_recorder_result.empty():
+            return None
+        return self.q_recorder_result.get()
+
+    def shutdown(self):
+        """
+        Disconnect the devices and stop all workers, e.g. to hand the Myo over to inference.
+        Blocks for up to SHUTDOWN_TIMEOUT + 2 s, from the UI run it with TkScheduler.run_in_background.
+        """
+        with self.shutdown_lock:
+            if self.p_collection is None:
+                return
+
+            self.q_recorder_control.put((RECORDER_SHUTDOWN,))
+            self.q_terminate.put(True)
+            # worker_collection tears its workers down within SHUTDOWN_TIMEOUT, give it a little extra for that
+            stop_processes([self.p_collection], SHUTDOWN_TIMEOUT + 2)
+
+            # The workers only hold their own mapping of the streams
+            self.bus.close()
+            self.bus.unlink()
+
+            self._reset()
+
+
+# One daemon per app
+_acquisition_daemon = None
+
+
+def get_acquisition_daemon():
+    global _acquisition_daemon
+    if _acquisition_daemon is None:
+        _acquisition_daemon = AcquisitionDaemon()
+    return _acquisition_daemon
@@ -0,0 +1,116 @@
+import time
+
+import numpy as np
+from pyomyo import emg_mode
+
+from acquisition.devices import MYO_IMU_SR
+from constants import MYO_SR
+
+# The Myo sends two EMG samples per BLE notification
+EMG_SAMPLES_PER_PACKET = 2
+# Raw IMU units as sent by the armband (myohw_orientation_scale, myohw_accelerometer_scale)
+ORIENTATION_SCALE = 16384
+ACCELEROMETER_SCALE = 2048
+# Synthetic gestures: GESTURE_SECONDS of activity every GESTURE_PERIOD_SECONDS (device time)
+GESTURE_PERIOD_SECONDS = 6
+GESTURE_SECONDS = 2
+REST_EMG_STD = 3
+ACTIVE_EMG_STD = 40
+# Longest a single run() call sleeps, like the serial read timeout of the real dongle
+MAX_SLEEP_SECONDS = 0.01
+
+
+class SimulatedMyo(object):
+    """
+    Stand-in for pyomyo.Myo when no armband is at hand. run() fires the EMG and IMU handlers with synthetic data
+    at the rates of the real device, with the same packetisation (two EMG samples per notification), so the
+    ingest path downstream of the handlers is exercised exactly as with hardware.
+    The device clock can run faster than real time to load-test the pipeline.
+    """
+
+    def __init__(self, tty=None, mode=emg_mode.FILTERED, speed=1.0, seed=0):
+        """
+        :param tty: ignored, for compatibility with pyomyo.Myo
+        :param speed: real-time factor, 10 streams 10 s of data per second
+        """
+        self.mode = mode
+        self.speed = float(speed)
+        self.rng = np.random.default_rng(seed)
+
+        self.emg_handlers = []
+        self.imu_handlers = []
+        self.battery_handlers = []
+
+        self.start_time = None
+        # Packets sent so far
+        self.emg_packets = 0
+        self.imu_packets = 0
+
+    def connect(self, addr=None, kill_connection=None):
+        self.start_time = time.perf_counter()
+        print(f"Connected to a simulated Myo ({self.speed:g}x real time)")
+        for handler in self.battery_handlers:
+            handler(100)
+
+    def disconnect(self):
+        self.start_time = None
+
+    def add_emg_handler(self, h):
+        self.emg_handlers.append(h)
+
+    def add_imu_handler(self, h):
+        self.imu_handlers.append(h)
+
+    def add_battery_handler(self, h):
+        self.battery_handlers.append(h)
+
+    def set_leds(self, logo, line):
+        pass
+
+    def vibrate(self, length):
+        pass
+
+    def device_seconds(self):
+        return (time.perf_counter() - self.start_time) * self.speed
+
+    def run(self):
+        """
+        Send every packet that is due by now, or wait for the next one.
+        """
+        now = self.device_seconds()
+        emg_due = int(now * MYO_SR / EMG_SAMPLES_PER_PACKET)
+        imu_due = int(now * MYO_IMU_SR)
+
+        if emg_due <= self.emg_packets and imu_due <= self.imu_packets:
+            next_emg = (self.emg_packets + 1) * EMG_SAMPLES_PER_PACKET / MYO_SR
+            next_imu = (self.imu_packets + 1) / MYO_IMU_SR
+            time.sleep(min(min(next_emg, next_imu) - now, MAX_SLEEP_SECONDS * self.speed) / self.speed)
+            return
+
+        while self.emg_packets < emg_due:
+            t = self.emg_packets * EMG_SAMPLES_PER_PACKET / MYO_SR
+            for sample in self._emg_packet(t):
+                for handler in self.emg_handlers:
+                    handler(sample, 0)
+            self.emg_packets += 1
+
+        while self.imu_packets < imu_due:
+            quat, acc, gyro = self._imu_packet(self.imu_packets / MYO_IMU_SR)
+            for handler in self.imu_handlers:
+                handler(quat, acc, gyro)
+            self.imu_packets += 1
+
+    def _emg_packet(self, t):
+        # Bursts of activity on top of resting noise
+        is_active = t % GESTURE_PERIOD_SECONDS < GESTURE_SECONDS
+        std = ACTIVE_EMG_STD if is_active else REST_EMG_STD
+        samples = self.rng.normal(0, std, (EMG_SAMPLES_PER_PACKET, 8))
+        return [tuple(sample) for sample in np.clip(samples, -128, 127).astype(np.int8).tolist()]
+
+    def _imu_packet(self, t):
+        # Forearm slowly rotating about its axis
+        angle = np.pi / 4 * np.sin(2 * np.pi * t / GESTURE_PERIOD_SECONDS)
+        quat = np.array([np.cos(angle / 2), np.sin(angle / 2), 0, 0]) * ORIENTATION_SCALE
+        acc = np.array([0, 0, 1]) * ACCELEROMETER_SCALE
+        gyro = self.rng.normal(0, 5, 3)
+        return tuple(quat.astype(int)), tuple(acc.astype(int)), tuple(gyro.astype(int))
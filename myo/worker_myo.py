@@ -1,39 +1,52 @@
-import datetime
-
 from pyomyo import Myo, emg_mode
 
+from acquisition.devices import stream_name
+from myo.simulator import SimulatedMyo
+
+DEFAULT_MYO = {"type": "myo", "name": "myo"}
+
+
+def worker_myo(bus, q_terminate, q_myo_ready, device=DEFAULT_MYO):
+    """
+    Ingest process of one Myo armband.
+    :param device: manifest entry of the armband, decides its streams on the bus and which armband to connect to
+    """
+    emg_ring = bus.rings[stream_name(device, "emg")]
+    imu_ring = bus.rings[stream_name(device, "imu")]
 
-def worker_myo(q_out, q_imu_out, q_terminate, q_myo_ready):
     m = None
     try:
-        m = Myo(mode=emg_mode.FILTERED)
+        if device.get("simulated"):
+            m = SimulatedMyo(mode=emg_mode.FILTERED, speed=device.get("speed", 1))
+        else:
+            m = Myo(tty=device.get("tty"), mode=emg_mode.FILTERED)
         # m = Myo(mode=emg_mode.PREPROCESSED)
     except ValueError as e:
         print(e)
         # Add to terminate queue to stop the worker
         q_terminate.put(str(e))
         return None
-    m.connect(kill_connection=q_terminate)
+    if device.get("address") is not None:
+        # Several armbands share the session, connect to the right one
+        m.connect(addr=device["address"], kill_connection=q_terminate)
+    else:
+        m.connect(kill_connection=q_terminate)
 
     def add_to_queue(emg, moving):
-        # Get timestamp since epoch in milliseconds
-        timestamp = datetime.datetime.now().timestamp() * 1000
-
-        data = list(emg)
-        data.append(timestamp)
+        # Get timestamp on the session clock in milliseconds
+        timestamp = bus.clock.now_ms()
 
-        q_out.put(data)
+        emg_ring.push((emg, timestamp))
 
     def add_to_imu_queue(quat, acc, gyro):
-        # Get timestamp since epoch in milliseconds
-        timestamp = datetime.datetime.now().timestamp() * 1000
+        # Get timestamp on the session clock in milliseconds
+        timestamp = bus.clock.now_ms()
 
         data = list(quat)
         data.extend(list(acc))
         data.extend(list(gyro))
-        data.append(timestamp)
 
-        q_imu_out.put(data)
+        imu_ring.push((data, timestamp))
 
     m.add_emg_handler(add_to_queue)
     m.add_imu_handler(add_to_imu_queue)
@@ -49,10 +62,11 @@ def worker_myo(q_out, q_imu_out, q_terminate, q_myo_ready):
     # Vibrate to know we connected okay
     m.vibrate(1)
 
-    q_myo_ready.put(True)
+    q_myo_ready.put(device["name"])
 
     """worker function"""
     while q_terminate.empty():
         m.run()
 
-    print("Myo worker finished")
\ No newline at end of file
+    bus.close()
+    print("Myo worker finished")
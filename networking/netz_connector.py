@@ -1,35 +1,148 @@
+import selectors
 import socket
+import threading
+import time
 
+# Netz (Unity) listens for the gesture name on this port, and sends its events to NETZ_FINISHED_PORT
+NETZ_PORT = 11000
+NETZ_FINISHED_PORT = 12345
+# Seconds Unity needs after the gesture name before it starts the gesture.
+# Only waited for if Netz doesn't acknowledge the gesture with NETZ_STARTED
+NETZ_STARTUP_DELAY = 1
+# Longest a take waits for NETZ_FINISHED before it is given up
+NETZ_FINISH_TIMEOUT = 120
+# How long the listener blocks before it re-checks for close()
+LISTEN_TIMEOUT = 0.1
 
-def listen_for_netz_finished_process(q_finished):
+# Messages Netz sends to NETZ_FINISHED_PORT: it started playing the gesture, and it finished it.
+# NETZ_STARTED is an addition to the protocol that the current Netz (Unity) build doesn't send yet,
+# until it does every take waits the full NETZ_STARTUP_DELAY. See "Netz (XRMI) Signalling" in the README
+NETZ_STARTED = b"netz_started"
+NETZ_FINISHED = b"netz_finished"
+
+# Broadcast on every interface, we don't know which network Netz is on
+interfaces = socket.getaddrinfo(
+    host=socket.gethostname(), port=None, family=socket.AF_INET
+)
+allips = [ip[-1][0] for ip in interfaces]
+# allips.append("127.0.0.1")
+
+
+class NetzTake(object):
     """
-    Listen for the Netz finished event through UDP
-    :param q_finished: the queue to put the finished event into
-    :return:
+    One XRMI take from Netz' point of view, all checks are non-blocking so they can be polled from the Tk loop.
     """
 
-    # Create a UDP socket
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    def __init__(self, signalling, gesture):
+        self.signalling = signalling
+        self.gesture = gesture
+        self.sent_at = time.perf_counter()
+
+    def _received(self, message):
+        return self.signalling.last_received(message) >= self.sent_at
+
+    def is_acknowledged(self):
+        return self._received(NETZ_STARTED)
+
+    def is_started(self):
+        """
+        Netz plays the gesture: it said so, or NETZ_STARTUP_DELAY passed for a Netz that doesn't acknowledge.
+        """
+        return self.is_acknowledged() or time.perf_counter() - self.sent_at >= NETZ_STARTUP_DELAY
+
+    def is_finished(self):
+        return self._received(NETZ_FINISHED)
+
+    def is_timed_out(self):
+        return not self.is_finished() and time.perf_counter() - self.sent_at > NETZ_FINISH_TIMEOUT
+
+
+class NetzSignalling(object):
+    """
+    Long-lived UDP channel to Netz: one pre-bound broadcast socket per interface for sending and one listener
+    thread that routes whatever Netz sends by message, so a stray datagram doesn't end anything.
+    """
+
+    def __init__(self):
+        self.send_sockets = []
+        for ip in allips:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            sock.bind((ip, 0))
+            self.send_sockets.append(sock)
+
+        self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.listen_socket.bind(("", NETZ_FINISHED_PORT))
+        self.listen_socket.setblocking(False)
+
+        # Message -> time.perf_counter() it was last received at
+        self.received = {}
+        self.is_closed = False
+        self.thread = threading.Thread(target=self._listen, daemon=True)
+        self.thread.start()
+
+    def _listen(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.listen_socket, selectors.EVENT_READ)
+        while not self.is_closed:
+            if not selector.select(LISTEN_TIMEOUT):
+                continue
+            try:
+                data, address = self.listen_socket.recvfrom(4096)
+            except (BlockingIOError, OSError):
+                continue
+
+            message = data.strip()
+            if message in (NETZ_STARTED, NETZ_FINISHED):
+                self.received[message] = time.perf_counter()
+            else:
+                print(f"Ignoring unknown Netz message {data!r} from {address}")
+        selector.close()
+
+    def last_received(self, message):
+        """
+        :return: time.perf_counter() the message was last received at, -inf if never
+        """
+        return self.received.get(message, -float("inf"))
+
+    def start_take(self, gesture):
+        """
+        Tell Netz which gesture is recorded next, it plays it after NETZ_STARTUP_DELAY.
+        :return: NetzTake to poll for the start and the end of the gesture
+        """
+        take = NetzTake(self, gesture)
+        # Message content is the name of the gesture
+        message = gesture.encode("utf-8")
+        for sock in self.send_sockets:
+            try:
+                sock.sendto(message, ("255.255.255.255", NETZ_PORT))
+            except OSError as e:
+                # An interface that went away doesn't stop the others
+                print(f"Sending to Netz on {sock.getsockname()[0]} failed: {e}")
+        return take
+
+    def close(self):
+        self.is_closed = True
+        self.thread.join(LISTEN_TIMEOUT * 2)
+        for sock in self.send_sockets:
+            sock.close()
+        self.listen_socket.close()
+
 
-    # Bind the socket to the port
-    server_address = ('', 12345)
-    print('starting up on {} port {}'.format(*server_address))
-    sock.bind(server_address)
+# One channel per app, the listener port can only be bound once
+_netz_signalling = None
 
-    while True:
-        print('\nwaiting to receive message')
-        data, address = sock.recvfrom(4096)
 
-        print('received {} bytes from {}'.format(len(data), address))
-        print(data)
+def get_netz_signalling():
+    global _netz_signalling
+    if _netz_signalling is None:
+        _netz_signalling = NetzSignalling()
+    return _netz_signalling
 
-        if data == b'netz_finished':
-            q_finished.put(True)
-            break
-        else:
-            print('received unknown message')
-            break
 
-    print('closing netz socket')
-    sock.close()
\ No newline at end of file
+def close_netz_signalling():
+    global _netz_signalling
+    if _netz_signalling is not None:
+        _netz_signalling.close()
+        _netz_signalling = None